@@ -1,9 +1,9 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
 import os
 
-from distutils.core import setup
+from setuptools import setup
 from glob import glob
 
 setup(name='wp-download',
@@ -16,6 +16,7 @@ setup(name='wp-download',
       scripts=['scripts/wp-download'],
       long_description = open('doc/description.rst').read(),
       packages=['wp_download'],
+      python_requires='>=3.7',
       data_files=[
           ('share/doc/wp-download/examples/', ['examples/wpdownloadrc.sample']),
           ('share/doc/wp-download/doc', ['doc/Makefile','doc/README']),
@@ -30,8 +31,8 @@ setup(name='wp-download',
           'Intended Audience :: System Administrators',
           'License :: OSI Approved :: GNU General Public License (GPL)',
           'Operating System :: OS Independent',
-          'Programming Language :: Python :: 2 :: Only',
-          'Programming Language :: Python :: 2.7',
+          'Programming Language :: Python :: 3 :: Only',
+          'Programming Language :: Python :: 3',
           'Topic :: Database',
           'Topic :: Scientific/Engineering',
       ]
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+"""Benchmark of the streaming download path.
+
+Downloads a file from a local HTTP server with WPDownloader.retrieve, whose
+buffers are filled with readinto() and written behind, and with the loop of
+synchronous 8 KB read() and write() calls the Python 2 version used. Run it
+from the top directory:
+
+    $ python3 test/benchmark_download.py --size 512 --runs 5
+"""
+
+import argparse
+import http.server
+import os
+import shutil
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+from contextlib import closing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import wp_download.cli as wpd_cli
+import wp_download.download as wpd_down
+
+CONFIG = os.path.join(os.path.dirname(__file__), 'data',
+                      'enabled_options.cfg')
+
+# Block size of the read() and write() loop of the Python 2 version
+BLOCK_SIZE = 8 * 1024
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """Serves the content of the server"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.server.content)))
+        self.end_headers()
+
+    def do_GET(self):
+        self.do_HEAD()
+        view = memoryview(self.server.content)
+        for offset in range(0, len(view), 1024 * 1024):
+            self.wfile.write(view[offset:offset + 1024 * 1024])
+
+
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+
+    daemon_threads = True
+
+
+def read_write(url, path):
+    """Copy with synchronous read() and write() calls of BLOCK_SIZE"""
+
+    with closing(urllib.request.urlopen(url)) as remote_file:
+        with open(path, 'wb') as local_file:
+            for block in iter(lambda: remote_file.read(BLOCK_SIZE), b''):
+                local_file.write(block)
+
+
+def best_rate(retrieve, url, path, size, runs):
+    """Get the best rate of several runs in MB/s"""
+
+    best = 0.0
+    for _ in range(runs):
+        if os.path.exists(path):
+            os.remove(path)
+        start = time.time()
+        retrieve(url, path)
+        elapsed = time.time() - start
+        assert os.path.getsize(path) == size
+        best = max(best, size / elapsed / 1024 / 1024)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=256,
+                        help='Size of the file in MB [default: %(default)s]')
+    parser.add_argument('--runs', type=int, default=3,
+                        help='Number of runs [default: %(default)s]')
+    args = parser.parse_args()
+
+    server = Server(('127.0.0.1', 0), Handler)
+    server.content = os.urandom(args.size * 1024 * 1024)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        url = 'http://127.0.0.1:%d/file' % (server.server_port)
+        path = os.path.join(tmp_dir, 'file.part')
+        downloader = wpd_down.WPDownloader(wpd_cli.parse_args(
+            ['-q', '-c', CONFIG, tmp_dir]))
+
+        for name, retrieve in [('8 KB read/write', read_write),
+                               ('readinto()', downloader.retrieve)]:
+            print('%-16s %8.1f MB/s' % (name, best_rate(
+                retrieve, url, path, len(server.content), args.runs)))
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
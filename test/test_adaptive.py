@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+
+import os.path
+import shutil
+import tempfile
+
+import wp_download.adaptive as wpd_adapt
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+class TestConcurrencyController(object):
+
+    def setup_method(self):
+        self.clock = FakeClock()
+        self.orig_time = wpd_adapt.time
+        wpd_adapt.time = self.clock
+        self.tmp_dir = tempfile.mkdtemp()
+        self.state_file = os.path.join(self.tmp_dir, 'concurrency.json')
+
+    def teardown_method(self):
+        wpd_adapt.time = self.orig_time
+        shutil.rmtree(self.tmp_dir)
+
+    def controller(self, **kw):
+        return wpd_adapt.ConcurrencyController(
+            'dumps.example.org', maximum=4, interval=10,
+            state_file=self.state_file, **kw)
+
+    def interval(self, controller, rate, errors=0):
+        """Run a measurement interval with all slots in use"""
+        while controller.stats()['active'] < controller.limit:
+            controller.acquire()
+        for _ in range(errors):
+            controller.record_error()
+        self.clock.now += 10
+        controller.record(rate * 10)
+
+    def test_increase(self):
+        """ConcurrencyController: Add streams while throughput improves"""
+        controller = self.controller()
+        self.interval(controller, 100)
+        assert controller.limit == 2
+        self.interval(controller, 200)
+        assert controller.limit == 3
+        assert controller.optimum == 2
+
+    def test_plateau(self):
+        """ConcurrencyController: Keep limit if more streams do not help"""
+        controller = self.controller()
+        self.interval(controller, 100)
+        self.interval(controller, 200)
+        self.interval(controller, 201)
+        assert controller.limit == 2
+        self.interval(controller, 200)
+        assert controller.limit == 2
+
+    def test_errors(self):
+        """ConcurrencyController: Halve limit on errors"""
+        controller = self.controller(initial=4)
+        self.interval(controller, 100, errors=1)
+        assert controller.limit == 2
+        assert controller.optimum == 2
+
+    def test_learned(self):
+        """ConcurrencyController: Optimum is remembered per host"""
+        controller = self.controller(initial=3)
+        controller.save()
+        assert self.controller().limit == 3
@@ -18,10 +18,10 @@
 
 import os.path
 
-from nose.tools import raises, eq_
+import pytest
 
 import wp_download.config as wpd_conf
-import wp_download.error as wpd_err
+import wp_download.exceptions as wpd_err
 
 PREFIX = os.path.join(*os.path.split(os.path.dirname(__file__))[:-1])
 TEST_DATA_DIR = os.path.join(PREFIX, 'test', 'data')
@@ -36,7 +36,7 @@ class FakeOptions(object):
 
 class TestExampleConfiguration(object):
 
-    def setup(self):
+    def setup_method(self):
         options = FakeOptions()
         options.config = os.path.join(PREFIX, 'examples',
                                       'wpdownloadrc.sample')
@@ -53,48 +53,48 @@ class TestExampleConfiguration(object):
             ft = self.config.get('Filetypes', f)
             assert ft in ['xml.bz2', 'sql.gz'], 'Filetype: %s' % (ft)
 
-@raises(wpd_err.ConfigParseError)
 def test_parse_error():
     """Configuration: Incomplete section headers -> ConfigParseError"""
-    config = wpd_conf.Configuration(options_config('err_parse.cfg'))
+    with pytest.raises(wpd_err.ConfigParseError):
+        config = wpd_conf.Configuration(options_config('err_parse.cfg'))
 
 def test_enabled_files():
     """Configuration.enabled_files: Check expected values"""
     config = wpd_conf.Configuration(options_config('enabled_options.cfg'))
-    eq_(list(config.enabled_files()), ['langlinks', 'pages-articles',
-                                       'redirect'])
+    assert list(config.enabled_files()) == ['langlinks', 'pages-articles',
+                                            'redirect']
 
-@raises(wpd_err.ConfigParseError)
 def test_ef_section_parse_error():
     """Configuration.enabled_files: Syntax errors -> ConfigParseError"""
-    config = wpd_conf.Configuration(options_config('err_syntax.cfg'))
-    files = list(config.enabled_files())
+    with pytest.raises(wpd_err.ConfigParseError):
+        config = wpd_conf.Configuration(options_config('err_syntax.cfg'))
+        files = list(config.enabled_files())
 
-@raises(wpd_err.ConfigValueError)
 def test_ef_section_value_error():
     """Configuration.enabled_files: Unexpected values -> ConfigValueError"""
-    config = wpd_conf.Configuration(options_config('err_values.cfg'))
-    files = list(config.enabled_files())
+    with pytest.raises(wpd_err.ConfigValueError):
+        config = wpd_conf.Configuration(options_config('err_values.cfg'))
+        files = list(config.enabled_files())
 
 def test_enabled_languages():
     """Configuration.enabled_languages: Check expected values"""
     config = wpd_conf.Configuration(options_config('enabled_options.cfg'))
-    eq_(list(config.enabled_languages()), ['tum', 'zh', 'zh_yue', 'zu'])
+    assert list(config.enabled_languages()) == ['tum', 'zh', 'zh_yue', 'zu']
 
-@raises(wpd_err.ConfigParseError)
 def test_el_section_parse_error():
     """Configuration.enabled_languages: Syntax errors -> ConfigParseError"""
-    config = wpd_conf.Configuration(options_config('err_syntax.cfg'))
-    files = list(config.enabled_languages())
+    with pytest.raises(wpd_err.ConfigParseError):
+        config = wpd_conf.Configuration(options_config('err_syntax.cfg'))
+        files = list(config.enabled_languages())
 
-@raises(wpd_err.ConfigValueError)
 def test_el_section_value_error():
     """Configuration.enabled_languages: Unexpected values -> ConfigValueError"""
-    config = wpd_conf.Configuration(options_config('err_values.cfg'))
-    files = list(config.enabled_languages())
+    with pytest.raises(wpd_err.ConfigValueError):
+        config = wpd_conf.Configuration(options_config('err_values.cfg'))
+        files = list(config.enabled_languages())
 
-@raises(wpd_err.TemplateMissingError)
 def test_template_missing():
     """Configuration.string_template: Missing templates -> TemplateMissingError"""
-    config = wpd_conf.Configuration(options_config('err_values.cfg'))
-    template = config.string_template('no_such_template')
+    with pytest.raises(wpd_err.TemplateMissingError):
+        config = wpd_conf.Configuration(options_config('err_values.cfg'))
+        template = config.string_template('no_such_template')
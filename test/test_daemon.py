@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os.path
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import wp_download.daemon as wpd_daemon
+import wp_download.schedule as wpd_sched
+
+FILES = ['pages-articles', 'redirect']
+
+class FakeDownloader(object):
+    """Downloader that writes the URL of each transfer to its path"""
+
+    def __init__(self):
+        self.dates = {}
+        self.unavailable = set()
+
+    def languages(self):
+        return ['de', 'en']
+
+    def throughput(self):
+        return None
+
+    def transfers_for_language(self, language, path, date=None):
+        self.dates[language] = date
+        if language in self.unavailable:
+            raise IOError('No dump for ' + language)
+        return [wpd_sched.Transfer(language, name, 'http://localhost/' + name,
+                                   os.path.join(path, language + name))
+                for name in FILES]
+
+    def download_transfers(self, transfers, hook=None):
+        for transfer in transfers:
+            if hook:
+                hook(transfer)
+            with open(transfer.path, 'w') as local_file:
+                local_file.write(transfer.url)
+
+def wait_for(predicate):
+    for _ in range(500):
+        if predicate():
+            return
+        time.sleep(0.01)
+    assert False, 'Timeout'
+
+class TestDaemon(object):
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.downloader = FakeDownloader()
+        self.daemon = wpd_daemon.Daemon(self.downloader, self.tmp_dir)
+        self.server = wpd_daemon.ControlServer(('127.0.0.1', 0), self.daemon)
+        self.url = 'http://127.0.0.1:%d' % (self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def teardown_method(self):
+        self.daemon.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp_dir)
+
+    def request(self, path, content=None):
+        data = (json.dumps(content).encode('utf-8')
+                if content is not None else None)
+        return json.loads(urllib.request.urlopen(self.url + path, data).read())
+
+    def test_submit(self):
+        """Daemon: Submitted jobs are run"""
+        job = self.request('/jobs', {'languages': ['en'],
+                                     'files': ['redirect']})
+        assert job['state'] == 'queued'
+        self.daemon.start()
+        wait_for(lambda: self.request('/jobs/1')['state'] == 'done')
+
+        job = self.request('/jobs/1')
+        assert (job['transfers'], job['complete']) == (1, 1)
+        assert os.listdir(self.tmp_dir) == ['enredirect']
+
+    def test_custom_dump(self):
+        """Daemon: Custom dump dates are passed to the downloader"""
+        self.request('/jobs', {'custom_dump': ['de:20150603']})
+        self.daemon.start()
+        wait_for(lambda: self.request('/status')['jobs'] == {'done': 1})
+        assert self.downloader.dates['de'].strftime('%Y%m%d') == '20150603'
+        assert self.request('/jobs')[0]['languages'] == ['de']
+
+    def test_pause(self):
+        """Daemon: Paused jobs are not started until resumed"""
+        self.request('/jobs', {})
+        assert self.request('/jobs/1/pause', {})['state'] == 'paused'
+        self.daemon.start()
+        time.sleep(0.1)
+        assert os.listdir(self.tmp_dir) == []
+
+        self.request('/jobs/1/resume', {})
+        wait_for(lambda: self.request('/jobs/1')['state'] == 'done')
+        assert self.request('/jobs/1')['complete'] == 4
+
+    def test_errors(self):
+        """Daemon: Unknown jobs and invalid requests"""
+        for path, content in [('/jobs/42', None),
+                              ('/jobs', {'custom_dump': ['de:2015']}),
+                              ('/jobs', {'languages': 'de'}),
+                              ('/jobs', {'files': [1]}),
+                              ('/jobs', {'custom_dump': 'de:20150603'}),
+                              ('/jobs', ['de'])]:
+            try:
+                self.request(path, content)
+            except urllib.error.HTTPError as http_err:
+                assert http_err.code in (400, 404)
+            else:
+                assert False, 'Expected an error for %s' % (path)
+        assert self.request('/jobs') == []
+
+    def test_failed(self):
+        """Daemon: Jobs without any planned file fail"""
+        self.downloader.unavailable.add('de')
+        self.request('/jobs', {'languages': ['de']})
+        self.request('/jobs', {'languages': ['de', 'en']})
+        self.daemon.start()
+        wait_for(lambda: self.request('/jobs/2')['state'] == 'done')
+
+        failed = self.request('/jobs/1')
+        assert failed['state'] == 'failed'
+        assert failed['errors'] == ['de: No dump for de',
+                                    'No files to download']
+        done = self.request('/jobs/2')
+        assert done['errors'] == ['de: No dump for de']
+        assert done['complete'] == 2
+
+    def test_keep_jobs(self):
+        """Daemon: Only the last finished jobs are kept"""
+        daemon = wpd_daemon.Daemon(self.downloader, self.tmp_dir, 2)
+        for _ in range(3):
+            daemon.submit(['en'])
+        # Queued jobs are never forgotten
+        assert [job.id for job in daemon.jobs()] == [1, 2, 3]
+        daemon.start()
+        try:
+            wait_for(lambda: daemon.status()['jobs'] == {'done': 2})
+        finally:
+            daemon.stop()
+        assert [job.id for job in daemon.jobs()] == [2, 3]
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import pytest
+
+import wp_download.cli as wpd_cli
+import wp_download.delta as wpd_delta
+
+CONTENT = bytes(i % 251 for i in range(10000))
+
+TMP_DIR = None
+
+
+def setup_function(function):
+    global TMP_DIR
+    TMP_DIR = tempfile.mkdtemp()
+
+
+def teardown_function(function):
+    shutil.rmtree(TMP_DIR)
+
+
+def write(name, content):
+    path = os.path.join(TMP_DIR, name)
+    with open(path, 'wb') as local_file:
+        local_file.write(content)
+    return path
+
+
+def test_make_manifest():
+    """delta.make_manifest: Blocks and file are hashed"""
+    manifest = wpd_delta.make_manifest(write('file', CONTENT), 4096)
+    assert manifest['size'] == len(CONTENT)
+    assert manifest['md5'] == hashlib.md5(CONTENT).hexdigest()
+    assert manifest['blocks'] == [
+        hashlib.md5(CONTENT[offset:offset + 4096]).hexdigest()
+        for offset in (0, 4096, 8192)]
+
+
+def test_write_manifest():
+    """delta.write_manifest: The manifest is written next to the file"""
+    path = write('file', CONTENT)
+    manifest_path = wpd_delta.write_manifest(path, 4096)
+    assert manifest_path == path + '.blocks'
+    with open(manifest_path) as manifest_file:
+        assert wpd_delta.parse_manifest(manifest_file.read()) == (
+            wpd_delta.make_manifest(path, 4096))
+
+
+def test_parse_manifest_invalid():
+    """delta.parse_manifest: Invalid manifests raise ValueError"""
+    with pytest.raises(ValueError):
+        wpd_delta.parse_manifest('no json')
+    with pytest.raises(ValueError):
+        wpd_delta.parse_manifest('{"size": 10}')
+    with pytest.raises(ValueError):
+        wpd_delta.parse_manifest(json.dumps(
+            {'size': 10000, 'block_size': 4096, 'md5': '', 'blocks': []}))
+
+
+def test_plan_blocks():
+    """delta.plan_blocks: Known blocks are copied, others fetched"""
+    old = bytearray(CONTENT[:9000])
+    old[5000] ^= 0xff
+    manifest = wpd_delta.make_manifest(write('new', CONTENT), 2048)
+    index = wpd_delta.index_blocks(write('old', bytes(old)), 2048)
+    # Changed block and the blocks missing from the end are fetched
+    assert wpd_delta.plan_blocks(manifest, index) == [
+        (0, 2048, 0), (2048, 2048, 2048), (4096, 2048, None),
+        (6144, 2048, 6144), (8192, 1808, None)]
+
+
+def test_plan_blocks_merged():
+    """delta.plan_blocks: Adjacent fetched blocks are one range"""
+    manifest = wpd_delta.make_manifest(write('new', CONTENT), 2048)
+    index = wpd_delta.index_blocks(write('old', CONTENT[:2048]), 2048)
+    assert wpd_delta.plan_blocks(manifest, index) == [
+        (0, 2048, 0), (2048, 7952, None)]
+
+
+def test_manifest_command():
+    """cli.manifest: Manifests are written for dump files only"""
+    dump_dir = os.path.join(TMP_DIR, 'en', '20240101')
+    os.makedirs(dump_dir)
+    for name in ('dump.sql.gz', 'dump.xml.bz2.part', '.wpd-dump'):
+        with open(os.path.join(dump_dir, name), 'wb') as local_file:
+            local_file.write(CONTENT)
+
+    assert wpd_cli.main(['-q', 'manifest', '--block-size', '4',
+                         TMP_DIR]) == 0
+    assert sorted(os.listdir(dump_dir)) == [
+        '.wpd-dump', 'dump.sql.gz', 'dump.sql.gz.blocks',
+        'dump.xml.bz2.part']
+    with open(os.path.join(dump_dir, 'dump.sql.gz.blocks')) as manifest:
+        assert json.load(manifest)['block_size'] == 4096
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+
+import os.path
+import shutil
+import tempfile
+import urllib.request
+
+import pytest
+
+import wp_download.config as wpd_conf
+import wp_download.discovery as wpd_disc
+
+BACKUP_INDEX = """
+<ul>
+<li>2015-06-04 02:03:04 <a href="enwiki/20150602">enwiki</a>: Dump complete</li>
+<li>2015-06-04 02:03:04 <a href="dewiktionary/20150601">dewiktionary</a>: Dump complete</li>
+<li>2015-06-03 01:02:03 <a href="zh_yuewiki/20150530">zh_yuewiki</a>: Dump complete</li>
+<li>2015-06-03 01:02:03 <a href="testwiki/20150530">testwiki</a>: Dump complete</li>
+</ul>
+"""
+
+class FakeOptions(object):
+    pass
+
+def test_split_dbname():
+    """split_dbname: Language code and project of database names"""
+    assert wpd_disc.split_dbname('enwiki') == ('en', 'wiki')
+    assert wpd_disc.split_dbname('dewiktionary') == ('de', 'wiktionary')
+    assert wpd_disc.split_dbname('zh_yuewiki') == ('zh_yue', 'wiki')
+
+def test_wiki_key():
+    """wiki_key/split_key: Wikipedias are identified by language code"""
+    assert wpd_disc.wiki_key('enwiki') == 'en'
+    assert wpd_disc.wiki_key('dewiktionary') == 'dewiktionary'
+    assert wpd_disc.split_key('en') == ('en', 'wiki')
+    assert wpd_disc.split_key('wikidata') == ('wikidata', 'wiki')
+    assert wpd_disc.split_key('dewiktionary') == ('de', 'wiktionary')
+
+def test_parse_wiki_list():
+    """parse_wiki_list: HTML index and plain lists"""
+    assert (wpd_disc.parse_wiki_list(BACKUP_INDEX) ==
+            ['dewiktionary', 'enwiki', 'testwiki', 'zh_yuewiki'])
+    assert (wpd_disc.parse_wiki_list('# comment\nenwiki\n\ndewiki\n') ==
+            ['dewiki', 'enwiki'])
+
+class TestWikiList(object):
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        index = os.path.join(self.tmp_dir, 'index.html')
+        with open(index, 'w') as index_file:
+            index_file.write(BACKUP_INDEX)
+
+        config_path = os.path.join(self.tmp_dir, 'wpdownloadrc')
+        with open(config_path, 'w') as config_file:
+            config_file.write('[Configuration]\ncache_dir = %s\n'
+                              '[Discovery]\nindex_url = %s\n'
+                              'include = *wiki *wiktionary\n'
+                              'exclude = test*\n' % (self.tmp_dir, index))
+        options = FakeOptions()
+        options.config = config_path
+        self.config = wpd_conf.Configuration(options)
+
+    def teardown_method(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_keys(self):
+        """WikiList.keys: Include and exclude patterns"""
+        assert (wpd_disc.WikiList(self.config).keys() ==
+                ['dewiktionary', 'en', 'zh_yue'])
+
+    def test_cache(self):
+        """WikiList.dbnames: The list is cached"""
+        wpd_disc.WikiList(self.config).dbnames()
+        os.remove(os.path.join(self.tmp_dir, 'index.html'))
+        assert len(wpd_disc.WikiList(self.config).dbnames()) == 4
+
+    def test_offline_not_cached(self):
+        """WikiList.dbnames: Offline mode without cached list fails"""
+        self.config.set('Discovery', 'index_url',
+                        'http://127.0.0.1:1/backup-index.html')
+        requests = []
+        urlopen = urllib.request.urlopen
+        urllib.request.urlopen = lambda url, *args, **kw: (
+            requests.append(url) or urlopen(url, *args, **kw))
+        try:
+            with pytest.raises(IOError):
+                wpd_disc.WikiList(self.config, offline=True).dbnames()
+        finally:
+            urllib.request.urlopen = urlopen
+        assert requests == []
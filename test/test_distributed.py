@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import wp_download.distributed as wpd_dist
+import wp_download.schedule as wpd_sched
+
+LANGUAGES = ['de', 'en', 'fr', 'sw']
+FILES = ['pages-articles', 'redirect', 'page']
+
+class FakeDownloader(object):
+    """Downloader that appends the worker pid to the file"""
+
+    def download_transfer(self, transfer, part_suffix='.part', proceed=None):
+        time.sleep(0.01)
+        with open(transfer.path, 'a') as local_file:
+            local_file.write('%d\n' % (os.getpid()))
+        return True
+
+    def publish(self, down_dir):
+        return None
+
+class StolenLeaseDownloader(FakeDownloader):
+    """Downloader whose lease is taken over by another worker"""
+
+    def __init__(self, store):
+        self.store = store
+        self.calls = []
+
+    def download_transfer(self, transfer, part_suffix='.part', proceed=None):
+        self.calls.append(part_suffix)
+        self.store.fail(transfer.key, 'host:1', 'error')
+        self.store.lease('other')
+        deadline = time.time() + 5
+        while proceed() and time.time() < deadline:
+            time.sleep(0.01)
+        return not proceed()
+
+class BrokenDownloader(FakeDownloader):
+    """Downloader that raises for the pages-articles files"""
+
+    def download_transfer(self, transfer, part_suffix='.part', proceed=None):
+        if transfer.filename == 'pages-articles':
+            raise IOError('Connection refused')
+        return FakeDownloader.download_transfer(self, transfer, part_suffix,
+                                                proceed)
+
+def run_worker(db_path, path):
+    store = wpd_dist.LeaseStore(db_path, lease_time=5)
+    wpd_dist.Worker(store, FakeDownloader(), path, poll_interval=0.1).run()
+
+class TestDistributed(object):
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, 'units.db')
+        self.path = os.path.join(self.tmp_dir, 'dumps')
+        self.transfers = [
+            wpd_sched.Transfer(
+                lang, name, 'http://localhost/%s/%s' % (lang, name),
+                os.path.join(self.path, lang, '20150603', name))
+            for lang in LANGUAGES for name in FILES]
+
+    def teardown_method(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_add(self):
+        """LeaseStore.add: Units are only added once"""
+        store = wpd_dist.LeaseStore(self.db_path)
+        assert store.add(self.transfers, self.path) == 12
+        assert store.add(self.transfers, self.path) == 0
+        assert store.summary() == {'pending': 12}
+
+    def test_lease_expiry(self):
+        """LeaseStore.lease: Expired leases are handed out again"""
+        store = wpd_dist.LeaseStore(self.db_path, lease_time=0.05)
+        store.add(self.transfers[:1], self.path)
+
+        assert store.lease('a')['key'] == 'de/pages-articles'
+        assert store.lease('b') is None
+        time.sleep(0.1)
+        unit = store.lease('b')
+        assert (unit['worker'], unit['attempts']) == ('b', 2)
+        assert not store.heartbeat(unit['key'], 'a')
+        assert store.heartbeat(unit['key'], 'b')
+
+    def test_fail(self):
+        """LeaseStore.fail: Units fail after max_attempts"""
+        store = wpd_dist.LeaseStore(self.db_path, max_attempts=2)
+        store.add(self.transfers[:1], self.path)
+        for attempt in range(2):
+            store.fail(store.lease('a')['key'], 'a', 'error')
+        assert store.summary() == {'failed': 1}
+        assert store.lease('a') is None
+
+    def test_complete_lost_lease(self):
+        """LeaseStore.complete: Units are only completed by the holder"""
+        store = wpd_dist.LeaseStore(self.db_path, lease_time=0.05)
+        store.add(self.transfers[:1], self.path)
+        key = store.lease('a')['key']
+        time.sleep(0.1)
+        store.lease('b')
+        assert not store.complete(key, 'a')
+        assert store.complete(key, 'b')
+        assert store.summary() == {'done': 1}
+
+    def test_lost_lease(self):
+        """Worker: Transfers are given up once the lease is lost"""
+        store = wpd_dist.LeaseStore(self.db_path, lease_time=0.3)
+        store.add(self.transfers[:1], self.path)
+        downloader = StolenLeaseDownloader(store)
+        worker = wpd_dist.Worker(store, downloader, self.path, 'host:1')
+        worker.process(store.lease(worker.worker_id))
+        assert downloader.calls == ['.host_1.part']
+        assert store.summary() == {'leased': 1}
+        assert not os.path.exists(self.transfers[0].path)
+
+    def test_transfer_error(self):
+        """Worker: Units whose transfer raises fail, the others are done"""
+        store = wpd_dist.LeaseStore(self.db_path, max_attempts=1)
+        store.add(self.transfers, self.path)
+        wpd_dist.Worker(store, BrokenDownloader(), self.path).run()
+        assert store.summary() == {'done': 8, 'failed': 4}
+
+    def test_workers(self):
+        """Worker: Several processes download every unit exactly once"""
+        wpd_dist.LeaseStore(self.db_path).add(self.transfers, self.path)
+
+        workers = [multiprocessing.Process(target=run_worker,
+                                           args=(self.db_path, self.path))
+                   for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(30)
+            assert worker.exitcode == 0
+
+        assert wpd_dist.LeaseStore(self.db_path).summary() == {'done': 12}
+        for transfer in self.transfers:
+            with open(transfer.path) as local_file:
+                assert len(local_file.readlines()) == 1
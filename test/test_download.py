@@ -0,0 +1,570 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+import gzip
+import hashlib
+import http.server
+import json
+import os.path
+import re
+import shutil
+import tempfile
+import threading
+
+import pytest
+
+import wp_download.api as wpd_api
+import wp_download.cli as wpd_cli
+import wp_download.delta as wpd_delta
+import wp_download.download as wpd_down
+import wp_download.exceptions as wpd_exc
+import wp_download.publish as wpd_publish
+
+TMP_FILE = os.path.join(tempfile.gettempdir(), 'wpd-test.part')
+
+CONFIG = os.path.join(os.path.dirname(__file__), 'data',
+                      'enabled_options.cfg')
+CONTENT = bytes(i % 251 for i in range(300000))
+
+LANGLINKS = (
+    b"CREATE TABLE `langlinks` (\n"
+    b"  `ll_from` int(8) unsigned NOT NULL DEFAULT '0',\n"
+    b"  `ll_lang` varbinary(20) NOT NULL DEFAULT '',\n"
+    b"  `ll_title` varbinary(255) NOT NULL DEFAULT '',\n"
+    b"  PRIMARY KEY (`ll_from`,`ll_lang`)\n"
+    b") ENGINE=InnoDB DEFAULT CHARSET=binary;\n"
+    b"INSERT INTO `langlinks` VALUES (1,'de','Haus'),(1,'fr','Maison'),"
+    b"(2,'en','Tree');\n")
+
+def write_config(tmp_dir, extra='', base_url=None):
+    """Write CONFIG with extra sections to tmp_dir, get its path
+
+    The cache is kept in tmp_dir.
+    """
+    path = os.path.join(tmp_dir, 'wpdownloadrc')
+    with open(CONFIG) as orig:
+        content = orig.read().replace('[Configuration]\n', (
+            '[Configuration]\ncache_dir = %s\n' % (
+                os.path.join(tmp_dir, 'cache'))), 1)
+    if base_url:
+        content = re.sub(r'(?m)^base_url = .*$', 'base_url = ' + base_url,
+                         content)
+    with open(path, 'w') as config_file:
+        config_file.write(content + '\n' + extra)
+    return path
+
+def available():
+    return wpd_down.free_space(tempfile.gettempdir())[1]
+
+def test_reserve_too_large():
+    """SpaceReservations.reserve: Files larger than free space are rejected"""
+    with pytest.raises(wpd_exc.InsufficientSpaceError):
+        wpd_down.SpaceReservations().reserve(TMP_FILE, available() + 1)
+
+def test_reserve_min_free():
+    """SpaceReservations.reserve: min_free is kept free"""
+    with pytest.raises(wpd_exc.InsufficientSpaceError):
+        reservations = wpd_down.SpaceReservations(min_free=available())
+        reservations.reserve(TMP_FILE, 1)
+
+def test_reserve_accounts_running_transfers():
+    """SpaceReservations.reserve: Running transfers reduce available space"""
+    reservations = wpd_down.SpaceReservations()
+    half = available() // 2 + 1
+    first = reservations.reserve(TMP_FILE, half)
+
+    try:
+        reservations.reserve(TMP_FILE, half)
+    except wpd_exc.InsufficientSpaceError:
+        pass
+    else:
+        assert False, 'Second reservation should have been rejected'
+
+    first.consume(half)
+    assert first.remaining == 0
+    reservations.reserve(TMP_FILE, half).release()
+    first.release()
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    """Serves CONTENT, with range requests if the server supports them"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.reply(body=False)
+
+    def do_GET(self):
+        if self.path.endswith('.blocks'):
+            return self.reply_manifest()
+        if self.path.endswith('md5sums.txt'):
+            return self.reply_body(self.server.md5sums.encode('utf-8'))
+        self.server.requests.append(self.headers.get('Range'))
+        self.reply()
+
+    def reply(self, body=True):
+        content = self.server.content
+        start, end = 0, len(content) - 1
+        match = re.match(r'^bytes=(\d+)-(\d*)$',
+                         self.headers.get('Range', ''))
+        if match and self.server.ranges:
+            start = int(match.group(1))
+            end = int(match.group(2) or end)
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (
+                start, end, len(content)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(end + 1 - start))
+        self.end_headers()
+        if body:
+            self.wfile.write(content[start:end + 1])
+
+    def reply_manifest(self):
+        if self.server.manifest is None:
+            return self.send_error(404)
+        self.reply_body(json.dumps(self.server.manifest).encode('utf-8'))
+
+    def reply_body(self, body):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class ServerTest(object):
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'file.part')
+        self.server = http.server.HTTPServer(('127.0.0.1', 0), RangeHandler)
+        self.server.ranges = True
+        self.server.content = CONTENT
+        self.server.requests = []
+        self.server.manifest = None
+        self.server.md5sums = ''
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/file' % (self.server.server_port)
+
+    def teardown_method(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp_dir)
+
+class TestRetrieve(ServerTest):
+
+    def retrieve(self, partial=None):
+        if partial is not None:
+            with open(self.path, 'wb') as part_file:
+                part_file.write(partial)
+        downloader = wpd_down.WPDownloader(wpd_cli.parse_args(
+            ['-q', '-c', CONFIG, '--resume', self.tmp_dir]))
+        downloader.retrieve(self.url, self.path)
+        with open(self.path, 'rb') as local_file:
+            return local_file.read()
+
+    def test_retrieve(self):
+        """WPDownloader.retrieve: Content is streamed to the file"""
+        assert self.retrieve() == CONTENT
+        assert self.server.requests == [None]
+
+    def test_resume(self):
+        """WPDownloader.retrieve: Partial files are resumed with a range"""
+        assert self.retrieve(CONTENT[:1000]) == CONTENT
+        assert self.server.requests == ['bytes=1000-']
+
+    def test_resume_range_ignored(self):
+        """WPDownloader.retrieve: Restart if the server ignores the range"""
+        self.server.ranges = False
+        assert self.retrieve(CONTENT[:1000]) == CONTENT
+
+    def test_retrieve_file_aborted(self):
+        """WPDownloader.retrieve_file: Given up transfers leave no file"""
+        downloader = wpd_down.WPDownloader(wpd_cli.parse_args(
+            ['-q', '-c', CONFIG, self.tmp_dir]))
+        with pytest.raises(wpd_exc.TransferAbortedError):
+            downloader.retrieve_file(self.url, self.path[:-5],
+                                     part_suffix='.w1.part',
+                                     proceed=lambda: False)
+        assert os.listdir(self.tmp_dir) == []
+        assert len(self.server.requests) == 1
+
+    def test_resume_complete(self):
+        """WPDownloader.retrieve: Complete partial files are not requested"""
+        assert self.retrieve(CONTENT) == CONTENT
+        assert self.server.requests == []
+
+class TestResults(ServerTest):
+
+    def setup_method(self):
+        ServerTest.setup_method(self)
+        self.options = wpd_api.DownloadOptions(
+            config=CONFIG, resume=True, checksum=True)
+        self.calls = []
+
+    def retrieve_url(self, partial=None):
+        if partial is not None:
+            with open(self.path, 'wb') as part_file:
+                part_file.write(partial)
+        downloader = wpd_down.WPDownloader(
+            self.options, lambda result, read: self.calls.append(read))
+        return downloader._retrieve_url(self.url, self.path[:-5])
+
+    def test_result(self):
+        """WPDownloader._retrieve_url: Transfers are described by results"""
+        result = self.retrieve_url()
+        assert result.complete
+        assert not result.skipped and not result.resumed
+        assert result.size == result.received == len(CONTENT)
+        assert result.checksum == hashlib.md5(CONTENT).hexdigest()
+        assert self.calls[-1] == len(CONTENT)
+
+    def test_result_resumed(self):
+        """WPDownloader._retrieve_url: The checksum covers resumed files"""
+        result = self.retrieve_url(CONTENT[:1000])
+        assert result.resumed
+        assert result.received == len(CONTENT) - 1000
+        assert result.checksum == hashlib.md5(CONTENT).hexdigest()
+
+    def test_result_skipped(self):
+        """WPDownloader._retrieve_url: Complete files are skipped"""
+        self.retrieve_url()
+        result = self.retrieve_url()
+        assert result.skipped
+        assert result.received == 0
+        assert result.checksum == hashlib.md5(CONTENT).hexdigest()
+
+    def test_result_error(self):
+        """WPDownloader._retrieve_url: Failed transfers carry the error"""
+        self.options.retries = 1
+        self.server.shutdown()
+        self.server.server_close()
+        result = self.retrieve_url()
+        assert not result.complete
+        assert result.error
+
+    def test_result_sizes_forgotten(self):
+        """WPDownloader._retrieve_url: Sizes are not kept after a transfer"""
+        downloader = wpd_down.WPDownloader(self.options)
+        result = downloader._retrieve_url(self.url, self.path[:-5])
+        assert result.size == len(CONTENT)
+        assert downloader._content_lengths == {}
+
+    def test_result_head_error(self):
+        """WPDownloader._retrieve_url: Failed size requests carry the error"""
+        with open(self.path[:-5], 'wb') as local_file:
+            local_file.write(CONTENT[:1000])
+        self.server.shutdown()
+        self.server.server_close()
+        result = wpd_down.WPDownloader(self.options)._retrieve_url(
+            self.url, self.path[:-5])
+        assert not result.complete and not result.skipped
+        assert result.error
+
+class TestFilter(ServerTest):
+
+    def setup_method(self):
+        ServerTest.setup_method(self)
+        self.server.content = gzip.compress(LANGLINKS)
+        self.downloader = wpd_down.WPDownloader(wpd_api.DownloadOptions(
+            config=write_config(
+                self.tmp_dir, '[Filters]\nlanglinks = ll_lang=de,en\n',
+                'http://127.0.0.1:%d' % (self.server.server_port)),
+            custom_dump=['zu:20150603']))
+
+    def download(self):
+        transfers = self.downloader.transfers_for_language(
+            'zu', self.tmp_dir, datetime.datetime(2015, 6, 3))[:1]
+        results = []
+        self.downloader.download_transfers(transfers,
+                                           result_hook=results.append)
+        return results[0]
+
+    def test_filtered(self):
+        """WPDownloader.retrieve: Filtered files keep the matching rows"""
+        result = self.download()
+        assert result.complete and not result.skipped
+        assert os.path.basename(result.path) == (
+            'zuwiki-20150603-langlinks.filtered.sql.gz')
+        # Neither the unfiltered dump nor a partial file is left
+        assert sorted(os.listdir(os.path.dirname(result.path))) == [
+            '.wpd-dump', os.path.basename(result.path)]
+        with gzip.open(result.path) as filtered:
+            assert filtered.read() == LANGLINKS.replace(
+                b",(1,'fr','Maison')", b"")
+
+    def test_filtered_skipped(self):
+        """WPDownloader._retrieve_url: Existing filtered files are skipped"""
+        path = self.download().path
+        with open(path, 'rb') as filtered:
+            content = filtered.read()
+        self.server.requests = []
+
+        result = self.download()
+        assert result.skipped and result.path == path
+        assert self.server.requests == []
+        with open(path, 'rb') as filtered:
+            assert filtered.read() == content
+
+class TestDelta(ServerTest):
+
+    def setup_method(self):
+        ServerTest.setup_method(self)
+        self.options = wpd_api.DownloadOptions(
+            config=write_config(self.tmp_dir, '[Delta]\nenabled = True\n'),
+            checksum=True)
+        self.downloader = wpd_down.WPDownloader(self.options)
+
+        # Blocks 1 and 3 changed, block 4 was appended
+        old = bytearray(CONTENT[:200000])
+        old[70000] ^= 0xff
+        self.old_path = self.dump('20240101', bytes(old))
+        self.path = self.dump('20240201')
+        with open(self.path, 'wb') as new_file:
+            new_file.write(CONTENT)
+        self.server.manifest = wpd_delta.make_manifest(self.path, 65536)
+        os.remove(self.path)
+
+    def dump(self, date, content=None):
+        """Create a dump directory, get the path of its first file"""
+        plan = self.downloader.urlhandler.plan
+        date = datetime.datetime.strptime(date, '%Y%m%d')
+        down_dir = os.path.join(self.tmp_dir, plan.local_dir('zu', date))
+        os.makedirs(down_dir)
+        wpd_publish.write_marker(down_dir, 'zu', date,
+                                 plan.local_dir('zu', date))
+        path = os.path.join(down_dir, os.path.basename(
+            plan.urls('zu', date)[0]))
+        if content is not None:
+            with open(path, 'wb') as local_file:
+                local_file.write(content)
+        return path
+
+    def retrieve_url(self):
+        result = wpd_down.FileResult(
+            'zu', self.downloader.urlhandler.plan.files[0].name, self.url,
+            self.path)
+        self.downloader._retrieve_url(self.url, self.path, result)
+        with open(self.path, 'rb') as local_file:
+            assert local_file.read() == CONTENT
+        return result
+
+    def test_delta_aborted(self):
+        """WPDownloader.retrieve: Given up delta transfers fetch no blocks"""
+        result = wpd_down.FileResult(
+            'zu', self.downloader.urlhandler.plan.files[0].name, self.url,
+            self.path)
+        with pytest.raises(wpd_exc.TransferAbortedError):
+            self.downloader.retrieve_file(self.url, self.path, result,
+                                          proceed=lambda: False)
+        assert self.server.requests == []
+        assert os.listdir(os.path.dirname(self.path)) == ['.wpd-dump']
+
+    def test_delta(self):
+        """WPDownloader.retrieve: Only changed blocks are fetched"""
+        result = self.retrieve_url()
+        assert self.server.requests == ['bytes=65536-131071',
+                                        'bytes=196608-299999']
+        assert result.reused == 2 * 65536
+        assert result.received == len(CONTENT) - result.reused
+        assert result.checksum == hashlib.md5(CONTENT).hexdigest()
+
+    def test_delta_no_manifest(self):
+        """WPDownloader.retrieve: Files without manifest are fetched whole"""
+        self.server.manifest = None
+        result = self.retrieve_url()
+        assert self.server.requests == [None]
+        assert result.reused == 0
+
+    def test_delta_no_basis(self):
+        """WPDownloader.retrieve: Files without older copy are fetched
+        whole"""
+        os.remove(self.old_path)
+        self.retrieve_url()
+        assert self.server.requests == [None]
+
+    def test_delta_range_ignored(self):
+        """WPDownloader.retrieve: Fall back if the server ignores ranges"""
+        self.server.ranges = False
+        result = self.retrieve_url()
+        assert self.server.requests == ['bytes=65536-131071', None]
+        assert result.reused == 0
+        assert result.received == len(CONTENT)
+
+class TestPublish(object):
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        config = write_config(self.tmp_dir, '[Publish]\nstaging = True\n'
+                              'verify = False\n')
+        self.downloader = wpd_down.WPDownloader(
+            wpd_api.DownloadOptions(config=config))
+        self.plan = self.downloader.urlhandler.plan
+
+    def teardown_method(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def stage(self, date):
+        """Create a complete staged dump, get its staging directory"""
+        date = datetime.datetime.strptime(date, '%Y%m%d')
+        local_dir = self.plan.local_dir('zu', date)
+        staging = wpd_publish.staging_dir(
+            os.path.join(self.tmp_dir, local_dir))
+        os.makedirs(staging)
+        wpd_publish.write_marker(staging, 'zu', date, local_dir)
+        for name in self.plan.local_names('zu', date):
+            open(os.path.join(staging, name), 'w').close()
+        return staging
+
+    def test_publish_older(self):
+        """WPDownloader.publish: The latest link never goes back in time"""
+        link = os.path.join(self.tmp_dir, self.plan.latest_link('zu'))
+        self.downloader.publish(self.stage('20200201'))
+        assert os.readlink(link) == '20200201'
+
+        final = self.downloader.publish(self.stage('20200101'))
+        assert final == os.path.join(self.tmp_dir, 'zu', '20200101')
+        assert os.readlink(link) == '20200201'
+
+        self.downloader.publish(self.stage('20200301'))
+        assert os.readlink(link) == '20200301'
+
+class TestStaging(ServerTest):
+
+    def setup_method(self):
+        ServerTest.setup_method(self)
+        self.downloader = self.new_downloader()
+        self.plan = self.downloader.urlhandler.plan
+        self.date = datetime.datetime(2015, 6, 3)
+        self.names = self.plan.local_names('zu', self.date)
+        self.final = os.path.join(self.tmp_dir, 'zu', '20150603')
+        self.staging = wpd_publish.staging_dir(self.final)
+        self.md5sums(dict((name, hashlib.md5(CONTENT).hexdigest())
+                          for name in self.names))
+
+    def options(self, peer=None):
+        return wpd_api.DownloadOptions(
+            config=write_config(
+                self.tmp_dir, '[Publish]\nstaging = True\n',
+                'http://127.0.0.1:%d' % (self.server.server_port)),
+            custom_dump=['zu:20150603'], peer=peer or [])
+
+    def new_downloader(self, peer=None):
+        return wpd_down.WPDownloader(self.options(peer))
+
+    def md5sums(self, checksums):
+        self.server.md5sums = ''.join(
+            '%s  %s\n' % (checksum, name)
+            for name, checksum in sorted(checksums.items()))
+
+    def download(self, count=None):
+        transfers = self.downloader.transfers_for_language(
+            'zu', self.tmp_dir, self.date)[:count]
+        results = []
+        self.downloader.download_transfers(transfers,
+                                           result_hook=results.append)
+        return transfers, results
+
+    def test_published(self):
+        """WPDownloader.download_transfers: Complete dumps are published"""
+        transfers, _ = self.download()
+        assert not os.path.exists(self.staging)
+        assert sorted(os.listdir(self.final)) == sorted(
+            ['.wpd-dump', '.wpd-verified', 'zuwiki-20150603-md5sums.txt'] +
+            list(self.names))
+        assert os.readlink(os.path.join(self.tmp_dir, 'zu', 'latest')) == (
+            '20150603')
+        for transfer in transfers:
+            assert os.path.dirname(transfer.path) == self.final
+            with open(transfer.path, 'rb') as local_file:
+                assert local_file.read() == CONTENT
+
+    def test_published_results(self):
+        """api.download: Results of published dumps have their final path"""
+        results = list(wpd_api.download(self.tmp_dir, self.options(), ['zu']))
+        assert sorted(os.path.basename(result.path)
+                      for result in results) == sorted(self.names)
+        for result in results:
+            assert os.path.dirname(result.path) == self.final
+            assert result.complete
+
+    def test_peers(self):
+        """WPDownloader._fetch_from_peers: Staged files are taken from the
+        published dump of a peer if they match its checksums"""
+        peer = os.path.join(self.tmp_dir, 'peer')
+        peer_dir = os.path.join(peer, 'zu', '20150603')
+        os.makedirs(peer_dir)
+        corrupt = bytes(len(CONTENT))
+        for name in self.names:
+            with open(os.path.join(peer_dir, name), 'wb') as peer_file:
+                peer_file.write(corrupt if name == self.names[0] else CONTENT)
+        with open(os.path.join(peer_dir, 'zuwiki-20150603-md5sums.txt'),
+                  'w') as md5sums:
+            md5sums.write(self.server.md5sums)
+
+        self.downloader = self.new_downloader([peer])
+        reservations = self.downloader._reservations
+        reserved = []
+        reserve = reservations.reserve
+        reservations.reserve = lambda path, size: (
+            reserved.append((path, size)) or reserve(path, size))
+        self.download()
+
+        # The corrupt copy of the peer is downloaded instead
+        assert len(self.server.requests) == 1
+        assert set(reserved) == set(
+            (os.path.join(self.staging, name + '.part'), len(CONTENT))
+            for name in self.names)
+        assert reservations._active == []
+        for name in self.names[1:]:
+            assert (os.stat(os.path.join(self.final, name)).st_ino ==
+                    os.stat(os.path.join(peer_dir, name)).st_ino)
+        with open(os.path.join(self.final, self.names[0]), 'rb') as fixed:
+            assert fixed.read() == CONTENT
+
+    def test_incomplete(self):
+        """WPDownloader.download_transfers: Incomplete dumps stay staged"""
+        self.download(2)
+        assert not os.path.exists(self.final)
+        assert sorted(os.listdir(self.staging)) == sorted(
+            ['.wpd-dump'] + list(self.names[:2]))
+
+        self.download()
+        assert os.path.isdir(self.final)
+        assert not os.path.exists(self.staging)
+
+    def test_checksum_mismatch(self):
+        """WPDownloader.download_transfers: Files with a wrong checksum are
+        removed and the dump stays staged"""
+        self.md5sums(dict((name, hashlib.md5(CONTENT).hexdigest()
+                           if name != self.names[0] else '0' * 32)
+                          for name in self.names))
+        self.download()
+        assert not os.path.exists(self.final)
+        assert not os.path.lexists(os.path.join(self.tmp_dir, 'zu', 'latest'))
+        assert self.names[0] not in os.listdir(self.staging)
+        assert set(self.names[1:]) <= set(os.listdir(self.staging))
+
+        # Published once the checksums match
+        self.md5sums(dict((name, hashlib.md5(CONTENT).hexdigest())
+                          for name in self.names))
+        self.downloader = self.new_downloader()
+        self.download()
+        assert os.path.isdir(self.final)
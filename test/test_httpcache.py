@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+
+
+import http.server
+import shutil
+import tempfile
+import threading
+
+import pytest
+
+import wp_download.httpcache as wpd_cache
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """Serves the pages of the server with ETags"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        pages = self.server.pages
+        if self.path not in pages:
+            self.send_error(404)
+            return
+
+        etag = '"%d"' % (hash(pages[self.path]))
+        self.server.requests.append(
+            (self.path, self.headers.get('If-None-Match')))
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(pages[self.path])))
+        self.end_headers()
+        self.wfile.write(pages[self.path])
+
+class TestHTTPCache(object):
+
+    def setup_method(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.server = http.server.HTTPServer(('127.0.0.1', 0), Handler)
+        self.server.pages = {'/a': b'a' * 100, '/b': b'b' * 100}
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.base_url = 'http://127.0.0.1:%d' % (self.server.server_port)
+
+    def teardown_method(self):
+        self.stop_server()
+        shutil.rmtree(self.tmp_dir)
+
+    def stop_server(self):
+        if self.thread.is_alive():
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+
+    def cache(self, **kw):
+        return wpd_cache.HTTPCache(self.tmp_dir, **kw)
+
+    def test_revalidation(self):
+        assert self.cache().get(self.base_url + '/a') == b'a' * 100
+        assert self.cache().get(self.base_url + '/a') == b'a' * 100
+        assert self.server.requests == [('/a', None), ('/a', '"%d"' % (
+            hash(b'a' * 100)))]
+
+    def test_changed_content(self):
+        cache = self.cache()
+        cache.get(self.base_url + '/a')
+        self.server.pages['/a'] = b'changed'
+        assert cache.get(self.base_url + '/a') == b'changed'
+        assert self.cache().get(self.base_url + '/a') == b'changed'
+
+    def test_hits_batch_index_writes(self):
+        cache = self.cache()
+        cache.get(self.base_url + '/a')
+        saves = []
+        save = cache._save
+        cache._save = lambda: saves.append(True) or save()
+        for _ in range(3):
+            cache.get(self.base_url + '/a')
+        assert saves == []
+
+        cache._saved -= wpd_cache.SAVE_INTERVAL + 1
+        cache.get(self.base_url + '/a')
+        cache.get(self.base_url + '/b')
+        assert len(saves) == 2
+
+    def test_offline(self):
+        self.cache().get(self.base_url + '/a')
+        offline = self.cache(offline=True)
+        assert offline.get(self.base_url + '/a') == b'a' * 100
+        assert len(self.server.requests) == 1
+
+    def test_offline_not_cached(self):
+        with pytest.raises(IOError):
+            self.cache(offline=True).get(self.base_url + '/a')
+
+    def test_not_found(self):
+        with pytest.raises(IOError):
+            self.cache().get(self.base_url + '/missing')
+
+    def test_unreachable_server_uses_cache(self):
+        cache = self.cache()
+        cache.get(self.base_url + '/a')
+        self.stop_server()
+        assert cache.get(self.base_url + '/a') == b'a' * 100
+
+    def test_lru_eviction(self):
+        self.server.pages['/c'] = b'c' * 100
+        cache = self.cache(max_size=250)
+        cache.get(self.base_url + '/a')
+        cache.get(self.base_url + '/b')
+        cache.get(self.base_url + '/a')
+        cache.get(self.base_url + '/c')
+        assert cache.size() == 200
+
+        del self.server.requests[:]
+        offline = self.cache(offline=True)
+        assert offline.get(self.base_url + '/a') == b'a' * 100
+        assert offline.get(self.base_url + '/c') == b'c' * 100
+        try:
+            offline.get(self.base_url + '/b')
+        except IOError:
+            pass
+        else:
+            assert False, '/b should have been evicted'
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+import wp_download.peers as wpd_peers
+import wp_download.verify as wpd_verify
+
+RELPATH = os.path.join('en', '20150603', 'enwiki-20150603-redirect.sql.gz')
+CONTENT = b'redirect' * 1000
+
+TMP_DIR = None
+
+def setup_function(function):
+    global TMP_DIR
+    TMP_DIR = tempfile.mkdtemp()
+    os.makedirs(os.path.join(TMP_DIR, 'local'))
+
+def teardown_function(function):
+    shutil.rmtree(TMP_DIR)
+
+def make_peer(name, content=CONTENT, checksum=None):
+    down_dir = os.path.join(TMP_DIR, name, 'en', '20150603')
+    os.makedirs(down_dir)
+    with open(os.path.join(TMP_DIR, name, RELPATH), 'wb') as peer_file:
+        peer_file.write(content)
+    if checksum:
+        with open(os.path.join(down_dir, 'md5sums.txt'), 'w') as sums:
+            sums.write('%s  %s\n' % (checksum, os.path.basename(RELPATH)))
+    return os.path.join(TMP_DIR, name)
+
+def target():
+    return os.path.join(TMP_DIR, 'local', 'file.part')
+
+def read(path):
+    with open(path, 'rb') as local_file:
+        return local_file.read()
+
+def test_copy_file():
+    source = os.path.join(make_peer('peer'), RELPATH)
+    wpd_peers.copy_file(source, target())
+    assert read(target()) == CONTENT
+
+def test_copy_file_kernel_copy():
+    source = os.path.join(make_peer('peer'), RELPATH)
+    kernel_copy = wpd_peers._kernel_copy
+    try:
+        for copy in kernel_copy:
+            wpd_peers._kernel_copy = [copy]
+            wpd_peers.copy_file(source, target())
+            assert read(target()) == CONTENT, copy[0]
+    finally:
+        wpd_peers._kernel_copy = kernel_copy
+
+def test_local_peer_links_file():
+    peer = wpd_peers.LocalPeer(make_peer('peer'))
+    assert peer.fetch(RELPATH, target(), len(CONTENT))
+    assert (os.stat(target()).st_ino ==
+            os.stat(os.path.join(peer.root, RELPATH)).st_ino)
+
+def test_local_peer_size_mismatch():
+    peer = wpd_peers.LocalPeer(make_peer('peer'))
+    assert not peer.fetch(RELPATH, target(), len(CONTENT) + 1)
+    assert not peer.fetch('en/20150603/missing', target(), len(CONTENT))
+    assert not os.path.exists(target())
+
+def test_sources_skip_peers_with_bad_checksum():
+    checksum = hashlib.md5(CONTENT).hexdigest()
+    corrupt = make_peer('corrupt', b'x' * len(CONTENT), checksum)
+    intact = make_peer('intact', CONTENT, checksum)
+
+    sources = wpd_peers.PeerSources([corrupt, intact])
+    assert sources.fetch(RELPATH, target(), len(CONTENT), 'md5sums.txt')
+    assert (os.stat(target()).st_ino ==
+            os.stat(os.path.join(intact, RELPATH)).st_ino)
+
+def test_sources_trust_verified_files():
+    checksum = hashlib.md5(CONTENT).hexdigest()
+    peer = make_peer('peer', CONTENT, checksum)
+    wpd_verify.verify_directory(
+        os.path.join(peer, 'en', '20150603'),
+        {os.path.basename(RELPATH): checksum})
+
+    md5sum = wpd_verify.md5sum
+    wpd_verify.md5sum = None
+    try:
+        assert wpd_peers.PeerSources([peer]).fetch(
+            RELPATH, target(), len(CONTENT), 'md5sums.txt')
+    finally:
+        wpd_verify.md5sum = md5sum
+
+def test_sources_without_match():
+    sources = wpd_peers.PeerSources([make_peer('peer')])
+    assert not sources.fetch(RELPATH, target(), len(CONTENT) - 1)
+    assert not sources.fetch(RELPATH, target(), 0)
+    assert not os.path.exists(target())
+
+def test_peer_types():
+    assert isinstance(wpd_peers.peer('http://node2:8080/dumps'),
+                      wpd_peers.HTTPPeer)
+    assert isinstance(wpd_peers.peer('/mnt/node2/dumps'), wpd_peers.LocalPeer)
+
+def test_copy_file_without_kernel_copy():
+    source = os.path.join(make_peer('peer'), RELPATH)
+    kernel_copy = wpd_peers._kernel_copy
+    wpd_peers._kernel_copy = []
+    try:
+        wpd_peers.copy_file(source, target())
+    finally:
+        wpd_peers._kernel_copy = kernel_copy
+    assert read(target()) == CONTENT
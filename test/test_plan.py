@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+import os.path
+
+import pytest
+
+import wp_download.config as wpd_conf
+import wp_download.exceptions as wpd_exc
+import wp_download.plan as wpd_plan
+
+PREFIX = os.path.join(*os.path.split(os.path.dirname(__file__))[:-1])
+TEST_DATA_DIR = os.path.join(PREFIX, 'test', 'data')
+
+DATE = datetime.datetime(2009, 8, 21)
+
+class FakeOptions(object):
+    pass
+
+def config():
+    options = FakeOptions()
+    options.config = os.path.join(TEST_DATA_DIR, 'enabled_options.cfg')
+    return wpd_conf.Configuration(options)
+
+def test_plan_files():
+    """DownloadPlan.files: Enabled files with their filetypes"""
+    plan = wpd_plan.DownloadPlan(config())
+    assert plan.files == (('langlinks', 'sql.gz'),
+                          ('pages-articles', 'xml.bz2'),
+                          ('redirect', 'sql.gz'))
+
+def test_plan_urls():
+    """DownloadPlan.urls: URLs for all enabled files"""
+    plan = wpd_plan.DownloadPlan(config())
+    base = 'http://download.wikimedia.org/zuwiki/20090821/zuwiki-20090821-'
+    assert plan.urls('zu', DATE) == (base + 'langlinks.sql.gz',
+                                     base + 'pages-articles.xml.bz2',
+                                     base + 'redirect.sql.gz')
+
+def test_plan_matrix():
+    """DownloadPlan.matrix: URLs for several languages"""
+    plan = wpd_plan.DownloadPlan(config())
+    matrix = plan.matrix(dict((lang, DATE) for lang in plan.languages))
+    assert sorted(matrix) == ['tum', 'zh', 'zh_yue', 'zu']
+    assert matrix['zu'] == plan.urls('zu', DATE)
+
+def test_plan_urls_cache():
+    """DownloadPlan.urls: Least recently used dumps are forgotten"""
+    plan = wpd_plan.DownloadPlan(config())
+    dates = [datetime.datetime(2009, 8, day) for day in (21, 22, 23)]
+    cache_size = wpd_plan.URL_CACHE_SIZE
+    wpd_plan.URL_CACHE_SIZE = 2
+    try:
+        for date in (dates[0], dates[1], dates[0], dates[2]):
+            plan.urls('zu', date)
+    finally:
+        wpd_plan.URL_CACHE_SIZE = cache_size
+    assert list(plan._urls) == [('zu', dates[0]), ('zu', dates[2])]
+
+def test_plan_local_layout():
+    """DownloadPlan.local_dir: Default layout and latest link"""
+    plan = wpd_plan.DownloadPlan(config())
+    assert plan.local_dir('zu', DATE) == os.path.join('zu', '20090821')
+    assert plan.latest_link('zu') == os.path.join('zu', 'latest')
+
+def test_plan_local_layout_templates():
+    """DownloadPlan.local_dir: Templated layout without latest link"""
+    conf = config()
+    conf.set('Templates', 'local_dir_format',
+             '${project}/${langcode}/${year}/${month}${day}/')
+    conf.add_section('Publish')
+    conf.set('Publish', 'latest_link', '')
+    plan = wpd_plan.DownloadPlan(conf)
+    assert (plan.local_dir('dewiktionary', DATE) ==
+            os.path.join('wiktionary', 'de', '2009', '0821'))
+    assert plan.latest_link('zu') is None
+
+def test_plan_layout_parse():
+    """LocalLayout.parse: Dump directories are mapped to language and date"""
+    conf = config()
+    conf.set('Templates', 'local_dir_format',
+             '${project}/${langcode}/${year}/${month}${day}')
+    layout = wpd_plan.DownloadPlan(conf).layout
+    assert layout.depth == 4
+    assert layout.parse(['wiktionary', 'de', '2009', '0821']) == (
+        'dewiktionary', '20090821')
+    assert layout.parse(['wiki', 'zu', '2009', '0821']) == ('zu', '20090821')
+    assert layout.parse(['wiki', 'zu', 'latest', '0821']) is None
+    assert layout.matches(2, '2009')
+    assert not layout.matches(2, 'latest')
+    assert not layout.matches(4, '2009')
+
+def test_plan_layout_parse_default():
+    """LocalLayout.parse: Default layout"""
+    layout = wpd_plan.DownloadPlan(config()).layout
+    assert layout.parse(['zh_yue', '20090821']) == ('zh_yue', '20090821')
+    assert layout.parse(['zu', 'latest']) is None
+
+def test_plan_local_layout_unknown_placeholder():
+    """DownloadPlan: Unknown placeholders in the layout are rejected"""
+    with pytest.raises(wpd_exc.TemplateValueError):
+        conf = config()
+        conf.set('Templates', 'local_dir_format', '${lang}/${date}')
+        wpd_plan.DownloadPlan(conf)
+
+def test_plan_row_filters():
+    """DownloadPlan.local_names: Filtered files are saved under other names"""
+    conf = config()
+    conf.add_section('Filters')
+    conf.set('Filters', 'zu/langlinks', 'll_lang=de,en')
+    conf.set('Filters', 'pages-articles', 'page_namespace=0')
+    conf.set('Configuration', 'filter_format', 'tsv')
+    plan = wpd_plan.DownloadPlan(conf)
+    assert plan.row_filter('zu', 'langlinks') is not None
+    assert plan.row_filter('zh', 'langlinks') is None
+    # Only SQL dumps are filtered
+    assert plan.row_filter('zu', 'pages-articles') is None
+    assert plan.local_names('zu', DATE) == (
+        'zuwiki-20090821-langlinks.filtered.tsv.gz',
+        'zuwiki-20090821-pages-articles.xml.bz2',
+        'zuwiki-20090821-redirect.sql.gz')
+
+def test_plan_row_filters_invalid():
+    """DownloadPlan: Invalid row filters are rejected"""
+    with pytest.raises(wpd_exc.ConfigValueError):
+        conf = config()
+        conf.add_section('Filters')
+        conf.set('Filters', 'langlinks', 'll_lang')
+        wpd_plan.DownloadPlan(conf)
+
+def test_enabled_options_cache():
+    """Configuration.enabled_options: Modifications invalidate the cache"""
+    conf = config()
+    assert conf.enabled_languages() == ['tum', 'zh', 'zh_yue', 'zu']
+    conf.set('Languages', 'zh', 'False')
+    assert conf.enabled_languages() == ['tum', 'zh_yue', 'zu']
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+
+
+import datetime
+import os
+import shutil
+import tempfile
+
+import wp_download.publish as wpd_publish
+
+TMP_DIR = None
+
+def setup_function(function):
+    global TMP_DIR
+    TMP_DIR = tempfile.mkdtemp()
+
+def teardown_function(function):
+    shutil.rmtree(TMP_DIR)
+
+def test_staging_dir():
+    final = os.path.join('dumps', 'en', '20150603')
+    staging = wpd_publish.staging_dir(final)
+    assert staging == os.path.join('dumps', 'en', '.20150603.staging')
+    assert wpd_publish.is_staging_dir(staging)
+    assert not wpd_publish.is_staging_dir(final)
+    assert wpd_publish.final_dir(staging) == final
+
+def test_marker():
+    assert wpd_publish.read_marker(TMP_DIR) is None
+    wpd_publish.write_marker(TMP_DIR, 'en', datetime.datetime(2015, 6, 3),
+                             'en/20150603')
+    assert (wpd_publish.read_marker(TMP_DIR) ==
+            {'language': 'en', 'date': '20150603', 'local_dir': 'en/20150603'})
+
+def test_publish():
+    link = os.path.join(TMP_DIR, 'en', 'latest')
+    for date in ('20150501', '20150603'):
+        staging = wpd_publish.staging_dir(os.path.join(TMP_DIR, 'en', date))
+        os.makedirs(staging)
+        open(os.path.join(staging, 'file'), 'w').close()
+        final = wpd_publish.publish(staging, link)
+
+        assert final == os.path.join(TMP_DIR, 'en', date)
+        assert not os.path.exists(staging)
+        assert os.path.exists(os.path.join(final, 'file'))
+        assert os.readlink(link) == date
+
+def test_publish_twice():
+    final = os.path.join(TMP_DIR, 'en', '20150603')
+    staging = wpd_publish.staging_dir(final)
+    os.makedirs(staging)
+    open(os.path.join(staging, 'file'), 'w').close()
+
+    assert wpd_publish.publish(staging) == final
+    # Published by another worker in the meantime
+    assert wpd_publish.publish(staging) is None
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+
+import wp_download.schedule as wpd_sched
+
+FILES = [('categorylinks', 30), ('pages-articles', 100), ('redirect', 10)]
+
+def scheduler(size_order='none', priorities=None):
+    priorities = priorities or {}
+    sched = wpd_sched.Scheduler(size_order)
+    for lang in ['de', 'en']:
+        for name, size in FILES:
+            key = '%s/%s' % (lang, name)
+            sched.add(wpd_sched.Transfer(
+                lang, name, 'http://localhost/' + key, '/tmp/' + key,
+                size=size, priority=priorities.get(key, 0)))
+    return sched
+
+def order(sched):
+    """Get the keys of the transfers in the order a single job runs them"""
+
+    started = []
+    sched.run(lambda transfer: started.append(transfer.key))
+    return started
+
+def test_order_keys():
+    """Scheduler.run: Ties are broken by key"""
+    assert (order(scheduler())[:3] ==
+            ['de/categorylinks', 'de/pages-articles', 'de/redirect'])
+
+def test_order_size():
+    """Scheduler.run: Smallest and largest files first"""
+    assert (order(scheduler('smallest'))[:2] ==
+            ['de/redirect', 'en/redirect'])
+    assert (order(scheduler('largest'))[:2] ==
+            ['de/pages-articles', 'en/pages-articles'])
+
+def test_order_priority():
+    """Scheduler.run: Higher priorities first"""
+    sched = scheduler('smallest', {'en/pages-articles': 1})
+    assert order(sched)[:2] == ['en/pages-articles', 'de/redirect']
+
+def test_order_dependencies():
+    """Scheduler.run: Prerequisites first"""
+    sched = scheduler('smallest')
+    sched.add_dependencies([('*', ['en/pages-articles']),
+                            ('de/*', ['en/*'])])
+    assert order(sched) == ['en/pages-articles', 'en/redirect',
+                            'en/categorylinks', 'de/redirect',
+                            'de/categorylinks', 'de/pages-articles']
+
+def test_order_cycle():
+    """Scheduler.run: Dependency cycles are broken"""
+    sched = scheduler()
+    sched.add_dependencies([('*', ['*'])])
+    assert sorted(order(sched)) == sorted(
+        '%s/%s' % (lang, name) for lang in ['de', 'en'] for name, _ in FILES)
+
+def test_run_parallel():
+    """Scheduler.run: Dependencies hold with parallel jobs"""
+    sched = scheduler()
+    sched.add_dependencies([('*', ['en/pages-articles'])])
+    lock = threading.Lock()
+    started = []
+
+    def worker(transfer):
+        with lock:
+            started.append(transfer.key)
+
+    sched.run(worker, jobs=4)
+    assert len(started) == 6
+    assert started[0] == 'en/pages-articles'
+    assert len(sched) == 0
+
+def test_run_defer():
+    """Scheduler.run: Deferred transfers are run again"""
+    sched = scheduler()
+    runs = []
+
+    def worker(transfer):
+        runs.append(transfer.key)
+        if transfer.key == 'de/redirect' and runs.count('de/redirect') == 1:
+            sched.defer(transfer)
+
+    sched.run(worker)
+    assert runs.count('de/redirect') == 2
+    assert len(runs) == 7
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+
+import gzip
+import io
+
+import pytest
+
+import wp_download.exceptions as wpd_exc
+import wp_download.sqlfilter as wpd_filter
+
+DUMP = (
+    b"-- MySQL dump 10.13\n"
+    b"DROP TABLE IF EXISTS `pagelinks`;\n"
+    b"CREATE TABLE `pagelinks` (\n"
+    b"  `pl_from` int(8) unsigned NOT NULL DEFAULT '0',\n"
+    b"  `pl_namespace` int(11) NOT NULL DEFAULT '0',\n"
+    b"  `pl_title` varbinary(255) NOT NULL DEFAULT '',\n"
+    b"  PRIMARY KEY (`pl_from`,`pl_namespace`,`pl_title`)\n"
+    b") ENGINE=InnoDB DEFAULT CHARSET=binary;\n"
+    b"INSERT INTO `pagelinks` VALUES (1,0,'Foo'),(2,14,'It\\'s_(a),(b)'),"
+    b"(3,2,'Bar');\n"
+    b"INSERT INTO `pagelinks` VALUES (4,2,'Baz\\'s'),(5,0,NULL);\n"
+    b"/*!40101 SET character_set_client = @saved_cs_client */;\n")
+
+def run_filter(spec, output_format='sql', dump=DUMP, chunk_size=7):
+    data = gzip.compress(dump)
+    out = io.BytesIO()
+    sql_filter = wpd_filter.SQLFilter(
+        out, wpd_filter.RowFilter.parse(spec), output_format)
+    for pos in range(0, len(data), chunk_size):
+        sql_filter.write(data[pos:pos + chunk_size])
+    sql_filter.close()
+    return sql_filter, gzip.decompress(out.getvalue())
+
+def test_filtered_name():
+    """filtered_name: Filtered files get their own suffix"""
+    assert (wpd_filter.filtered_name('enwiki-20150602-pagelinks.sql.gz',
+                                     'tsv') ==
+            'enwiki-20150602-pagelinks.filtered.tsv.gz')
+
+def test_parse_invalid():
+    """RowFilter.parse: Conditions need a column and values"""
+    with pytest.raises(ValueError):
+        wpd_filter.RowFilter.parse('pl_namespace')
+
+def test_filter_sql():
+    """SQLFilter: Kept rows are written as SQL"""
+    sql_filter, output = run_filter('pl_namespace=0,14')
+    assert (sql_filter.rows, sql_filter.kept) == (5, 3)
+    assert output == DUMP.replace(
+        b"(1,0,'Foo'),(2,14,'It\\'s_(a),(b)'),(3,2,'Bar');\n"
+        b"INSERT INTO `pagelinks` VALUES (4,2,'Baz\\'s'),(5,0,NULL)",
+        b"(1,0,'Foo'),(2,14,'It\\'s_(a),(b)');\n"
+        b"INSERT INTO `pagelinks` VALUES (5,0,NULL)")
+
+def test_filter_tsv():
+    """SQLFilter: Kept rows are written as tab separated values"""
+    _, output = run_filter('pl_namespace!=2 pl_title!=Foo', 'tsv')
+    assert output == b"2\t14\tIt's_(a),(b)\n5\t0\t\\N\n"
+
+def test_filter_strings():
+    """SQLFilter: Strings are compared without quotes and escapes"""
+    _, output = run_filter("pl_title=Foo,Baz's", 'tsv')
+    assert output == b"1\t0\tFoo\n4\t2\tBaz's\n"
+
+def test_filter_unknown_column():
+    """SQLFilter: Conditions on unknown columns are rejected"""
+    with pytest.raises(wpd_exc.FilterError):
+        run_filter('pl_from_namespace=0')
+
+def test_filter_column_mismatch():
+    """SQLFilter: Rows have to match the columns of the table"""
+    with pytest.raises(wpd_exc.FilterError):
+        run_filter('pl_namespace=0', dump=DUMP.replace(
+            b"(3,2,'Bar')", b"(3,2,'Bar',0)"))
+
+def test_filter_incomplete():
+    """SQLFilter: Truncated dumps are not accepted"""
+    data = gzip.compress(DUMP)
+    sql_filter = wpd_filter.SQLFilter(
+        io.BytesIO(), wpd_filter.RowFilter.parse('pl_namespace=0'))
+    sql_filter.write(data[:-20])
+    with pytest.raises(wpd_exc.FilterError):
+        sql_filter.close()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+
+
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import wp_download.cli as wpd_cli
+
+PREFIX = os.path.join(*os.path.split(os.path.dirname(__file__))[:-1])
+CONFIG = os.path.join(PREFIX, 'test', 'data', 'enabled_options.cfg')
+
+# Modules only the download commands need
+HEAVY_MODULES = ('progressbar', 'urllib.request', 'sqlite3', 'http.server',
+                 'wp_download.download', 'wp_download.daemon',
+                 'wp_download.distributed')
+
+def run_python(code):
+    env = dict(os.environ, PYTHONPATH=PREFIX)
+    return subprocess.check_output([sys.executable, '-c', code], env=env,
+                                   universal_newlines=True)
+
+def test_cli_imports_no_heavy_modules():
+    loaded = run_python(
+        'import sys, wp_download.cli\n'
+        'sys.stdout.write(" ".join(sys.modules))').split()
+    for module in HEAVY_MODULES:
+        assert module not in loaded, module
+
+def run_command(argv):
+    """Run a command of the CLI, get the modules loaded and the timeout"""
+
+    loaded = run_python(
+        'import socket, sys, wp_download.cli\n'
+        'wp_download.cli.main(%r)\n'
+        'sys.stdout.write("\\n" + " ".join(sys.modules) + "\\n")\n'
+        'sys.stdout.write(repr(socket.getdefaulttimeout()))' % (argv,))
+    return loaded.splitlines()[-2].split(), loaded.splitlines()[-1]
+
+def test_plan_verify_import_no_heavy_modules():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        config = os.path.join(tmp_dir, 'wpdownloadrc')
+        with open(CONFIG) as orig, open(config, 'w') as config_file:
+            config_file.write(orig.read().replace('[Configuration]\n', (
+                '[Configuration]\ncache_dir = %s\n' % (tmp_dir)), 1))
+
+        for argv in (['-q', '-c', config, 'plan', '--offline',
+                      '--custom-dump', 'zu:20090821', 'zu'],
+                     ['-q', '-c', config, 'verify', '--offline', tmp_dir]):
+            loaded, timeout = run_command(argv)
+            for module in HEAVY_MODULES:
+                assert module not in loaded, (argv[3], module)
+            # The global socket timeout is left alone
+            assert timeout == 'None', argv[3]
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_cli_import_time():
+    best = min(float(run_python(
+        'import time\n'
+        'start = time.time()\n'
+        'import wp_download.cli\n'
+        'print(time.time() - start)')) for _ in range(3))
+    assert best < 0.2, best
+
+def test_parse_args_default_command():
+    args = wpd_cli.parse_args(['-q', '/tmp/dumps'])
+    assert args.command == 'download'
+    assert args.DOWNLOAD_DIR == '/tmp/dumps'
+    assert args.jobs is None
+
+def test_parse_args_plan():
+    args = wpd_cli.parse_args(['plan', 'en', 'de'])
+    assert args.command == 'plan'
+    assert args.LANGUAGE == ['en', 'de']
+    assert args.force is False
+    assert args.timeout == 30
+
+def test_parse_args_options_before_command():
+    args = wpd_cli.parse_args(['-c', 'plan', 'plan', 'en'])
+    assert args.command == 'plan'
+    assert args.config == 'plan'
+    assert args.LANGUAGE == ['en']
+
+def test_parse_args_verify():
+    args = wpd_cli.parse_args(['verify', '-v', '/tmp/dumps'])
+    assert args.command == 'verify'
+    assert args.DOWNLOAD_DIR == '/tmp/dumps'
+    assert args.LANGUAGE == []
+    assert args.verbose is True
+
+def test_parse_args_status():
+    args = wpd_cli.parse_args(['status', '--remote', '/tmp/dumps', 'en'])
+    assert args.command == 'status'
+    assert args.remote is True
+    assert args.LANGUAGE == ['en']
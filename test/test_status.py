@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+
+
+import datetime
+import os
+import shutil
+import string
+import tempfile
+import time
+
+import wp_download.plan as wpd_plan
+import wp_download.status as wpd_status
+
+TMP_DIR = None
+CACHE_DIR = None
+
+def setup_function(function):
+    global TMP_DIR, CACHE_DIR
+    TMP_DIR = tempfile.mkdtemp()
+    CACHE_DIR = tempfile.mkdtemp()
+
+def teardown_function(function):
+    shutil.rmtree(TMP_DIR)
+    shutil.rmtree(CACHE_DIR)
+
+def write(relpath, size):
+    path = os.path.join(TMP_DIR, relpath)
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as local_file:
+        local_file.write('x' * size)
+
+def age(seconds=60):
+    """Move the modification times of all directories into the past"""
+    mtime = time.time() - seconds
+    for dirpath, _, _ in os.walk(TMP_DIR):
+        os.utime(dirpath, (mtime, mtime))
+
+def index():
+    return wpd_status.DumpIndex(
+        TMP_DIR, wpd_status.index_file(CACHE_DIR, TMP_DIR))
+
+def expected(date):
+    return ['a-%s' % (date), 'b-%s' % (date)]
+
+def test_index_refresh():
+    write('en/20150603/a-20150603', 10)
+    write('en/20150603/b-20150603.part', 5)
+    write('en/20150501/a-20150501', 3)
+    write('en/tmp/ignored', 1)
+
+    dumps = index().refresh()
+    assert sorted(dumps) == ['en']
+    assert sorted(dumps['en']) == ['20150501', '20150603']
+    assert (dumps['en']['20150603']['files'] ==
+            {'a-20150603': 10, 'b-20150603.part': 5})
+
+def test_index_layout():
+    write('wiki/en/2015/0603/a-20150603', 10)
+    write('wiktionary/de/2015/0501/a-20150501', 3)
+    write('wiki/en/2015/.0701.staging/a-20150701', 1)
+    write('wiki/en/latest/a-20150603', 1)
+
+    layout = wpd_plan.LocalLayout(string.Template(
+        '${project}/${langcode}/${year}/${month}${day}'))
+    dumps = wpd_status.DumpIndex(
+        TMP_DIR, wpd_status.index_file(CACHE_DIR, TMP_DIR), layout).refresh()
+    assert sorted(dumps) == ['dewiktionary', 'en']
+    assert list(dumps['en']) == ['20150603']
+    assert dumps['dewiktionary']['20150501']['files'] == {'a-20150501': 3}
+
+def test_index_only_lists_changed_directories():
+    write('en/20150603/a-20150603', 10)
+    write('de/20150603/a-20150603', 10)
+    age()
+    index().refresh()
+
+    listed = []
+    listdir = os.listdir
+    def counting_listdir(path):
+        listed.append(path)
+        return listdir(path)
+
+    os.listdir = counting_listdir
+    try:
+        index().refresh()
+        assert listed == []
+
+        write('de/20150603/b-20150603', 1)
+        dumps = index().refresh()
+    finally:
+        os.listdir = listdir
+
+    assert listed == [os.path.join(TMP_DIR, 'de', '20150603')]
+    assert (dumps['de']['20150603']['files'] ==
+            {'a-20150603': 10, 'b-20150603': 1})
+
+def test_index_follows_partial_files_and_removals():
+    write('en/20150603/a-20150603.part', 1)
+    index().refresh()
+
+    write('en/20150603/a-20150603.part', 7)
+    dumps = index().refresh()
+    assert dumps['en']['20150603']['files'] == {'a-20150603.part': 7}
+
+    shutil.rmtree(os.path.join(TMP_DIR, 'en'))
+    assert index().refresh() == {}
+
+def test_index_removal_without_mtime_change():
+    write('en/20150603/a-20150603', 1)
+    write('de/20150603/a-20150603', 1)
+    age()
+    index().refresh()
+
+    # Removed within the same tick of the file system clock
+    mtime = os.stat(TMP_DIR).st_mtime
+    shutil.rmtree(os.path.join(TMP_DIR, 'de'))
+    os.utime(TMP_DIR, (mtime, mtime))
+    assert sorted(index().refresh()) == ['en']
+
+def test_index_relists_recent_directories():
+    write('en/20150603/a-20150603', 1)
+    index().refresh()
+
+    down_dir = os.path.join(TMP_DIR, 'en', '20150603')
+    mtime = os.stat(down_dir).st_mtime
+    write('en/20150603/b-20150603', 1)
+    os.utime(down_dir, (mtime, mtime))
+    assert (index().refresh()['en']['20150603']['files'] ==
+            {'a-20150603': 1, 'b-20150603': 1})
+
+def test_language_status_states():
+    complete = {'files': {'a-20150603': 1, 'b-20150603': 2},
+                'verified': ['a-20150603']}
+    partial = {'files': {'a-20150603': 1, 'b-20150603.part': 2}}
+
+    status = wpd_status.language_status(
+        'en', {'20150603': complete, '20150501': partial}, expected)
+    assert status.state == 'complete'
+    assert status.date == '20150603'
+    assert status.verified == ['a-20150603']
+    assert status.size == 3
+    assert status.total_size == 6
+
+    status = wpd_status.language_status('en', {'20150603': partial}, expected)
+    assert status.state == 'partial'
+    assert status.missing == ['b-20150603']
+    assert status.partial == {'b-20150603.part': 2}
+
+    status = wpd_status.language_status(
+        'en', {'20150603': {'files': {'a-20150603': 1}}}, expected)
+    assert status.state == 'incomplete'
+    assert wpd_status.language_status(
+        'en', {'20150603': complete}, expected, '20150701').state == 'stale'
+    assert wpd_status.language_status('en', {}, expected).state == 'missing'
+
+def test_remote_dates():
+    assert wpd_status.load_remote_dates(TMP_DIR) == {}
+    wpd_status.record_remote_date(TMP_DIR, 'en', datetime.datetime(2015, 6, 3))
+    wpd_status.record_remote_date(TMP_DIR, 'de', datetime.datetime(2015, 6, 1))
+    assert (wpd_status.load_remote_dates(TMP_DIR) ==
+            {'en': '20150603', 'de': '20150601'})
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+import wp_download.verify as wpd_verify
+
+TMP_DIR = None
+
+def setup_function(function):
+    global TMP_DIR
+    TMP_DIR = tempfile.mkdtemp()
+
+def teardown_function(function):
+    shutil.rmtree(TMP_DIR)
+
+def write(filename, content):
+    with open(os.path.join(TMP_DIR, filename), 'wb') as local_file:
+        local_file.write(content)
+    return hashlib.md5(content).hexdigest()
+
+def test_parse_md5sums():
+    checksums = wpd_verify.parse_md5sums(
+        'D41D8CD98F00B204E9800998ECF8427E  enwiki-pages.xml.bz2\n'
+        '\n'
+        '0cc175b9c0f1b6a831c399e269772661 *enwiki-stub.xml.gz\n')
+    assert checksums == {
+        'enwiki-pages.xml.bz2': 'd41d8cd98f00b204e9800998ecf8427e',
+        'enwiki-stub.xml.gz': '0cc175b9c0f1b6a831c399e269772661'}
+
+def test_verify_directory():
+    good = write('good', b'content')
+    write('bad', b'corrupt')
+    results = wpd_verify.verify_directory(
+        TMP_DIR, {'good': good, 'bad': good, 'missing': good})
+    assert results == {'good': True, 'bad': False}
+    assert wpd_verify.is_verified(TMP_DIR, 'good')
+    assert not wpd_verify.is_verified(TMP_DIR, 'bad')
+
+def test_verify_directory_caches_results():
+    checksum = write('good', b'content')
+    wpd_verify.verify_directory(TMP_DIR, {'good': checksum})
+
+    md5sum = wpd_verify.md5sum
+    wpd_verify.md5sum = None
+    try:
+        assert (wpd_verify.verify_directory(TMP_DIR, {'good': checksum}) ==
+                {'good': True})
+    finally:
+        wpd_verify.md5sum = md5sum
+
+def test_changed_file_is_not_verified():
+    checksum = write('good', b'content')
+    wpd_verify.verify_directory(TMP_DIR, {'good': checksum})
+    write('good', b'changed content')
+    assert not wpd_verify.is_verified(TMP_DIR, 'good')
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+
+
+import io
+import os
+import threading
+
+import pytest
+
+import wp_download.writer as wpd_writer
+
+DATA = bytes(i % 256 for i in range(100000))
+
+class ReadOnly(object):
+    """Stream without readinto()"""
+
+    def __init__(self, data):
+        self._stream = io.BytesIO(data)
+
+    def read(self, size):
+        return self._stream.read(size)
+
+class SlowFile(io.BytesIO):
+    """File that blocks writes until it is released"""
+
+    def __init__(self):
+        io.BytesIO.__init__(self)
+        self.released = threading.Event()
+
+    def write(self, data):
+        self.released.wait()
+        return io.BytesIO.write(self, data)
+
+    def fileno(self):
+        return 0
+
+class BrokenFile(io.BytesIO):
+
+    def write(self, data):
+        raise IOError('Disk full')
+
+class ClosedFile(io.BytesIO):
+
+    def write(self, data):
+        raise ValueError('I/O operation on closed file')
+
+def copy(stream, local_file, **kw):
+    with wpd_writer.WriteBehind(local_file, buffer_size=4096, **kw) as writer:
+        while writer.readinto(stream):
+            pass
+    return writer
+
+def test_write_behind():
+    for stream in (io.BytesIO(DATA), ReadOnly(DATA)):
+        local_file = io.BytesIO()
+        writer = copy(stream, local_file)
+        assert local_file.getvalue() == DATA
+        assert writer.written == len(DATA)
+
+def test_reads_ahead_of_slow_disk():
+    local_file = SlowFile()
+    writer = wpd_writer.WriteBehind(local_file, buffers=4, buffer_size=1000)
+    stream = io.BytesIO(DATA)
+
+    # One buffer is taken by the blocked write, the others fill up
+    for _ in range(4):
+        assert writer.readinto(stream) == 1000
+
+    local_file.released.set()
+    while writer.readinto(stream):
+        pass
+    writer.close()
+    assert local_file.getvalue() == DATA
+
+def test_write_error():
+    with pytest.raises(IOError):
+        copy(io.BytesIO(DATA), BrokenFile())
+
+def test_sink_error():
+    errors = []
+
+    def run():
+        try:
+            copy(io.BytesIO(DATA), ClosedFile())
+        except ValueError as err:
+            errors.append(err)
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    thread.join(10)
+    assert not thread.is_alive()
+    assert len(errors) == 1
+
+def fsync_calls(policy, **kw):
+    calls = []
+    fsync = os.fsync
+    os.fsync = calls.append
+    try:
+        local_file = SlowFile()
+        local_file.released.set()
+        copy(io.BytesIO(DATA), local_file, fsync=policy, **kw)
+    finally:
+        os.fsync = fsync
+    return len(calls)
+
+def test_fsync_policies():
+    assert fsync_calls('none') == 0
+    assert fsync_calls('complete') == 1
+    # 100000 bytes in 4096 byte buffers, synced every 40960 bytes and once
+    # for the rest
+    assert fsync_calls('periodic', fsync_interval=40000) == 3
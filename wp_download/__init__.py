@@ -20,3 +20,20 @@ import logging
 
 LOG = logging.getLogger(__name__)
 LOG.setLevel(logging.DEBUG)
+
+
+class ErrorLimit(logging.Filter):
+    """Discard all records with a level higher or equal to
+    logging.ERROR
+    """
+
+    def filter(self, record):
+        """Filter log record by level
+
+        :param record:  Log record in question
+        :type record:   logging.LogRecord
+        """
+
+        if record.levelno < logging.ERROR:
+            return True
+        return False
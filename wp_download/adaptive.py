@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+"""Adaptive control of the number of concurrent transfers.
+
+The controller measures the aggregate throughput of all transfers in fixed
+intervals and adjusts the number of transfers that may run at the same time
+(additive increase, multiplicative decrease):
+
+* while adding a stream raises the throughput, another one is added,
+* if adding a stream does not pay off, the previous number is kept for a
+  while before probing again,
+* if transfers fail, the number of streams is halved.
+
+The number of streams found to work best is remembered per host.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.DEBUG)
+
+# Minimal relative throughput gain that justifies another stream
+MIN_GAIN = 0.05
+
+# Number of intervals to keep a limit before probing for more streams
+HOLD_INTERVALS = 6
+
+
+class ConcurrencyController(object):
+    """
+    AIMD controller for the number of concurrent transfers to a host.
+    """
+
+    def __init__(self, host, minimum=1, maximum=8, initial=None,
+                 interval=10.0, state_file=None):
+        """
+        Constructor.
+
+        :param host:        Host the transfers go to
+        :type host:         string
+
+        :param minimum:     Minimal number of concurrent transfers
+        :type minimum:      int
+
+        :param maximum:     Maximal number of concurrent transfers
+        :type maximum:      int
+
+        :param initial:     Initial number of concurrent transfers, the learned
+                            optimum of the host or minimum if None.
+        :type initial:      int
+
+        :param interval:    Length of a measurement interval in seconds
+        :type interval:     float
+
+        :param state_file:  JSON file the learned optima are kept in
+        :type state_file:   string
+        """
+        self.host = host
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self._interval = interval
+        self._state_file = state_file
+
+        if initial is None:
+            initial = self._learned().get(host, self.minimum)
+        self.limit = self._clamp(initial)
+        self.optimum = self.limit
+
+        self._cond = threading.Condition()
+        self._active = 0
+        self._bytes = 0
+        self._errors = 0
+        self._started = time.time()
+        self._last_limit = self.limit
+        self._last_rate = 0.0
+        self._hold = 0
+        self.rate = 0.0
+
+    def _clamp(self, limit):
+        """Keep limit between minimum and maximum"""
+
+        return min(self.maximum, max(self.minimum, limit))
+
+    def _learned(self):
+        """Get the learned optima of all hosts"""
+
+        if not self._state_file or not os.path.exists(self._state_file):
+            return {}
+        try:
+            with open(self._state_file) as state_file:
+                return json.load(state_file)
+        except (IOError, ValueError) as err:
+            LOG.error('Could not read %s: %s' % (self._state_file, err))
+            return {}
+
+    def save(self):
+        """Remember the optimum of the host in the state file"""
+
+        if not self._state_file:
+            return
+
+        learned = self._learned()
+        learned[self.host] = self.optimum
+
+        state_dir = os.path.dirname(self._state_file)
+        if state_dir and not os.path.exists(state_dir):
+            os.makedirs(state_dir)
+
+        tmp_path = self._state_file + '.tmp'
+        with open(tmp_path, 'w') as state_file:
+            json.dump(learned, state_file)
+        os.rename(tmp_path, self._state_file)
+
+    def acquire(self):
+        """Wait until another transfer may be started"""
+
+        with self._cond:
+            while self._active >= self.limit:
+                self._cond.wait(self._interval)
+                self._evaluate()
+            self._active += 1
+
+    def release(self):
+        """Mark a transfer as finished"""
+
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def record(self, size):
+        """Account for size bytes that have been received
+
+        :param size:    Number of bytes
+        :type size:     int
+        """
+        with self._cond:
+            self._bytes += size
+            self._evaluate()
+
+    def record_error(self):
+        """Account for a failed transfer attempt"""
+
+        with self._cond:
+            self._errors += 1
+            self._evaluate()
+
+    def stats(self):
+        """Get throughput statistics
+
+        :returns:   Limit, active transfers, aggregate and per stream rate in
+                    bytes per second of the last interval
+        :rtype:     dict
+        """
+        with self._cond:
+            return {'limit': self.limit,
+                    'active': self._active,
+                    'optimum': self.optimum,
+                    'rate': self.rate,
+                    'stream_rate': self.rate / max(1, self._active)}
+
+    def _evaluate(self):
+        """Adjust the limit once an interval has passed
+
+        Has to be called with the lock held.
+        """
+        now = time.time()
+        elapsed = now - self._started
+        if elapsed < self._interval:
+            return
+
+        rate = self._bytes / elapsed
+        errors = self._errors
+        limit = self.limit
+        self.rate = rate
+        self._bytes = self._errors = 0
+        self._started = now
+
+        if errors:
+            self.limit = self._clamp(limit // 2)
+            self.optimum = min(self.optimum, self.limit)
+            self._hold = HOLD_INTERVALS
+        elif limit > self._last_limit:
+            if rate > self._last_rate * (1 + MIN_GAIN):
+                self.optimum = limit
+                self.limit = self._clamp(limit + 1)
+            else:
+                # The additional stream did not pay off
+                self.limit = self._last_limit
+                self._hold = HOLD_INTERVALS
+        elif self._hold:
+            self._hold -= 1
+        elif self._active >= limit:
+            self.limit = self._clamp(limit + 1)
+
+        if self.limit != limit:
+            LOG.info('Concurrent transfers for %s: %d -> %d (%.0f B/s)' % (
+                self.host, limit, self.limit, rate))
+            self._cond.notify_all()
+
+        self._last_limit = limit
+        self._last_rate = rate
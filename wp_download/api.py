@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+"""Library interface to wp-download.
+
+Downloads are started with download(), which yields a FileResult for every
+file as soon as its transfer has finished::
+
+    import wp_download.api as wpd_api
+
+    options = wpd_api.DownloadOptions(config='wpdownloadrc', resume=True)
+    for result in wpd_api.download('/srv/dumps', options, ['en']):
+        print(result.path, result.received, result.duration)
+
+The options correspond to the options of the ``download`` command.
+"""
+
+import dataclasses
+import logging
+import os
+import queue
+import threading
+
+from typing import List, Optional
+
+import wp_download.download as wpd_down
+
+from wp_download.download import FileResult
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.DEBUG)
+
+__all__ = ['DownloadOptions', 'FileResult', 'download']
+
+
+@dataclasses.dataclass
+class DownloadOptions(object):
+    """
+    Options of a download, see ``wp-download download --help``.
+    """
+
+    #: Path of the configuration file
+    config: str = os.path.expanduser('~/.wpdownloadrc')
+    #: Download all files again
+    force: bool = False
+    #: Resume partial downloads
+    resume: bool = False
+    #: Number of download attempts
+    retries: int = 3
+    #: Number of transfers run in parallel, jobs in [Schedule] if None
+    jobs: Optional[int] = None
+    #: Megabytes to keep free on the target file system
+    min_free_space: int = 0
+    #: One of 'none', 'periodic' or 'complete', fsync in [Configuration]
+    #: if None
+    fsync: Optional[str] = None
+    #: Download directories or HTTP URLs of peers to take files from
+    peer: List[str] = dataclasses.field(default_factory=list)
+    #: Use cached index pages and checksums only
+    offline: bool = False
+    #: Socket timeout in seconds
+    timeout: float = 30
+    #: Dumps of specific dates, like en:20150603
+    custom_dump: List[str] = dataclasses.field(default_factory=list)
+    #: Compute the MD5 checksum of every file
+    checksum: bool = False
+    #: Do not show progress bars
+    quiet: bool = True
+
+
+def download(path, options=None, languages=None, progress=None):
+    """Download the latest dumps and yield the result of every file
+
+    Transfers run in background threads. The generator yields a FileResult as
+    soon as a transfer has finished, in the order they finish. Closing the
+    generator early does not cancel the transfers, it waits for them.
+
+    Files of dumps that are staged (see ``[Publish]``) are in the staging
+    directory when their result is yielded. They are moved once the last
+    result has been consumed, which updates the path of their results.
+
+    :param path:        Base path of the language directories
+    :type path:         string
+
+    :param options:     Options of the download, defaults if None
+    :type options:      DownloadOptions
+
+    :param languages:   Languages to download, all enabled if None
+    :type languages:    list
+
+    :param progress:    Callable that is called with the FileResult and the
+                        number of bytes of the file on disk whenever data was
+                        received. It is called from the transfer threads.
+    :type progress:     Callable[[FileResult, int], None]
+
+    :raises ConfigParseError:   If the configuration is not valid. As
+                                download() is a generator, this is raised
+                                by the first ``next()``, not by the call.
+
+    :returns:           Iterator over the results
+    :rtype:             Iterator[FileResult]
+    """
+    downloader = wpd_down.WPDownloader(options or DownloadOptions(),
+                                       progress)
+
+    transfers = []
+    for language in languages or downloader.languages():
+        try:
+            transfers.extend(downloader.transfers_for_language(language, path))
+        except IOError:
+            LOG.error('Download failed: %s' % (language))
+            LOG.error('Skipped: %s' % (language))
+
+    results = queue.Queue()
+    errors = []
+
+    def run():
+        try:
+            downloader.download_transfers(transfers,
+                                          result_hook=results.put)
+        except Exception as err:
+            errors.append(err)
+        finally:
+            results.put(None)
+
+    thread = threading.Thread(target=run, name='download')
+    thread.daemon = True
+    thread.start()
+
+    try:
+        for result in iter(results.get, None):
+            yield result
+    finally:
+        thread.join()
+
+    if errors:
+        raise errors[0]
@@ -0,0 +1,655 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+"""Command line interface of wp-download.
+
+Only lightweight modules are imported at module level. Everything else is
+imported by the commands that need it, so that quick commands like plan or
+verify do not pay for the download machinery.
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+import wp_download as wpd
+import wp_download.exceptions as wpd_exc
+
+from wp_download.version import __version__
+
+LOG = logging.getLogger('wp-download')
+LOG.setLevel(logging.DEBUG)
+
+COMMANDS = ('download', 'status', 'plan', 'verify', 'manifest')
+
+# Download options of commands that do not download dumps
+DOWNLOAD_DEFAULTS = {
+    'force': False,
+    'resume': False,
+    'retries': 3,
+    'jobs': None,
+    'min_free_space': 0,
+    'peer': None,
+    'offline': False,
+    'fsync': None,
+    'checksum': False,
+}
+
+
+def common_options():
+    """Get parser for options shared by all commands"""
+
+    parser = argparse.ArgumentParser(add_help=False)
+
+    parser.add_argument(
+        '-q', '--quiet',
+        action='store_true', dest='quiet',
+        default=False,
+        help='do not generate output (only report errors)'
+    )
+    parser.add_argument(
+        '-v', '--verbose',
+        action='store_true',
+        dest='verbose',
+        default=False,
+        help='generate verbose output'
+    )
+    parser.add_argument(
+        '-c', '--config',
+        metavar='FILE',
+        default = os.path.expanduser('~/.wpdownloadrc'),
+        help='load configuration from FILE [default: %(default)s]'
+    )
+
+    # Logging related options
+
+    log_level = ['DEBUG', 'INFO', 'WARNING', 'ERROR']
+
+    log_options = parser.add_argument_group(
+        'Logging',
+        'Specify log file handling.'
+    )
+    log_options.add_argument(
+        '--log-file',
+        metavar='FILE',
+        help='write logs to FILE'
+    )
+    log_options.add_argument(
+        '--log-file-level',
+        help='set log level [default: %(default)s]',
+        action='store',
+        default='INFO',
+        choices=log_level
+    )
+
+    # Options for requests to the download site
+    remote_options = parser.add_argument_group(
+        'Remote',
+        'Change access to the download site'
+    )
+    remote_options.add_argument(
+        '--timeout',
+        type=int,
+        dest='timeout',
+        default=30,
+        help='Set timeout for download in seconds [default: %(default)ss]')
+    remote_options.add_argument(
+        '--custom-dump',
+        action='append',
+        dest='custom_dump',
+        metavar='LANG:DATE',
+        help='Download a custom dump for specific language (e.g., en:20150603)'
+    )
+
+    return parser
+
+
+def add_download_options(parser):
+    """Add options of the download command to parser"""
+
+    parser.add_argument(
+        'DOWNLOAD_DIR',
+        help='Directory in which dumps are saved',
+    )
+
+    # Daemon related options
+    daemon_options = parser.add_argument_group(
+        'Daemon',
+        'Run as daemon that downloads jobs submitted over HTTP'
+    )
+    daemon_options.add_argument(
+        '--daemon',
+        action='store_true',
+        dest='daemon',
+        default=False,
+        help='Run as daemon instead of downloading all languages once'
+    )
+    daemon_options.add_argument(
+        '--listen',
+        metavar='[HOST:]PORT',
+        dest='listen',
+        default='127.0.0.1:8642',
+        help='Address of the control API [default: %(default)s]'
+    )
+    daemon_options.add_argument(
+        '--keep-jobs',
+        metavar='N',
+        type=int,
+        dest='keep_jobs',
+        default=100,
+        help='Number of finished jobs the daemon keeps [default: %(default)s]'
+    )
+
+    # Distributed downloads
+    dist_options = parser.add_argument_group(
+        'Distributed',
+        'Share downloads between several workers through a database on '
+        'shared storage'
+    )
+    dist_options.add_argument(
+        '--coordinate',
+        metavar='DB',
+        dest='coordinate',
+        help='Add all planned downloads as work units to DB and exit'
+    )
+    dist_options.add_argument(
+        '--worker',
+        metavar='DB',
+        dest='worker',
+        help='Download work units leased from DB until none is left'
+    )
+    dist_options.add_argument(
+        '--lease-time',
+        type=float,
+        dest='lease_time',
+        default=60,
+        help='Seconds after which units of unresponsive workers are handed '
+             'out again [default: %(default)s]'
+    )
+
+    # Download related options
+    down_options = parser.add_argument_group(
+        'Download',
+        'Change download behaviour'
+    )
+    down_options.add_argument(
+        '--force',
+        action='store_true',
+        dest='force',
+        default=False,
+        help='Force download of all files.'
+    )
+    down_options.add_argument(
+        '--resume',
+        action='store_true',
+        dest='resume',
+        default=False,
+        help='Resume partial downloads.'
+    )
+    down_options.add_argument(
+        '--retries',
+        type=int,
+        dest='retries',
+        default=3,
+        help='Set number of download attempts [default: %(default)s]'
+    )
+    down_options.add_argument(
+        '-j', '--jobs',
+        type=int,
+        dest='jobs',
+        metavar='N',
+        help='Run N transfers in parallel [default: jobs in [Schedule]]'
+    )
+    down_options.add_argument(
+        '--min-free-space',
+        type=int,
+        dest='min_free_space',
+        metavar='MB',
+        default=0,
+        help='Keep MB megabytes free on the target file system '
+             '[default: %(default)s]'
+    )
+    down_options.add_argument(
+        '--fsync',
+        dest='fsync',
+        choices=['none', 'periodic', 'complete'],
+        help='When to force downloaded data to disk [default: fsync in '
+             '[Configuration]]'
+    )
+    down_options.add_argument(
+        '--peer',
+        action='append',
+        dest='peer',
+        metavar='SOURCE',
+        help='Take files from the download directory or HTTP URL of a peer '
+             'before downloading them (may be given several times)'
+    )
+
+
+def add_offline_option(parser):
+    """Add the option to work from the HTTP cache alone to parser"""
+
+    parser.add_argument(
+        '--offline',
+        action='store_true',
+        dest='offline',
+        default=False,
+        help='Do not contact the download site, use cached index pages and '
+             'checksums only'
+    )
+
+
+def init_parser():
+    """Initialise command line parser."""
+
+    parser = argparse.ArgumentParser(
+        prog='wp-download',
+        description='Downloader for Wikipedia database dumps. The download '
+                    'command is used if no command is given.')
+    parser.add_argument(
+        '--version',
+        action='version',
+        version='%(prog)s {}'.format(__version__)
+    )
+
+    commands = parser.add_subparsers(
+        dest='command', title='commands', metavar='COMMAND')
+    common = common_options()
+
+    download_parser = commands.add_parser(
+        'download', parents=[common],
+        help='Download the latest dumps of all enabled languages')
+    add_download_options(download_parser)
+    download_parser.set_defaults(offline=False, checksum=False)
+
+    status_parser = commands.add_parser(
+        'status', parents=[common],
+        help='Show completeness, partial files and size of local dumps')
+    status_parser.add_argument(
+        'DOWNLOAD_DIR',
+        help='Directory in which dumps are saved',
+    )
+    status_parser.add_argument(
+        'LANGUAGE', nargs='*',
+        help='Languages to show [default: all enabled and downloaded '
+             'languages]')
+    status_parser.add_argument(
+        '--remote',
+        action='store_true',
+        dest='remote',
+        default=False,
+        help='Look up the latest dump dates on the download site instead of '
+             'using the dates seen by the last download')
+    status_parser.set_defaults(**DOWNLOAD_DEFAULTS)
+
+    plan_parser = commands.add_parser(
+        'plan', parents=[common],
+        help='Print the URLs of all files that would be downloaded')
+    plan_parser.add_argument(
+        'LANGUAGE', nargs='*',
+        help='Languages to plan [default: all enabled languages]')
+    add_offline_option(plan_parser)
+    plan_parser.set_defaults(**DOWNLOAD_DEFAULTS)
+
+    verify_parser = commands.add_parser(
+        'verify', parents=[common],
+        help='Verify the latest downloaded dumps against their checksums')
+    verify_parser.add_argument(
+        'DOWNLOAD_DIR',
+        help='Directory in which dumps are saved',
+    )
+    verify_parser.add_argument(
+        'LANGUAGE', nargs='*',
+        help='Languages to verify [default: all downloaded languages]')
+    add_offline_option(verify_parser)
+    verify_parser.set_defaults(**DOWNLOAD_DEFAULTS)
+
+    manifest_parser = commands.add_parser(
+        'manifest', parents=[common],
+        help='Write block manifests of dump files for delta transfers')
+    manifest_parser.add_argument(
+        'PATH', nargs='+',
+        help='Dump files or directories that are searched for dump files')
+    manifest_parser.add_argument(
+        '--block-size',
+        type=int,
+        dest='block_size',
+        default=1024,
+        metavar='KB',
+        help='Size of the blocks in kilobytes [default: %(default)s]'
+    )
+
+    return parser
+
+
+def parse_args(argv):
+    """Parse command line arguments, download is the default command
+
+    :param argv:    Command line arguments without program name
+    :type argv:     list
+    """
+    parser = init_parser()
+    argv = list(argv)
+
+    # Options that take a value, their value is not a command
+    with_value = set(option for action in common_options()._actions
+                     if action.nargs != 0 for option in action.option_strings)
+
+    index = 0
+    while index < len(argv):
+        if argv[index] in with_value:
+            index += 2
+        elif argv[index].startswith('-'):
+            if argv[index] in ('-h', '--help', '--version'):
+                return parser.parse_args(argv[index:index + 1])
+            index += 1
+        else:
+            break
+
+    if index < len(argv) and argv[index] in COMMANDS:
+        argv.insert(0, argv.pop(index))
+    else:
+        argv.insert(0, 'download')
+    return parser.parse_args(argv)
+
+
+def init_logging(options):
+    """Initialise logging framework
+    """
+
+    error_handler = logging.StreamHandler(sys.stderr)
+    error_handler.setLevel(logging.ERROR)
+    error_handler.formatter = logging.Formatter('[%(levelname)s]: %(message)s')
+    LOG.addHandler(error_handler)
+    wpd.LOG.addHandler(error_handler)
+
+    if not options.quiet and options.verbose:
+        console = logging.StreamHandler()
+        console.setLevel(logging.INFO)
+        console.formatter = logging.Formatter('%(message)s')
+        console.addFilter(wpd.ErrorLimit())
+        LOG.addHandler(console)
+        wpd.LOG.addHandler(console)
+
+    if options.log_file:
+        log_file_handler = logging.FileHandler(
+            options.log_file)
+        log_file_handler.setLevel(
+            logging.getLevelName(options.log_file_level))
+        log_file_handler.formatter = logging.Formatter(
+            '[%(levelname)s]: %(message)s')
+        LOG.addHandler(log_file_handler)
+        wpd.LOG.addHandler(log_file_handler)
+
+    LOG.debug('Logging initialised')
+
+
+def critical_error(err, exit_code):
+    """Terminate program with given exit code
+
+    :param exit_code:   Exit code for sys.exit()
+    :type exit_code:    int
+    """
+    LOG.error(str(err))
+    sys.exit(exit_code)
+
+
+def download(args):
+    """Download dumps, run as daemon or distributed coordinator/worker"""
+
+    import wp_download.download as wpd_down
+
+    download_path = os.path.abspath(args.DOWNLOAD_DIR)
+    wp_down = wpd_down.WPDownloader(args)
+
+    if args.daemon:
+        import wp_download.daemon as wpd_daemon
+
+        wpd_daemon.serve(wp_down, download_path,
+                         wpd_daemon.parse_address(args.listen),
+                         args.keep_jobs)
+    elif args.coordinate:
+        import wp_download.distributed as wpd_dist
+
+        store = wpd_dist.LeaseStore(args.coordinate, args.lease_time,
+                                    args.retries)
+        transfers = []
+        for lang in wp_down.languages():
+            try:
+                transfers.extend(
+                    wp_down.transfers_for_language(lang, download_path))
+            except IOError:
+                LOG.error('Skipped: %s' % (lang))
+        LOG.info('Added %d work units' % (
+            store.add(transfers, download_path)))
+    elif args.worker:
+        import wp_download.distributed as wpd_dist
+
+        store = wpd_dist.LeaseStore(args.worker, args.lease_time,
+                                    args.retries)
+        wpd_dist.Worker(store, wp_down, download_path).run()
+    else:
+        wp_down.download_all_languages(download_path)
+    return 0
+
+
+def format_size(size):
+    """Get a human readable representation of a number of bytes"""
+
+    for unit in ('B', 'K', 'M', 'G'):
+        if size < 1024:
+            return '%.1f%s' % (size, unit) if unit != 'B' else '%d%s' % (
+                size, unit)
+        size /= 1024.0
+    return '%.1fT' % (size)
+
+
+def status(args):
+    """Show the status of the local dumps"""
+
+    import wp_download.config as wpd_conf
+    import wp_download.status as wpd_status
+
+    download_path = os.path.abspath(args.DOWNLOAD_DIR)
+
+    config = wpd_conf.Configuration(args)
+
+    if args.remote:
+        import wp_download.urls as wpd_urls
+
+        urlhandler = wpd_urls.URLHandler(config, args)
+        for language in args.LANGUAGE or urlhandler.languages():
+            try:
+                urlhandler.latest_dump_date(language)
+            except IOError as io_err:
+                LOG.error('Could not get dump date for %s!' % (language))
+                LOG.error(io_err)
+
+    rows = [('LANGUAGE', 'DATE', 'REMOTE', 'STATE', 'FILES', 'PARTIAL',
+             'VERIFIED', 'SIZE')]
+    for lang_status in wpd_status.status(config, download_path,
+                                         args.LANGUAGE):
+        expected = len(lang_status.files) + len(lang_status.missing)
+        rows.append((
+            lang_status.language,
+            lang_status.date or '-',
+            lang_status.remote_date or '-',
+            lang_status.state,
+            '%d/%d' % (len(lang_status.files), expected)
+            if lang_status.date else '-',
+            str(len(lang_status.partial)),
+            '%d/%d' % (len(lang_status.verified), len(lang_status.files)),
+            format_size(lang_status.size)))
+
+    widths = [max(len(row[column]) for row in rows)
+              for column in range(len(rows[0]))]
+    for row in rows:
+        sys.stdout.write('  '.join(
+            cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+            + '\n')
+    return 0
+
+
+def plan(args):
+    """Print the URLs of all files that would be downloaded"""
+
+    import wp_download.config as wpd_conf
+    import wp_download.urls as wpd_urls
+
+    urlhandler = wpd_urls.URLHandler(wpd_conf.Configuration(args), args)
+    languages = args.LANGUAGE or urlhandler.languages()
+    urls = urlhandler.urls_for_languages(languages)
+
+    for language in languages:
+        for url in urls.get(language, ()):
+            sys.stdout.write(url + '\n')
+    return 0
+
+
+def verify(args):
+    """Verify downloaded dumps against their published checksums"""
+
+    import datetime
+
+    import wp_download.config as wpd_conf
+    import wp_download.status as wpd_status
+    import wp_download.urls as wpd_urls
+    import wp_download.verify as wpd_verify
+
+    download_path = os.path.abspath(args.DOWNLOAD_DIR)
+    config = wpd_conf.Configuration(args)
+    urlhandler = wpd_urls.URLHandler(config, args)
+    plan = urlhandler.plan
+    dumps = wpd_status.DumpIndex(
+        download_path, wpd_status.index_file(config.cache_dir, download_path),
+        plan.layout).refresh()
+    languages = args.LANGUAGE or sorted(dumps)
+
+    failed = 0
+    for language in languages:
+        if not dumps.get(language):
+            LOG.error('No dump found: %s' % (language))
+            continue
+
+        date = datetime.datetime.strptime(max(dumps[language]), '%Y%m%d')
+        local_dir = plan.local_dir(language, date)
+        down_dir = os.path.join(download_path, local_dir)
+        url = plan.file_url(language, date, *wpd_verify.MD5SUMS)
+        md5sums = os.path.join(down_dir, os.path.basename(url))
+
+        if os.path.exists(md5sums):
+            with open(md5sums) as md5sums_file:
+                content = md5sums_file.read()
+        else:
+            try:
+                content = urlhandler.fetch(url)
+            except IOError as io_err:
+                LOG.error(io_err)
+                continue
+            with open(md5sums, 'w') as md5sums_file:
+                md5sums_file.write(content)
+
+        checksums = wpd_verify.parse_md5sums(content)
+
+        for filename, ok in sorted(wpd_verify.verify_directory(
+                down_dir, checksums).items()):
+            if not ok:
+                failed += 1
+            if not args.quiet or not ok:
+                sys.stdout.write('%s: %s\n' % (
+                    os.path.join(local_dir, filename),
+                    'OK' if ok else 'FAILED'))
+
+    return wpd_exc.EVERIFY if failed else 0
+
+
+def manifest_paths(paths):
+    """Get the dump files below paths
+
+    Hidden files and directories, partial downloads and manifests are left
+    out.
+
+    :param paths:   Files and directories
+    :type paths:    list
+    """
+    import wp_download.delta as wpd_delta
+
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames[:] = sorted(name for name in dirnames
+                                 if not name.startswith('.'))
+            for filename in sorted(filenames):
+                if not filename.startswith('.') and not filename.endswith(
+                        ('.part', '.tmp', wpd_delta.MANIFEST_SUFFIX)):
+                    yield os.path.join(dirpath, filename)
+
+
+def manifest(args):
+    """Write block manifests of dump files"""
+
+    import wp_download.delta as wpd_delta
+
+    if args.block_size <= 0:
+        LOG.error('Invalid block size: %d' % (args.block_size))
+        return wpd_exc.ECVALUE
+
+    for path in manifest_paths(args.PATH):
+        manifest_path = path + wpd_delta.MANIFEST_SUFFIX
+        if (os.path.exists(manifest_path) and
+                os.path.getmtime(manifest_path) >= os.path.getmtime(path)):
+            continue
+        LOG.info('Write manifest: %s' % (manifest_path))
+        wpd_delta.write_manifest(path, args.block_size * 1024)
+    return 0
+
+
+def main(argv=None):
+    """Run wp-download
+
+    :param argv:    Command line arguments without program name
+    :type argv:     list
+
+    :returns:       Exit status
+    :rtype:         int
+    """
+    try:
+        args = parse_args(sys.argv[1:] if argv is None else argv)
+        init_logging(args)
+
+        try:
+            return globals()[args.command](args)
+
+        except wpd_exc.ConfigParseError as cp_err:
+            critical_error(cp_err, wpd_exc.ECPARSE)
+
+        except wpd_exc.TemplateError as tpl_err:
+            critical_error(tpl_err, wpd_exc.ECTEMPLATE)
+
+        except wpd_exc.ConfigValueError as csv_err:
+            critical_error(csv_err, wpd_exc.ECVALUE)
+
+        except IOError as io_err:
+            critical_error(io_err, wpd_exc.EIO)
+
+    except KeyboardInterrupt:
+        LOG.warning('Interrupted by user!')
+    finally:
+        logging.shutdown()
@@ -18,10 +18,9 @@
 """Classes dealing with wp_download's configuration
 """
 
-from __future__ import with_statement
-
 import logging
-import ConfigParser
+import configparser
+import os
 import string
 
 import wp_download.exceptions as wpd_exc
@@ -30,7 +29,7 @@ LOG = logging.getLogger(__name__)
 LOG.setLevel(logging.DEBUG)
 
 
-class Configuration(ConfigParser.SafeConfigParser):
+class Configuration(configparser.ConfigParser):
     """
     Configuration file data.
     """
@@ -41,13 +40,22 @@ class Configuration(ConfigParser.SafeConfigParser):
 
         return self._options.config
 
+    @property
+    def cache_dir(self):
+        """Get directory for cached data, like the list of all wikis"""
+
+        return os.path.expanduser(self.get_default(
+            'Configuration', 'cache_dir', '~/.cache/wp-download'))
+
     def __init__(self, options):
         """
         Constructor.
         """
-        ConfigParser.SafeConfigParser.__init__(self)
+        # Later definitions of an option override earlier ones
+        configparser.ConfigParser.__init__(self, strict=False)
 
         self._options = options
+        self._enabled = {}
         self._parse_configuration()
 
     def _parse_configuration(self):
@@ -55,19 +63,41 @@ class Configuration(ConfigParser.SafeConfigParser):
         """
         try:
             with open(self.config_file_path) as config_file:
-                self.readfp(config_file)
-        except ConfigParser.ParsingError as parse_err:
+                self.read_file(config_file)
+        except configparser.ParsingError as parse_err:
             raise wpd_exc.ConfigParseError(
                 orig_err=parse_err, config_file=self.config_file_path)
         else:
             LOG.info('Read configuration from: %s' % (self.config_file_path))
 
+    def _read(self, fp, fpname):
+        self._enabled.clear()
+        configparser.ConfigParser._read(self, fp, fpname)
+
+    def set(self, section, option, value=None):
+        self._enabled.pop(section, None)
+        configparser.ConfigParser.set(self, section, option, value)
+
+    def remove_option(self, section, option):
+        self._enabled.pop(section, None)
+        return configparser.ConfigParser.remove_option(
+            self, section, option)
+
+    def remove_section(self, section):
+        self._enabled.pop(section, None)
+        return configparser.ConfigParser.remove_section(self, section)
+
     def enabled_options(self, section):
         """Generator of all enabled options in given section
 
+        The result is computed once per section and cached until the
+        configuration is modified.
+
         :param section: Name of the section
         :type section:  string
         """
+        if section in self._enabled:
+            return list(self._enabled[section])
 
         def _enabled_options(self):
             try:
@@ -78,7 +108,34 @@ class Configuration(ConfigParser.SafeConfigParser):
                 raise wpd_exc.ConfigValueError(
                     orig_err=val_err, config_file=self.config_file_path,
                     section=section)
-        return sorted(_enabled_options(self))
+
+        self._enabled[section] = tuple(sorted(_enabled_options(self)))
+        return list(self._enabled[section])
+
+    def get_default(self, section, option, default, getter=None):
+        """Get an option or a default value if it is not configured
+
+        :param section: Name of the section
+        :type section:  string
+
+        :param option:  Name of the option
+        :type option:   string
+
+        :param default: Value returned if the option is missing
+        :type default:  object
+
+        :param getter:  Method used to read the option, like getboolean
+        :type getter:   callable
+        """
+        if not self.has_option(section, option):
+            return default
+
+        try:
+            return (getter or self.get)(section, option)
+        except ValueError as val_err:
+            raise wpd_exc.ConfigValueError(
+                orig_err=val_err, config_file=self.config_file_path,
+                section=section)
 
     def string_template(self, template_name):
         """Get a string template from the configuration file
@@ -91,7 +148,7 @@ class Configuration(ConfigParser.SafeConfigParser):
         try:
             return string.Template(
                 self.get('Templates', template_name))
-        except ConfigParser.NoOptionError as nop_err:
+        except configparser.NoOptionError as nop_err:
             raise wpd_exc.TemplateMissingError(
                 orig_err=nop_err, config_file=self.config_file_path,
                 template=template_name)
@@ -0,0 +1,476 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+"""Long-running download daemon with an HTTP/JSON control API.
+
+The daemon keeps a single WPDownloader, so that configuration, cached dump
+dates and learned concurrency stay warm between jobs. Jobs are run one after
+another in the order they were submitted. The API understands:
+
+================================  ===========================================
+``GET /status``                   Daemon state and throughput
+``GET /jobs``                     All jobs
+``POST /jobs``                    Submit a job, the body is a JSON object
+                                  with the optional keys ``languages``,
+                                  ``files`` and ``custom_dump``
+``GET /jobs/<id>``                A single job
+``POST /jobs/<id>/pause``         Do not start further transfers of a job
+``POST /jobs/<id>/resume``        Resume a paused job
+================================  ===========================================
+
+Only the most recent finished jobs are kept, see ``--keep-jobs``.
+"""
+
+import datetime
+import http.server
+import json
+import logging
+import os
+import re
+import socketserver
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.DEBUG)
+
+DEFAULT_ADDRESS = ('127.0.0.1', 8642)
+
+# Number of finished jobs that are kept
+DEFAULT_KEEP_JOBS = 100
+
+
+def parse_address(address):
+    """Parse an address of the form [HOST:]PORT
+
+    :param address: The address
+    :type address:  string
+
+    :returns:       Tuple of (host, port)
+    :rtype:         tuple
+    """
+    host, _, port = address.rpartition(':')
+    return (host or DEFAULT_ADDRESS[0], int(port))
+
+
+def _string_list(name, value):
+    """Check that a job parameter is a list of strings
+
+    :raises ValueError: If value is neither None nor a list of strings
+
+    :returns:   The list, empty for None
+    :rtype:     list
+    """
+    if value is None:
+        return []
+    if not isinstance(value, list) or not all(
+            isinstance(item, str) for item in value):
+        raise ValueError('%s must be a list of strings' % (name))
+    return list(value)
+
+
+class Job(object):
+    """
+    A download job submitted to the daemon.
+    """
+
+    def __init__(self, job_id, languages=None, files=None, custom_dump=None):
+        """
+        Constructor.
+
+        :param job_id:      Identifier of the job
+        :type job_id:       int
+
+        :param languages:   Languages to download, all enabled if empty
+        :type languages:    list
+
+        :param files:       Files to download, all enabled if empty
+        :type files:        list
+
+        :param custom_dump: Dumps of specific dates, like en:20150603
+        :type custom_dump:  list
+
+        :raises ValueError: If a parameter is not a list of strings or
+                            custom_dump contains invalid dates
+        """
+        self.id = job_id
+        self.languages = _string_list('languages', languages)
+        self.files = _string_list('files', files)
+        self.dates = dict(
+            (lang, datetime.datetime.strptime(date, '%Y%m%d'))
+            for lang, date in (pair.split(':', 1) for pair in _string_list(
+                'custom_dump', custom_dump)))
+        for language in self.dates:
+            if language not in self.languages:
+                self.languages.append(language)
+
+        self.state = 'queued'
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.transfers = []
+        self.errors = []
+        self.initial_bytes = 0
+        self._resumed = threading.Event()
+        self._resumed.set()
+
+    @property
+    def paused(self):
+        """Is the job paused?"""
+
+        return not self._resumed.is_set()
+
+    def pause(self):
+        """Do not start any further transfers"""
+
+        self._resumed.clear()
+
+    def resume(self):
+        """Start transfers again"""
+
+        self._resumed.set()
+
+    def wait(self, transfer=None):
+        """Block while the job is paused"""
+
+        self._resumed.wait()
+
+    def downloaded_bytes(self):
+        """Get the number of bytes of all files of the job on disk"""
+
+        downloaded = 0
+        for transfer in self.transfers:
+            for path in (transfer.path, transfer.path + '.part'):
+                if os.path.exists(path):
+                    downloaded += os.path.getsize(path)
+                    break
+        return downloaded
+
+    def to_dict(self):
+        """Get a JSON serialisable description of the job"""
+
+        complete = sum(1 for transfer in self.transfers
+                       if os.path.exists(transfer.path))
+        downloaded = self.downloaded_bytes()
+        elapsed = (self.finished or time.time()) - (self.started or 0)
+
+        return {
+            'id': self.id,
+            'state': 'paused' if self.paused and self.state in (
+                'queued', 'running') else self.state,
+            'languages': self.languages,
+            'files': self.files,
+            'custom_dump': ['%s:%s' % (lang, date.strftime('%Y%m%d'))
+                            for lang, date in sorted(self.dates.items())],
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'errors': self.errors,
+            'transfers': len(self.transfers),
+            'complete': complete,
+            'bytes': downloaded,
+            'rate': ((downloaded - self.initial_bytes) / elapsed
+                     if self.started and elapsed > 0 else 0.0),
+        }
+
+
+class Daemon(object):
+    """
+    Queue of download jobs run by a single downloader.
+    """
+
+    def __init__(self, downloader, path, keep_jobs=DEFAULT_KEEP_JOBS):
+        """
+        Constructor.
+
+        :param downloader:  Downloader that runs the jobs
+        :type downloader:   wp_download.download.WPDownloader
+
+        :param path:        Base path of the language directories
+        :type path:         string
+
+        :param keep_jobs:   Number of finished jobs that are kept, older ones
+                            are forgotten
+        :type keep_jobs:    int
+        """
+        self._downloader = downloader
+        self._path = path
+        self._keep_jobs = keep_jobs
+        self._jobs = []
+        self._next_id = 1
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._runner = None
+
+    def submit(self, languages=None, files=None, custom_dump=None):
+        """Add a job to the queue
+
+        :raises ValueError: If custom_dump contains invalid dates
+
+        :returns:   The job
+        :rtype:     Job
+        """
+        with self._cond:
+            job = Job(self._next_id, languages, files, custom_dump)
+            self._next_id += 1
+            self._jobs.append(job)
+            self._expire()
+            self._cond.notify_all()
+            LOG.info('Queued job %d' % (job.id))
+            return job
+
+    def _expire(self):
+        """Forget the oldest finished jobs beyond keep_jobs"""
+
+        finished = [job for job in self._jobs
+                    if job.state in ('done', 'failed')]
+        for job in finished[:max(0, len(finished) - self._keep_jobs)]:
+            self._jobs.remove(job)
+
+    def job(self, job_id):
+        """Get job with given id, None if there is no such job"""
+
+        with self._cond:
+            for job in self._jobs:
+                if job.id == job_id:
+                    return job
+        return None
+
+    def jobs(self):
+        """Get all jobs"""
+
+        with self._cond:
+            return list(self._jobs)
+
+    def resume(self, job):
+        """Resume a paused job"""
+
+        with self._cond:
+            job.resume()
+            self._cond.notify_all()
+
+    def status(self):
+        """Get the state of the daemon
+
+        :rtype: dict
+        """
+        with self._cond:
+            states = [job.to_dict()['state'] for job in self._jobs]
+            running = [job.id for job in self._jobs
+                       if job.state == 'running']
+        return {
+            'jobs': dict((state, states.count(state))
+                         for state in set(states)),
+            'running': running,
+            'throughput': self._downloader.throughput(),
+        }
+
+    def _next_job(self):
+        """Wait for the next queued job that is not paused, None on stop"""
+
+        with self._cond:
+            while not self._stopped:
+                for job in self._jobs:
+                    if job.state == 'queued' and not job.paused:
+                        job.state = 'running'
+                        return job
+                self._cond.wait(1)
+        return None
+
+    def _run_job(self, job):
+        """Run all transfers of a job"""
+
+        LOG.info('Start job %d' % (job.id))
+        job.started = time.time()
+
+        try:
+            languages = job.languages or self._downloader.languages()
+            for language in languages:
+                try:
+                    job.transfers.extend(
+                        transfer for transfer in
+                        self._downloader.transfers_for_language(
+                            language, self._path, job.dates.get(language))
+                        if not job.files or transfer.filename in job.files)
+                except IOError as io_err:
+                    LOG.error('Skipped: %s (%s)' % (language, io_err))
+                    job.errors.append('%s: %s' % (language, io_err))
+
+            if not job.transfers:
+                raise ValueError('No files to download')
+
+            job.initial_bytes = job.downloaded_bytes()
+            self._downloader.download_transfers(job.transfers, job.wait)
+        except Exception as err:
+            LOG.error('Job %d failed: %s' % (job.id, err))
+            job.errors.append(str(err))
+            job.state = 'failed'
+        else:
+            job.state = 'done'
+        finally:
+            job.finished = time.time()
+            LOG.info('Finished job %d' % (job.id))
+            with self._cond:
+                self._expire()
+
+    def run(self):
+        """Run queued jobs until stop() is called"""
+
+        job = self._next_job()
+        while job:
+            self._run_job(job)
+            job = self._next_job()
+
+    def start(self):
+        """Run queued jobs in a background thread"""
+
+        self._runner = threading.Thread(target=self.run, name='jobs')
+        self._runner.daemon = True
+        self._runner.start()
+
+    def stop(self):
+        """Stop after the running job is done"""
+
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Handler for requests to the control API.
+    """
+
+    _job_url = re.compile(r'^/jobs/(\d+)(?:/(pause|resume))?/?$')
+
+    def log_message(self, format, *args):
+        LOG.debug('%s - %s' % (self.address_string(), format % args))
+
+    def _reply(self, code, content):
+        """Send content as JSON response"""
+
+        body = json.dumps(content, sort_keys=True).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, code, message):
+        """Send an error as JSON response"""
+
+        self._reply(code, {'error': message})
+
+    def do_GET(self):
+        """Handle GET requests"""
+
+        daemon = self.server.daemon
+        path = self.path.rstrip('/')
+
+        if path == '/status':
+            return self._reply(200, daemon.status())
+
+        if path == '/jobs':
+            return self._reply(200, [job.to_dict() for job in daemon.jobs()])
+
+        match = self._job_url.match(self.path)
+        if match and not match.group(2):
+            job = daemon.job(int(match.group(1)))
+            if job:
+                return self._reply(200, job.to_dict())
+            return self._error(404, 'No such job')
+
+        self._error(404, 'Not found')
+
+    def do_POST(self):
+        """Handle POST requests"""
+
+        daemon = self.server.daemon
+
+        if self.path.rstrip('/') == '/jobs':
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                request = json.loads(self.rfile.read(length) or b'{}')
+                job = daemon.submit(request.get('languages'),
+                                    request.get('files'),
+                                    request.get('custom_dump'))
+            except (ValueError, AttributeError) as err:
+                return self._error(400, str(err))
+            return self._reply(201, job.to_dict())
+
+        match = self._job_url.match(self.path)
+        if match and match.group(2):
+            job = daemon.job(int(match.group(1)))
+            if not job:
+                return self._error(404, 'No such job')
+            if match.group(2) == 'pause':
+                job.pause()
+            else:
+                daemon.resume(job)
+            return self._reply(200, job.to_dict())
+
+        self._error(404, 'Not found')
+
+
+class ControlServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """
+    HTTP server of the control API.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, daemon):
+        """
+        Constructor.
+
+        :param address: Tuple of (host, port) to listen on
+        :type address:  tuple
+
+        :param daemon:  The daemon that is controlled
+        :type daemon:   Daemon
+        """
+        http.server.HTTPServer.__init__(self, address, RequestHandler)
+        self.daemon = daemon
+
+
+def serve(downloader, path, address=DEFAULT_ADDRESS,
+          keep_jobs=DEFAULT_KEEP_JOBS):
+    """Run the daemon and its control API until interrupted
+
+    :param downloader:  Downloader that runs the jobs
+    :type downloader:   wp_download.download.WPDownloader
+
+    :param path:        Base path of the language directories
+    :type path:         string
+
+    :param address:     Tuple of (host, port) to listen on
+    :type address:      tuple
+
+    :param keep_jobs:   Number of finished jobs that are kept
+    :type keep_jobs:    int
+    """
+    daemon = Daemon(downloader, path, keep_jobs)
+    server = ControlServer(address, daemon)
+
+    LOG.info('Listening on http://%s:%d/' % server.server_address)
+    daemon.start()
+    try:
+        server.serve_forever()
+    finally:
+        daemon.stop()
+        server.server_close()
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+"""Block manifests for delta transfers.
+
+A manifest lists the MD5 checksums of the fixed size blocks of a file. It is
+published next to the file as ``<file>.blocks``::
+
+    {"size": 3145728, "block_size": 1048576, "md5": "...",
+     "blocks": ["...", "...", "..."]}
+
+Blocks of a new dump that are found in the same file of the previous dump
+are copied from the local copy, only the others are fetched with range
+requests. Blocks are looked up at block boundaries of the previous file, so
+unchanged files, appended data and changes that keep the block alignment
+are found.
+"""
+
+import hashlib
+import json
+import os
+
+MANIFEST_SUFFIX = '.blocks'
+
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+
+def _blocks(path, block_size):
+    """Generator of the blocks of the file at path"""
+
+    with open(path, 'rb') as local_file:
+        for block in iter(lambda: local_file.read(block_size), b''):
+            yield block
+
+
+def make_manifest(path, block_size=DEFAULT_BLOCK_SIZE):
+    """Get the manifest of the file at path
+
+    :param path:        Path of the file
+    :type path:         string
+
+    :param block_size:  Size of the blocks in bytes
+    :type block_size:   int
+
+    :rtype:             dict
+    """
+    digest = hashlib.md5()
+    blocks = []
+    for block in _blocks(path, block_size):
+        digest.update(block)
+        blocks.append(hashlib.md5(block).hexdigest())
+    return {'size': os.path.getsize(path), 'block_size': block_size,
+            'md5': digest.hexdigest(), 'blocks': blocks}
+
+
+def write_manifest(path, block_size=DEFAULT_BLOCK_SIZE):
+    """Write the manifest of the file at path next to it
+
+    :returns:   Path of the manifest
+    :rtype:     string
+    """
+    manifest_path = path + MANIFEST_SUFFIX
+    tmp_path = '%s.%d.tmp' % (manifest_path, os.getpid())
+    with open(tmp_path, 'w') as manifest_file:
+        json.dump(make_manifest(path, block_size), manifest_file,
+                  sort_keys=True)
+    os.rename(tmp_path, manifest_path)
+    return manifest_path
+
+
+def parse_manifest(content):
+    """Get a manifest from its JSON representation
+
+    :param content: The manifest
+    :type content:  string
+
+    :raises ValueError: If the manifest is not valid
+
+    :rtype:         dict
+    """
+    manifest = json.loads(content)
+    try:
+        size, block_size = int(manifest['size']), int(manifest['block_size'])
+        blocks = [str(block) for block in manifest['blocks']]
+        md5 = str(manifest['md5'])
+    except (KeyError, TypeError) as err:
+        raise ValueError('Invalid manifest: %s' % (err))
+    if block_size <= 0 or len(blocks) != (size + block_size - 1) // block_size:
+        raise ValueError('Invalid manifest: Wrong number of blocks')
+    return {'size': size, 'block_size': block_size, 'md5': md5,
+            'blocks': blocks}
+
+
+def index_blocks(path, block_size):
+    """Get the offsets of the blocks of a local file by their checksum
+
+    :param path:        Path of the file
+    :type path:         string
+
+    :param block_size:  Size of the blocks in bytes
+    :type block_size:   int
+
+    :rtype:             dict
+    """
+    index = {}
+    for number, block in enumerate(_blocks(path, block_size)):
+        index.setdefault(hashlib.md5(block).hexdigest(), number * block_size)
+    return index
+
+
+def plan_blocks(manifest, index):
+    """Get the steps that assemble the file of a manifest
+
+    Adjacent blocks that have to be fetched are merged into a single range.
+
+    :param manifest:    Manifest of the remote file
+    :type manifest:     dict
+
+    :param index:       Local blocks, see index_blocks()
+    :type index:        dict
+
+    :returns:           Tuples of (offset, length, source). Source is the
+                        offset of the block in the local file, None if the
+                        range has to be fetched.
+    :rtype:             list
+    """
+    size, block_size = manifest['size'], manifest['block_size']
+    steps = []
+    for number, checksum in enumerate(manifest['blocks']):
+        offset = number * block_size
+        length = min(block_size, size - offset)
+        source = index.get(checksum)
+        if source is None and steps and steps[-1][2] is None:
+            steps[-1] = (steps[-1][0], steps[-1][1] + length, None)
+        else:
+            steps.append((offset, length, source))
+    return steps
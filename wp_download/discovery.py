@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+"""Discovery of all wikis that are dumped on the download site.
+
+Wikis are identified by their database name, like ``enwiki`` or
+``dewiktionary``. Within wp-download Wikipedias keep being identified by
+their language code, while wikis of other projects are identified by their
+full database name. This keeps the ``<lang>/<date>`` layout of existing
+download directories intact.
+"""
+
+import fnmatch
+import logging
+import os
+import re
+import time
+
+from contextlib import closing
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.DEBUG)
+
+# Project suffixes of database names, 'wiki' (Wikipedia) has to be last
+PROJECTS = ('wiktionary', 'wikibooks', 'wikinews', 'wikiquote', 'wikisource',
+            'wikiversity', 'wikivoyage', 'wiki')
+
+DEFAULT_INDEX_URL = 'http://dumps.wikimedia.org/backup-index.html'
+
+_DBNAME_MATCHER = re.compile(r'<a href="([a-z0-9_]+)/\d{8}">')
+
+
+def split_dbname(dbname):
+    """Split a database name into language code and project
+
+    :param dbname:  Database name, like enwiktionary
+    :type dbname:   string
+
+    :returns:       Tuple of (langcode, project), like ('en', 'wiktionary')
+    :rtype:         tuple
+    """
+    for project in PROJECTS:
+        if dbname.endswith(project) and len(dbname) > len(project):
+            return dbname[:-len(project)], project
+    return dbname, ''
+
+
+def wiki_key(dbname):
+    """Get the identifier used for the wiki with given database name
+
+    :param dbname:  Database name, like enwiki or enwiktionary
+    :type dbname:   string
+
+    :returns:       The language code for Wikipedias, dbname otherwise
+    :rtype:         string
+    """
+    langcode, project = split_dbname(dbname)
+    if project == 'wiki':
+        return langcode
+    return dbname
+
+
+def split_key(key):
+    """Split a wiki identifier into language code and project
+
+    :param key:     Wiki identifier, like en or enwiktionary
+    :type key:      string
+
+    :returns:       Tuple of (langcode, project)
+    :rtype:         tuple
+    """
+    langcode, project = split_dbname(key)
+    if project and project != 'wiki':
+        return langcode, project
+    return key, 'wiki'
+
+
+def parse_wiki_list(content):
+    """Get all database names listed in content
+
+    Both the HTML index of the download site and plain lists with one
+    database name per line are understood.
+
+    :param content: Content of the wiki list
+    :type content:  string
+
+    :returns:       Sorted database names
+    :rtype:         list
+    """
+    if '<a href=' in content:
+        dbnames = _DBNAME_MATCHER.findall(content)
+    else:
+        dbnames = [line.strip() for line in content.splitlines()
+                   if line.strip() and not line.startswith('#')]
+    return sorted(set(dbnames))
+
+
+class WikiList(object):
+    """
+    List of all wikis on the download site, filtered by the patterns in the
+    ``[Discovery]`` section of the configuration.
+    """
+
+    def __init__(self, config, offline=False):
+        """
+        Constructor.
+
+        :param config:  Configuration
+        :type config:   wp_download.config.Configuration
+
+        :param offline: Use the cached list regardless of its age
+        :type offline:  boolean
+        """
+        self._config = config
+        self._offline = offline
+        self._source = config.get_default(
+            'Discovery', 'index_url', DEFAULT_INDEX_URL)
+        self._include = config.get_default(
+            'Discovery', 'include', '*wiki').split()
+        self._exclude = config.get_default(
+            'Discovery', 'exclude', '').split()
+        self._max_age = config.get_default(
+            'Discovery', 'max_age', 24 * 60 * 60, config.getint)
+        self._cache_file = os.path.join(config.cache_dir, 'wikis.dblist')
+
+    def _fetch(self):
+        """Get the content of the wiki list from its source"""
+
+        if os.path.exists(os.path.expanduser(self._source)):
+            with open(os.path.expanduser(self._source)) as list_file:
+                return list_file.read()
+
+        if self._offline:
+            raise IOError('Not cached (offline): %s' % (self._source))
+
+        # Only imported when the list is retrieved, it is slow to import
+        import urllib.request
+
+        LOG.info('Retrieve list of wikis: %s' % (self._source))
+        with closing(urllib.request.urlopen(self._source)) as remote_file:
+            if remote_file.getcode() >= 300:
+                raise IOError('Got HTTP response code: %d for %s' % (
+                    remote_file.getcode(), self._source))
+            return remote_file.read().decode('utf-8')
+
+    def _cache_is_fresh(self):
+        """Is the cached wiki list younger than max_age?"""
+
+        try:
+            age = time.time() - os.path.getmtime(self._cache_file)
+        except OSError:
+            return False
+        return age < self._max_age
+
+    def _write_cache(self, dbnames):
+        """Save the list of database names to the cache file"""
+
+        cache_dir = os.path.dirname(self._cache_file)
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        tmp_path = self._cache_file + '.tmp'
+        with open(tmp_path, 'w') as cache_file:
+            cache_file.write('\n'.join(dbnames) + '\n')
+        os.rename(tmp_path, self._cache_file)
+
+    def dbnames(self):
+        """Get the database names of all wikis on the download site
+
+        The list is read from the cache if it is younger than max_age and
+        retrieved with a single request otherwise. A stale cache is used if
+        the list cannot be retrieved or in offline mode.
+
+        :raises IOError:    If the list is neither cached nor retrievable,
+                            like in offline mode
+
+        :returns:   Sorted database names
+        :rtype:     list
+        """
+        if not self._cache_is_fresh() and not (
+                self._offline and os.path.exists(self._cache_file)):
+            try:
+                self._write_cache(parse_wiki_list(self._fetch()))
+            except IOError as io_err:
+                if not os.path.exists(self._cache_file):
+                    raise
+                LOG.error(io_err)
+                LOG.error('Use cached list of wikis: %s' % (self._cache_file))
+
+        with open(self._cache_file) as cache_file:
+            return parse_wiki_list(cache_file.read())
+
+    def matches(self, dbname):
+        """Does dbname match the include but none of the exclude patterns?
+
+        :param dbname:  Database name
+        :type dbname:   string
+        """
+        return (any(fnmatch.fnmatchcase(dbname, pat) for pat in self._include)
+                and not any(fnmatch.fnmatchcase(dbname, pat)
+                            for pat in self._exclude))
+
+    def keys(self):
+        """Get the identifiers of all selected wikis
+
+        :returns:   Sorted wiki identifiers, see wiki_key()
+        :rtype:     list
+        """
+        return sorted(wiki_key(dbname) for dbname in self.dbnames()
+                      if self.matches(dbname))
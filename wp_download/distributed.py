@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+"""Coordination of downloads across several worker nodes.
+
+A coordinator writes the planned transfers as work units into a SQLite
+database on shared storage. Workers lease units from the database, extend
+their leases with heartbeats while downloading and mark units as done or
+failed. Leases of crashed or disconnected workers expire and the units are
+handed out again. Every worker writes to its own partial file and gives up
+a transfer once its lease is lost.
+
+Units store their path relative to the download directory, so that workers
+can mount the shared download directory at different places.
+"""
+
+import logging
+import os
+import re
+import socket
+import sqlite3
+import threading
+import time
+
+from contextlib import contextmanager
+
+import wp_download.schedule as wpd_sched
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.DEBUG)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    key TEXT PRIMARY KEY,
+    language TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    url TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+)
+"""
+
+
+def default_worker_id():
+    """Get an identifier for this worker process"""
+
+    return '%s:%d' % (socket.gethostname(), os.getpid())
+
+
+class LeaseStore(object):
+    """
+    Work units and their leases in a SQLite database.
+    """
+
+    def __init__(self, path, lease_time=60.0, max_attempts=3):
+        """
+        Constructor.
+
+        :param path:            Path of the SQLite database
+        :type path:             string
+
+        :param lease_time:      Seconds a lease is valid without heartbeat
+        :type lease_time:       float
+
+        :param max_attempts:    Number of attempts before a unit fails
+        :type max_attempts:     int
+        """
+        self.path = path
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+
+        with self._transaction() as conn:
+            conn.execute(SCHEMA)
+
+    def _connection(self):
+        """Get the database connection of the current thread"""
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=60,
+                                   isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Run the enclosed statements in an immediate transaction"""
+
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+
+    def close(self):
+        """Close the database connection of the current thread"""
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def add(self, transfers, path):
+        """Add transfers as work units, existing units are left untouched
+
+        :param transfers:   The transfers
+        :type transfers:    iterable of wp_download.schedule.Transfer
+
+        :param path:        Download directory the transfer paths are in
+        :type path:         string
+
+        :returns:           Number of added units
+        :rtype:             int
+        """
+        with self._transaction() as conn:
+            before = conn.execute('SELECT COUNT(*) FROM units').fetchone()[0]
+            conn.executemany(
+                'INSERT OR IGNORE INTO units '
+                '(key, language, filename, url, path, size, priority) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(t.key, t.language, t.filename, t.url,
+                  os.path.relpath(t.path, path), t.size, t.priority)
+                 for t in transfers])
+            after = conn.execute('SELECT COUNT(*) FROM units').fetchone()[0]
+        return after - before
+
+    def lease(self, worker):
+        """Lease the next available unit
+
+        Units are available if they are pending or their lease has expired.
+
+        :param worker:  Identifier of the worker
+        :type worker:   string
+
+        :returns:       The leased unit, None if no unit is available
+        :rtype:         sqlite3.Row
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE units SET state = 'failed', error = 'Lease expired' "
+                "WHERE state = 'leased' AND lease_expires < ? AND "
+                "attempts >= ?", (now, self.max_attempts))
+            unit = conn.execute(
+                "SELECT * FROM units WHERE state = 'pending' OR "
+                "(state = 'leased' AND lease_expires < ?) "
+                "ORDER BY priority DESC, key LIMIT 1", (now,)).fetchone()
+            if unit is None:
+                return None
+
+            if unit['state'] == 'leased':
+                LOG.info('Lease of %s by %s expired' % (
+                    unit['key'], unit['worker']))
+
+            conn.execute(
+                "UPDATE units SET state = 'leased', worker = ?, "
+                "lease_expires = ?, attempts = attempts + 1 WHERE key = ?",
+                (worker, now + self.lease_time, unit['key']))
+            return conn.execute('SELECT * FROM units WHERE key = ?',
+                                (unit['key'],)).fetchone()
+
+    def heartbeat(self, key, worker):
+        """Extend the lease of a unit
+
+        :returns:   False if the worker does not hold the lease anymore
+        :rtype:     boolean
+        """
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE units SET lease_expires = ? WHERE key = ? AND "
+                "worker = ? AND state = 'leased'",
+                (time.time() + self.lease_time, key, worker)).rowcount == 1
+
+    def complete(self, key, worker):
+        """Mark a leased unit as done
+
+        :returns:   False if the worker does not hold the lease anymore
+        :rtype:     boolean
+        """
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE units SET state = 'done', lease_expires = NULL, "
+                "error = NULL WHERE key = ? AND worker = ? AND "
+                "state = 'leased'", (key, worker)).rowcount == 1
+
+    def fail(self, key, worker, error):
+        """Give back a leased unit after a failed attempt
+
+        The unit is handed out again unless it has been attempted
+        max_attempts times. Units that are no longer leased by worker are
+        left alone.
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE units SET state = CASE WHEN attempts < ? "
+                "THEN 'pending' ELSE 'failed' END, lease_expires = NULL, "
+                "error = ? WHERE key = ? AND worker = ? AND state = 'leased'",
+                (self.max_attempts, error, key, worker))
+
+    def summary(self):
+        """Get the number of units in each state
+
+        :rtype: dict
+        """
+        conn = self._connection()
+        return dict((row[0], row[1]) for row in conn.execute(
+            'SELECT state, COUNT(*) FROM units GROUP BY state'))
+
+    def unfinished(self):
+        """Get the number of units that are pending or leased"""
+
+        conn = self._connection()
+        return conn.execute(
+            "SELECT COUNT(*) FROM units WHERE state IN ('pending', 'leased')"
+        ).fetchone()[0]
+
+
+class Heartbeat(threading.Thread):
+    """
+    Thread that extends the lease of a unit until it is stopped.
+    """
+
+    def __init__(self, store, key, worker):
+        threading.Thread.__init__(self, name='heartbeat')
+        self.daemon = True
+        self._store = store
+        self._key = key
+        self._worker = worker
+        self._stopped = threading.Event()
+        self.lost = False
+
+    def run(self):
+        try:
+            while not self._stopped.wait(self._store.lease_time / 3.0):
+                if not self._store.heartbeat(self._key, self._worker):
+                    LOG.error('Lost lease of %s' % (self._key))
+                    self.lost = True
+                    return
+        finally:
+            self._store.close()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+class Worker(object):
+    """
+    Downloads leased units until no unit is left.
+    """
+
+    def __init__(self, store, downloader, path, worker_id=None,
+                 poll_interval=5.0):
+        """
+        Constructor.
+
+        :param store:       Work units
+        :type store:        LeaseStore
+
+        :param downloader:  Downloader that performs the transfers
+        :type downloader:   wp_download.download.WPDownloader
+
+        :param path:        Download directory of this worker
+        :type path:         string
+
+        :param worker_id:   Identifier of this worker
+        :type worker_id:    string
+
+        :param poll_interval:   Seconds to wait for units leased by other
+                                workers to finish or expire
+        :type poll_interval:    float
+        """
+        self._store = store
+        self._downloader = downloader
+        self._path = path
+        self.worker_id = worker_id or default_worker_id()
+        self._poll_interval = poll_interval
+
+    def _transfer(self, unit):
+        """Get the transfer of a unit"""
+
+        return wpd_sched.Transfer(
+            unit['language'], unit['filename'], unit['url'],
+            os.path.join(self._path, unit['path']), size=unit['size'],
+            priority=unit['priority'])
+
+    @property
+    def part_suffix(self):
+        """Suffix of the partial files of this worker
+
+        Every worker writes to its own partial file, so that a worker that
+        lost its lease cannot write into the file of the worker that holds
+        it now.
+        """
+        return '.%s.part' % (re.sub(r'[^\w.-]', '_', self.worker_id))
+
+    def process(self, unit):
+        """Download a single leased unit
+
+        The transfer is given up as soon as the lease is lost, and the unit
+        is only completed while the lease is held.
+        """
+
+        transfer = self._transfer(unit)
+        down_dir = os.path.dirname(transfer.path)
+        if not os.path.exists(down_dir):
+            try:
+                os.makedirs(down_dir)
+            except OSError:
+                # Created by another worker in the meantime
+                pass
+
+        heartbeat = Heartbeat(self._store, transfer.key, self.worker_id)
+        heartbeat.start()
+        try:
+            complete = self._downloader.download_transfer(
+                transfer, self.part_suffix, lambda: not heartbeat.lost)
+        finally:
+            heartbeat.stop()
+
+        if heartbeat.lost:
+            return
+        if complete:
+            if self._store.complete(transfer.key, self.worker_id):
+                # The last unit of a staged dump publishes it
+                self._downloader.publish(down_dir)
+        else:
+            self._store.fail(transfer.key, self.worker_id,
+                             'Download failed on %s' % (self.worker_id))
+
+    def run(self):
+        """Process units until all units are done or failed"""
+
+        LOG.info('Worker %s started' % (self.worker_id))
+        while True:
+            unit = self._store.lease(self.worker_id)
+            if unit is not None:
+                LOG.info('Leased: %s' % (unit['key']))
+                try:
+                    self.process(unit)
+                except Exception as err:
+                    LOG.error('Failed: %s (%s)' % (unit['key'], err))
+                    self._store.fail(unit['key'], self.worker_id, str(err))
+            elif self._store.unfinished():
+                time.sleep(self._poll_interval)
+            else:
+                break
+        LOG.info('Worker %s finished: %s' % (
+            self.worker_id, self._store.summary()))
@@ -18,21 +18,39 @@
 """Classes for retrieving Wikipedia dumps.
 """
 
-from __future__ import with_statement
-
+import dataclasses
 import logging
-import urllib
+import fnmatch
+import hashlib
+import http.client
+import itertools
 import os
-import urlparse
 import re
 import datetime
-import progressbar
 import socket
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
 
-from contextlib import nested, closing
+from contextlib import closing
+from typing import Optional
 
 import wp_download.exceptions as wpd_exc
+
+from wp_download import ErrorLimit
+import wp_download.adaptive as wpd_adapt
 import wp_download.config as wpd_conf
+import wp_download.delta as wpd_delta
+import wp_download.peers as wpd_peers
+import wp_download.publish as wpd_publish
+import wp_download.schedule as wpd_sched
+import wp_download.sqlfilter as wpd_filter
+import wp_download.verify as wpd_verify
+import wp_download.writer as wpd_writer
+
+from wp_download.urls import URLHandler
 
 LOG = logging.getLogger(__name__)
 LOG.setLevel(logging.DEBUG)
@@ -45,6 +63,8 @@ def init_progressbar(path, maxval):
     :type maximum:  int
     """
 
+    import progressbar
+
     widgets = [os.path.basename(path), ' ',
                progressbar.Bar(left='[', right=']', marker='*'), ' ',
                progressbar.Percentage(), ' ', progressbar.ETA(), ' ',
@@ -53,32 +73,256 @@ def init_progressbar(path, maxval):
     return progressbar.ProgressBar(widgets=widgets, maxval=maxval)
 
 
-class ErrorLimit(logging.Filter):
-    """Discard all records with a level higher or equal to
-    logging.ERROR
+def free_space(path):
+    """Get the device and the number of bytes available at path
+
+    :param path:    Path on the file system in question
+    :type path:     string
+
+    :returns:       Tuple of (device id, available bytes)
+    :rtype:         (int, int)
     """
+    stat = os.statvfs(path)
+    return os.stat(path).st_dev, stat.f_bavail * stat.f_frsize
 
-    def filter(self, record):
-        """Filter log record by level
 
-        :param record:  Log record in question
-        :type record:   logging.LogRecord
-        """
+_FALLOC_FL_KEEP_SIZE = 0x01
+_fallocate = None
+
+
+def preallocate(file_obj, length):
+    """Allocate disk blocks for length bytes behind the end of file_obj.
+
+    The apparent size of the file is not changed, so that partial downloads
+    can still be detected and resumed by their size. Preallocation is only
+    supported on Linux and silently skipped elsewhere.
+
+    :param file_obj:    File the blocks should be allocated for
+    :type file_obj:     file
+
+    :param length:      Number of bytes to allocate
+    :type length:       int
+
+    :returns:           True if the blocks were allocated, False otherwise
+    :rtype:             boolean
+    """
+    global _fallocate
 
-        if record.levelno < logging.ERROR:
-            return True
+    if _fallocate is None:
+        import ctypes
+        import ctypes.util
+
+        _fallocate = False
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            _fallocate = libc.fallocate
+            _fallocate.argtypes = [ctypes.c_int, ctypes.c_int,
+                                   ctypes.c_longlong, ctypes.c_longlong]
+        except (OSError, AttributeError):
+            LOG.debug('Preallocation is not supported on this platform')
+
+    if not _fallocate or length <= 0:
         return False
 
+    file_obj.flush()
+    offset = os.fstat(file_obj.fileno()).st_size
+    return _fallocate(file_obj.fileno(), _FALLOC_FL_KEEP_SIZE,
+                      offset, length) == 0
+
+
+class SpaceReservation(object):
+    """Disk space claimed by a single transfer.
+    """
+
+    def __init__(self, reservations, device, size):
+        """
+        Constructor.
+        """
+        self._reservations = reservations
+        self.device = device
+        self.remaining = size
+
+    def consume(self, size):
+        """Account for size bytes that have been written to disk
+
+        :param size:    Number of bytes written
+        :type size:     int
+        """
+        self.remaining = max(0, self.remaining - size)
+
+    def release(self):
+        """Give back all space still claimed by this reservation"""
+        self._reservations.release(self)
+
 
-class PartialDownloader(urllib.FancyURLopener):
-    """Subclass that overrides error 206.
+class SpaceReservations(object):
+    """Admission control based on the free space of the target file system.
 
-    This error means a partial file is being sent, which is ok in this case.
-    Do nothing with this error.
+    The free space reported by the file system does not include data that
+    transfers in progress are still going to write, so every transfer claims
+    the bytes it expects before it is started.
     """
 
-    def http_error_206(self, *args, **kw):
-        """This error is raised for partial downloads"""
+    def __init__(self, min_free=0):
+        """
+        Constructor.
+
+        :param min_free:    Number of bytes that should be kept free
+        :type min_free:     int
+        """
+        self._min_free = min_free
+        self._lock = threading.Lock()
+        self._active = []
+
+    def reserve(self, path, size):
+        """Reserve size bytes on the file system containing path
+
+        :param path:    Path of the file that will be written
+        :type path:     string
+
+        :param size:    Number of bytes that will be written
+        :type size:     int
+
+        :raises InsufficientSpaceError: If the file does not fit
+
+        :returns:       The reservation
+        :rtype:         SpaceReservation
+        """
+        device, available = free_space(os.path.dirname(path))
+
+        with self._lock:
+            reserved = sum(r.remaining for r in self._active
+                           if r.device == device)
+            if size > available - reserved - self._min_free:
+                raise wpd_exc.InsufficientSpaceError(
+                    'Not enough disk space for %s: need %d bytes, '
+                    '%d available (%d reserved by running transfers)' % (
+                        os.path.basename(path), size,
+                        max(0, available - self._min_free), reserved))
+
+            reservation = SpaceReservation(self, device, size)
+            self._active.append(reservation)
+            return reservation
+
+    def release(self, reservation):
+        """Release given reservation
+
+        :param reservation: Reservation returned by reserve()
+        :type reservation:  SpaceReservation
+        """
+        with self._lock:
+            if reservation in self._active:
+                self._active.remove(reservation)
+
+
+_CONTENT_RANGE = re.compile(r'^bytes (\d+)-\d+/(?:\d+|\*)$')
+
+
+def open_url(url, offset=0, method='GET', end=None):
+    """Open url with a request whose body is read as a stream.
+
+    Content from offset on is requested with a Range header. Servers that
+    ignore the header answer with the whole content and status 200 instead
+    of 206, which has to be checked by the caller.
+
+    :param url:     The URL
+    :type url:      string
+
+    :param offset:  Byte offset from which the content is requested
+    :type offset:   int
+
+    :param method:  HTTP method, like GET or HEAD
+    :type method:   string
+
+    :param end:     Offset of the last byte that is requested, the end of
+                    the content if None
+    :type end:      int
+
+    :raises IOError:    If the request failed or got an error response
+
+    :returns:           The response, which supports readinto()
+    :rtype:             http.client.HTTPResponse
+    """
+    request = urllib.request.Request(url, method=method)
+    if end is not None:
+        request.add_header('Range', 'bytes=%d-%d' % (offset, end))
+    elif offset:
+        request.add_header('Range', 'bytes=%d-' % (offset))
+    return urllib.request.urlopen(request)
+
+
+def range_start(response):
+    """Get the offset of the content of a response
+
+    :param response:    Response to a request opened with open_url()
+    :type response:     http.client.HTTPResponse
+
+    :raises DownloadError:  If the Content-Range header is not understood
+
+    :returns:           The offset of the first byte of the body, 0 if the
+                        server sent the whole content
+    :rtype:             int
+    """
+    if response.status != 206:
+        return 0
+
+    match = _CONTENT_RANGE.match(response.headers.get('Content-Range', ''))
+    if match is None:
+        raise wpd_exc.DownloadError('Invalid Content-Range: %s' % (
+            response.headers.get('Content-Range')))
+    return int(match.group(1))
+
+
+def _hash_prefix(file_obj, length, digest, block_size=1024 * 1024):
+    """Update digest with the first length bytes of file_obj"""
+
+    file_obj.seek(0)
+    while length > 0:
+        block = file_obj.read(min(block_size, length))
+        if not block:
+            break
+        digest.update(block)
+        length -= len(block)
+
+
+@dataclasses.dataclass
+class FileResult(object):
+    """
+    Outcome of a single file transfer.
+    """
+
+    #: ISO 631 language code or wiki identifier
+    language: str
+    #: Name of the file in the configuration, like pages-articles
+    filename: str
+    #: Download URL of the file
+    url: str
+    #: Local path of the file
+    path: str
+    #: Size of the remote file in bytes, 0 if unknown
+    size: int = 0
+    #: Number of bytes received from the download site
+    received: int = 0
+    #: Seconds the transfer took
+    duration: float = 0.0
+    #: MD5 hex digest of the file, if checksums are enabled
+    checksum: Optional[str] = None
+    #: The local file was complete already
+    skipped: bool = False
+    #: A partial file was resumed
+    resumed: bool = False
+    #: 'remote' for the download site, 'peer' for a peer source
+    source: str = 'remote'
+    #: Number of bytes copied from the previous dump, see [Delta]
+    reused: int = 0
+    #: Reason why the file is not complete, None on success
+    error: Optional[str] = None
+
+    @property
+    def complete(self):
+        """Is the file complete?"""
+
+        return self.error is None and os.path.exists(self.path)
 
 
 class WPDownloader(object):
@@ -86,19 +330,108 @@ class WPDownloader(object):
     Downloader for Wikipedia database dumps.
     """
 
-    def __init__(self, options):
+    def __init__(self, options, progress=None):
         """
         Constructor.
+
+        :param options:     Command line options or
+                            wp_download.api.DownloadOptions
+        :type options:      object
+
+        :param progress:    Callable that is called with the FileResult of a
+                            transfer and the number of bytes of the file that
+                            are on disk whenever data was received. It is
+                            called from the threads that run the transfers.
+        :type progress:     callable
         """
         self._options = options
+        self._progress = progress
+        self._checksum = options.checksum
         self._config = wpd_conf.Configuration(options)
-        self._urlhandler = URLHandler(self._config, options)
-        self._downloader = urllib.FancyURLopener()
+        self._urlhandler = None
+        self._reservations = SpaceReservations(
+            options.min_free_space * 1024 * 1024)
+        self._content_lengths = {}
+
+        self._jobs = options.jobs or self._config.get_default(
+            'Schedule', 'jobs', 1, self._config.getint)
+        self._size_order = self._config.get_default(
+            'Schedule', 'size_order', 'none')
+        if self._size_order not in wpd_sched.SIZE_ORDERS:
+            raise wpd_exc.ConfigValueError(
+                orig_err=ValueError('Unknown size_order: %s' % (
+                    self._size_order)),
+                config_file=self._config.config_file_path,
+                section='Schedule')
+        self._priorities = [
+            (pattern, self._config.get_default(
+                'Priorities', pattern, 0, self._config.getint))
+            for pattern in self._config.options('Priorities')
+        ] if self._config.has_section('Priorities') else []
+        self._dependencies = [
+            (pattern, self._config.get('Dependencies', pattern).split())
+            for pattern in self._config.options('Dependencies')
+        ] if self._config.has_section('Dependencies') else []
+
+        self._controller = None
+        if self._config.get_default('Schedule', 'adaptive', False,
+                                    self._config.getboolean):
+            self._controller = wpd_adapt.ConcurrencyController(
+                urllib.parse.urlsplit(
+                    self._config.get('Configuration', 'base_url')).netloc,
+                maximum=self._config.get_default(
+                    'Schedule', 'max_jobs', 8, self._config.getint),
+                initial=options.jobs,
+                interval=self._config.get_default(
+                    'Schedule', 'adapt_interval', 10.0,
+                    self._config.getfloat),
+                state_file=os.path.join(self._config.cache_dir,
+                                        'concurrency.json'))
+            self._jobs = self._controller.maximum
+
+        self._fsync = options.fsync or self._config.get_default(
+            'Configuration', 'fsync', 'none')
+        if self._fsync not in wpd_writer.FSYNC_POLICIES:
+            raise wpd_exc.ConfigValueError(
+                orig_err=ValueError('Unknown fsync policy: %s' % (
+                    self._fsync)),
+                config_file=self._config.config_file_path,
+                section='Configuration')
+        self._fsync_interval = self._config.get_default(
+            'Configuration', 'fsync_interval', 64,
+            self._config.getint) * 1024 * 1024
+        self._write_buffers = self._config.get_default(
+            'Configuration', 'write_buffers', wpd_writer.DEFAULT_BUFFERS,
+            self._config.getint)
+
+        self._staging = self._config.get_default(
+            'Publish', 'staging', False, self._config.getboolean)
+        self._verify_before_publish = self._config.get_default(
+            'Publish', 'verify', True, self._config.getboolean)
+        self._delta = self._config.get_default(
+            'Delta', 'enabled', False, self._config.getboolean)
+
+        peer_sources = self._config.get_default(
+            'Peers', 'sources', '').split() + (options.peer or [])
+        self._peers = None
+        if peer_sources:
+            self._peers = wpd_peers.PeerSources(peer_sources)
+
+        # Progress bars of concurrent transfers would garble the output
+        self._show_progress = not options.quiet and self._jobs == 1
 
         LOG.info('Set timeout to %d' % (options.timeout))
 
         socket.setdefaulttimeout(options.timeout)
 
+    @property
+    def urlhandler(self):
+        """Get the URL handler, which is created on first use"""
+
+        if self._urlhandler is None:
+            self._urlhandler = URLHandler(self._config, self._options)
+        return self._urlhandler
+
     def _download_directory(self, language, path):
         """Get download directory for given language at path
 
@@ -108,9 +441,8 @@ class WPDownloader(object):
         :param path:    Base path for language directories
         :type path:     string
         """
-        return os.path.join(path, language,
-                self._urlhandler.latest_dump_date(
-                    language).strftime('%Y%m%d'))
+        return os.path.join(path, self.urlhandler.plan.local_dir(
+            language, self.urlhandler.latest_dump_date(language)))
 
     def _create_download_dirs(self, language, path):
         """Create directories for given language
@@ -130,40 +462,67 @@ class WPDownloader(object):
         :param url:     URL
         :type url:      string
 
-        :returns:       Content length of file at URL
+        :raises IOError:    If the request failed for network reasons
+
+        :returns:       Content length of file at URL, 0 if it is not
+                        available
         :rtype:         int
         """
-        with closing(self._downloader.open(url)) as remote_file:
-            if remote_file.getcode() >= 300:
-                return 0
-            return int(remote_file.headers['Content-Length'])
+        if url in self._content_lengths:
+            return self._content_lengths[url]
+
+        try:
+            with closing(open_url(url, method='HEAD')) as remote_file:
+                content_length = int(
+                    remote_file.headers.get('Content-Length', 0))
+        except urllib.error.HTTPError:
+            return 0
+
+        self._content_lengths[url] = content_length
+        return content_length
 
-    def _should_skip_url(self, url, path):
+    def _should_skip_url(self, url, path, filtered=False):
         """Should we skip retrieval of the file at given URL?
 
         URLs are skipped if a local file with the same size as the remote one
         exists and retrieval of all files was not forced by the user.
 
-        :param url:     URL of the remote file
-        :type url:      string
+        :param url:         URL of the remote file
+        :type url:          string
 
-        :param path:    Path where remote file would be saved
-        :type path:     string
+        :param path:        Path where remote file would be saved
+        :type path:         string
+
+        :param filtered:    The file is saved filtered, see [Filters]. Such
+                            files are smaller than the remote file and are
+                            skipped if they exist.
+        :type filtered:     boolean
 
         :returns:       True if retrieval should be skipped, False otherwise
         :rtype:         boolean
         """
-        if os.path.exists(path):
-            if (self._remote_content_length(url) == os.path.getsize(path)
-                and not self._options.force):
+        if os.path.exists(path) and not self._options.force:
+            if filtered or (self._remote_content_length(url) ==
+                            os.path.getsize(path)):
                 return True
         return False
 
-    def _offset(self, url, path):
-        """Get download offset for file at given URL.
+    def _row_filter(self, result):
+        """Get the row filter of a transfer, None if it is saved unfiltered
 
-        :param url:     URL of the remote file
-        :type url:      string
+        :param result:  Result of the transfer
+        :type result:   FileResult
+        """
+        if os.path.basename(result.path) == os.path.basename(result.url):
+            return None
+        return self.urlhandler.plan.row_filter(result.language,
+                                               result.filename)
+
+    def _offset(self, content_length, path):
+        """Get download offset for a remote file of given size.
+
+        :param content_length:  Size of the remote file
+        :type content_length:   int
 
         :param path:    Path where remote file would be saved
         :type path:     string
@@ -173,7 +532,7 @@ class WPDownloader(object):
         """
         if self._options.resume and os.path.exists(path):
             local_file_size = os.path.getsize(path)
-            if self._remote_content_length(url) >= local_file_size:
+            if content_length >= local_file_size:
                 return local_file_size
         return 0
 
@@ -188,19 +547,199 @@ class WPDownloader(object):
         """
 
         for url in urls:
-            file_path = os.path.join(path, os.path.basename(url))
+            try:
+                self._retrieve_url(url, os.path.join(
+                    path, os.path.basename(url)))
+            except wpd_exc.InsufficientSpaceError as space_err:
+                LOG.error(space_err)
+                LOG.error('Skipped: %s' % (os.path.basename(url)))
+
+    def _retrieve_url(self, url, file_path, result=None, part_suffix='.part',
+                      proceed=None):
+        """Retrieve the file at given URL unless it can be skipped
+
+        :param url:         URL of the remote file
+        :type url:          string
+
+        :param file_path:   Path where remote file should be saved
+        :type file_path:    string
 
-            if self._should_skip_url(url, file_path):
+        :param result:      Result the outcome is recorded in
+        :type result:       FileResult
+
+        :param part_suffix: Suffix of the file the data is written to until
+                            it is complete
+        :type part_suffix:  string
+
+        :param proceed:     Callable that returns False once the transfer
+                            has to be given up, see retrieve()
+        :type proceed:      callable
+
+        :raises InsufficientSpaceError: If the file does not fit on disk
+
+        :returns:           The result
+        :rtype:             FileResult
+        """
+        if result is None:
+            result = FileResult('', os.path.basename(url), url, file_path)
+        started = time.time()
+        filtered = self._row_filter(result) is not None
+
+        try:
+            if self._should_skip_url(url, file_path, filtered):
                 LOG.info('Skipped: %s' % (os.path.basename(url)))
-                continue
+                result.skipped = True
+            elif (self._peers and not filtered and
+                  self._fetch_from_peers(url, file_path, part_suffix,
+                                         proceed)):
+                result.source = 'peer'
+            else:
+                self.retrieve_file(url, file_path, result, part_suffix,
+                                   proceed)
+        except wpd_exc.InsufficientSpaceError:
+            raise
+        except wpd_exc.DownloadError as down_err:
+            LOG.error('DownloadError: %s' % (os.path.basename(url)))
+            result.error = str(down_err)
+        except (IOError, http.client.HTTPException) as err:
+            # Like the HEAD request of a file that exists already
+            LOG.error('Could not retrieve %s: %s' % (
+                os.path.basename(url), err))
+            result.error = str(err) or err.__class__.__name__
+        finally:
+            result.duration = time.time() - started
+
+        # Sizes are only kept for the planning and the transfer of a file,
+        # a later job asks again
+        content_length = self._content_lengths.pop(url, 0)
+        if not result.size:
+            result.size = content_length
+        if (self._checksum and result.checksum is None and
+                os.path.exists(file_path)):
+            result.checksum = wpd_verify.md5sum(file_path)
+        return result
+
+    def _fetch_from_peers(self, url, file_path, part_suffix='.part',
+                          proceed=None):
+        """Take the file at given URL from a peer source if one has it
+
+        :param url:         URL of the remote file
+        :type url:          string
+
+        :param file_path:   Path where the file should be saved
+        :type file_path:    string
+
+        :param part_suffix: Suffix of the file the data is copied to
+        :type part_suffix:  string
+
+        :param proceed:     Callable that returns False once the transfer
+                            has to be given up
+        :type proceed:      callable
+
+        :raises TransferAbortedError:   If proceed returned False
+
+        :raises InsufficientSpaceError: If the file does not fit on disk
+
+        :returns:           True if the file was taken from a peer
+        :rtype:             boolean
+        """
+        down_dir, filename = os.path.split(file_path)
+        dump = wpd_publish.read_marker(down_dir)
+        if dump:
+            # Peers hold published dumps
+            relpath = os.path.join(dump['local_dir'], filename)
+            md5sums = os.path.basename(self.urlhandler.plan.file_url(
+                dump['language'],
+                datetime.datetime.strptime(dump['date'], '%Y%m%d'),
+                *wpd_verify.MD5SUMS))
+        else:
+            relpath = os.path.join(*file_path.split(os.sep)[-3:])
+            md5sums = None
 
-            try:
-                self.retrieve_file(url, file_path)
-            except wpd_exc.DownloadError:
-                LOG.error('DownloadError: %s' % (os.path.basename(url)))
-                continue
+        try:
+            size = self._remote_content_length(url)
+        except IOError as io_err:
+            LOG.debug('No size for %s: %s' % (os.path.basename(url), io_err))
+            return False
+
+        part_path = file_path + part_suffix
+        reservation = self._reservations.reserve(part_path, size)
+        try:
+            if not self._peers.fetch(relpath, part_path, size, md5sums):
+                return False
+        finally:
+            reservation.release()
+
+        try:
+            self._check_proceed(proceed, part_path)
+        except wpd_exc.TransferAbortedError:
+            os.remove(part_path)
+            raise
+        os.rename(part_path, file_path)
+        return True
+
+    def download_transfer(self, transfer, part_suffix='.part', proceed=None):
+        """Run a single transfer
+
+        :param transfer:    The transfer
+        :type transfer:     wp_download.schedule.Transfer
+
+        :param part_suffix: Suffix of the file the data is written to until
+                            it is complete
+        :type part_suffix:  string
 
-    def retrieve_file(self, url, path):
+        :param proceed:     Callable that returns False once the transfer
+                            has to be given up, see retrieve()
+        :type proceed:      callable
+
+        :returns:           True if the file is complete, False otherwise
+        :rtype:             boolean
+        """
+        try:
+            self._retrieve_url(transfer.url, transfer.path,
+                               part_suffix=part_suffix, proceed=proceed)
+        except wpd_exc.InsufficientSpaceError as space_err:
+            LOG.error(space_err)
+            LOG.error('Skipped: %s' % (os.path.basename(transfer.path)))
+        return os.path.exists(transfer.path)
+
+    def _result(self, transfer):
+        """Get an empty result for a transfer"""
+
+        return FileResult(transfer.language, transfer.filename, transfer.url,
+                          transfer.path, size=transfer.size)
+
+    def _run_transfer(self, scheduler, transfer):
+        """Worker for scheduled transfers
+
+        Transfers that do not fit on disk are deferred until another running
+        transfer has finished and skipped if nothing else is running.
+
+        :param scheduler:   Scheduler the transfer belongs to
+        :type scheduler:    wp_download.schedule.Scheduler
+
+        :param transfer:    The transfer
+        :type transfer:     wp_download.schedule.Transfer
+
+        :returns:           The result, None if the transfer was deferred
+        :rtype:             FileResult
+        """
+        result = self._result(transfer)
+        try:
+            return self._retrieve_url(transfer.url, transfer.path, result)
+        except wpd_exc.InsufficientSpaceError as space_err:
+            if scheduler.running > 1:
+                LOG.info('Wait for disk space: %s' % (
+                    os.path.basename(transfer.path)))
+                scheduler.defer(transfer)
+                return None
+            LOG.error(space_err)
+            LOG.error('Skipped: %s' % (os.path.basename(transfer.path)))
+            result.error = str(space_err)
+            return result
+
+    def retrieve_file(self, url, path, result=None, part_suffix='.part',
+                      proceed=None):
         """Retrieve a single file
 
         :param url:     Download URL of file
@@ -208,80 +747,367 @@ class WPDownloader(object):
 
         :param path:    Local path where file should be saved
         :type path:     string
+
+        :param result:  Result the transfer is recorded in
+        :type result:   FileResult
+
+        :param part_suffix: Suffix of the file the data is written to until
+                            it is complete
+        :type part_suffix:  string
+
+        :param proceed:     Callable that returns False once the transfer
+                            has to be given up, see retrieve()
+        :type proceed:      callable
         """
         tries = 0
+        final_path = path
         # Add a trailing .part suffix so that partial files are
         # flagged as such
-        path = path + ".part"
+        path = path + part_suffix
 
         while True:
             if tries == self._options.retries:
                 raise wpd_exc.DownloadError('Could not retrieve file: %s' % (
                     os.path.basename(url)), 'Retry limit exceeded')
             try:
-                self.retrieve(url, path)
+                self.retrieve(url, path, result, proceed)
+                self._check_proceed(proceed, path)
                 # Remove the trailing .part suffix
-                os.rename(path, os.path.splitext(path)[0])
+                os.rename(path, final_path)
+                if self._fsync != 'none':
+                    wpd_writer.fsync_directory(os.path.dirname(path))
                 break
-            except socket.error as s_err:
-                LOG.error('Socket Error: %s' % (s_err))
-            except IOError as io_err:
-                LOG.error(io_err)
-            except wpd_exc.DownloadError as down_err:
-                LOG.error(down_err)
+            except wpd_exc.InsufficientSpaceError:
+                # Retrying will not free any disk space
+                raise
+            except wpd_exc.TransferAbortedError:
+                # Nobody resumes the partial file of a given up transfer
+                if os.path.exists(path):
+                    os.remove(path)
+                raise
+            except (IOError, http.client.HTTPException,
+                    wpd_exc.DownloadError) as err:
+                LOG.error(err)
+                self._record_error()
             finally:
                 tries += 1
 
-    def retrieve(self, url, path):
+    @staticmethod
+    def _check_proceed(proceed, path):
+        """Give up the transfer to path once proceed returns False
+
+        :raises TransferAbortedError:   If proceed returned False
+        """
+        if proceed is not None and not proceed():
+            raise wpd_exc.TransferAbortedError('Transfer given up: %s' % (
+                os.path.basename(path)))
+
+    def _record_error(self):
+        """Report a failed transfer attempt to the concurrency controller"""
+
+        if self._controller:
+            self._controller.record_error()
+
+    def _delta_basis(self, result):
+        """Get the local copy of a file in the previous dump
+
+        The previous dump is the latest link of the language or the newest
+        older dump next to the download directory.
+
+        :param result:  Result of the transfer
+        :type result:   FileResult
+
+        :returns:       Path of the file, None if there is none
+        :rtype:         string
+        """
+        down_dir = os.path.dirname(result.path)
+        dump = wpd_publish.read_marker(down_dir)
+        if dump is None:
+            return None
+
+        final_dir = down_dir
+        if wpd_publish.is_staging_dir(down_dir):
+            final_dir = wpd_publish.final_dir(down_dir)
+        root = final_dir[:-len(dump['local_dir'])].rstrip(os.sep)
+        plan = self.urlhandler.plan
+        link = plan.latest_link(dump['language'])
+
+        candidates = [os.path.join(os.path.dirname(final_dir), name)
+                      for name in os.listdir(os.path.dirname(final_dir))]
+        if link:
+            candidates.append(os.path.realpath(os.path.join(root, link)))
+
+        dates = {}
+        for candidate in candidates:
+            if (not os.path.isdir(candidate) or
+                    wpd_publish.is_staging_dir(candidate)):
+                continue
+            previous = wpd_publish.read_marker(candidate)
+            if (previous and previous['language'] == dump['language'] and
+                    previous['date'] < dump['date']):
+                dates[previous['date']] = candidate
+        if not dates:
+            return None
+
+        date = max(dates)
+        try:
+            index = [spec.name for spec in plan.files].index(result.filename)
+        except ValueError:
+            return None
+        path = os.path.join(dates[date], os.path.basename(plan.urls(
+            dump['language'],
+            datetime.datetime.strptime(date, '%Y%m%d'))[index]))
+        return path if os.path.isfile(path) else None
+
+    def _retrieve_delta(self, url, path, result, content_length,
+                        proceed=None):
+        """Assemble a file from the previous dump and the changed blocks
+
+        The block manifest of the file is fetched from the download site and
+        compared with the copy of the file in the previous dump, see
+        wp_download.delta. Blocks found there are copied, all others are
+        fetched with range requests.
+
+        :param url:             Download URL of file
+        :type url:              string
+
+        :param path:            Local path where file should be saved
+        :type path:             string
+
+        :param result:          Result the transfer is recorded in
+        :type result:           FileResult
+
+        :param content_length:  Size of the remote file
+        :type content_length:   int
+
+        :param proceed:         Callable that is asked before every block,
+                                see retrieve()
+        :type proceed:          callable
+
+        :raises InsufficientSpaceError: If the file does not fit on disk
+        :raises TransferAbortedError:   If proceed returned False
+
+        :returns:       True if the file was assembled, False if it has to be
+                        downloaded in full
+        :rtype:         boolean
+        """
+        basis = self._delta_basis(result)
+        if basis is None:
+            return False
+
+        try:
+            with closing(open_url(url + wpd_delta.MANIFEST_SUFFIX)) as (
+                    manifest_file):
+                manifest = wpd_delta.parse_manifest(
+                    manifest_file.read().decode('utf-8'))
+        except (IOError, http.client.HTTPException, ValueError) as err:
+            LOG.debug('No manifest for %s: %s' % (
+                os.path.basename(url), err))
+            return False
+        if manifest['size'] != content_length:
+            LOG.debug('Outdated manifest: %s' % (os.path.basename(url)))
+            return False
+
+        steps = wpd_delta.plan_blocks(manifest, wpd_delta.index_blocks(
+            basis, manifest['block_size']))
+        if all(source is None for _, _, source in steps):
+            LOG.debug('No blocks of %s in %s' % (
+                os.path.basename(url), basis))
+            return False
+
+        digest = hashlib.md5()
+        written = 0
+        reservation = self._reservations.reserve(path, content_length)
+        try:
+            with open(basis, 'rb') as basis_file, \
+                    open(path, 'wb') as local_file:
+                for offset, length, source in steps:
+                    self._check_proceed(proceed, path)
+                    if source is not None:
+                        basis_file.seek(source)
+                        block = basis_file.read(length)
+                        local_file.write(block)
+                        digest.update(block)
+                        result.reused += length
+                    elif not self._fetch_range(url, offset, length,
+                                               local_file, digest, result):
+                        result.received = result.reused = 0
+                        return False
+                    written += length
+                    reservation.consume(length)
+                    if self._progress:
+                        self._progress(result, written)
+
+                local_file.flush()
+                if self._fsync != 'none':
+                    os.fsync(local_file.fileno())
+        finally:
+            reservation.release()
+
+        if digest.hexdigest() != manifest['md5']:
+            LOG.error('Checksum mismatch after delta transfer: %s' % (
+                os.path.basename(path)))
+            result.received = result.reused = 0
+            return False
+
+        LOG.info('Delta transfer of %s: reused %d of %d bytes' % (
+            os.path.basename(path), result.reused, content_length))
+        if self._checksum:
+            result.checksum = digest.hexdigest()
+        return True
+
+    def _fetch_range(self, url, offset, length, local_file, digest, result):
+        """Append a range of the file at url to local_file
+
+        :returns:   True if the range was received, False if the server does
+                    not support range requests
+        :rtype:     boolean
+        """
+        with closing(open_url(url, offset,
+                              end=offset + length - 1)) as remote_file:
+            if remote_file.status != 206 or range_start(remote_file) != offset:
+                LOG.info('Server ignored range, no delta transfer: %s' % (
+                    os.path.basename(url)))
+                return False
+
+            while length > 0:
+                data = remote_file.read(min(length, 1024 * 1024))
+                if not data:
+                    raise wpd_exc.DownloadError(
+                        'Incomplete range: %s' % (os.path.basename(url)))
+                local_file.write(data)
+                digest.update(data)
+                length -= len(data)
+                result.received += len(data)
+                if self._controller:
+                    self._controller.record(len(data))
+        return True
+
+    def retrieve(self, url, path, result=None, proceed=None):
         """Copy content from URL to file at path.
 
+        Space for the remaining content is reserved on the target file system
+        before the transfer is started. A partial file at path is resumed with
+        a range request if resume is enabled. If the server sends the whole
+        content instead, the file is written from the start. Files with a row
+        filter in [Filters] are filtered while they are written and are
+        always downloaded from the start. If [Delta] is enabled, unchanged
+        blocks are copied from the previous dump, see _retrieve_delta().
+
         :param url:     Download URL of file
         :type url:      string
 
         :param path:    Local path where file should be saved
         :type path:     string
-        """
-        block_size = 8 * 1024
-        read = 0
-        offset = self._offset(url, path)
-        downloader = PartialDownloader()
-        downloader.addheader('Range', 'bytes=%s-' % (offset))
-
-        with closing(downloader.open(url)) as remote_file:
-            if remote_file.getcode() >= 300:
-                raise wpd_exc.DownloadError(
-                    'Got HTTP response code: %d for file %s' %
-                    (remote_file.getcode(), os.path.basename(path)))
-
-            with open(path, 'ab') as local_file:
-                if offset:
-                    LOG.info('Resume: %s' % (os.path.basename(path)))
-                    local_file.seek(offset)
-
-                content_length = self._remote_content_length(url)
-
-                try:
-                    if not self._options.quiet:
-                        pbar = init_progressbar(path, content_length)
-                        pbar.start()
-                        if offset:
-                            pbar.update(offset)
-                            read = offset
-
-                    for block in iter(lambda: remote_file.read(block_size), ''):
-                        local_file.write(block)
-                        read += len(block)
 
-                        if read > content_length:
-                            raise wpd_exc.DownloadError(
-                                'Received data exceeds advertised size: %s' % (
-                                    os.path.basename(path)))
+        :param result:  Result the transfer is recorded in
+        :type result:   FileResult
 
-                        if not self._options.quiet:
-                            pbar.update(read)
-                finally:
-                    if not self._options.quiet:
-                        pbar.finish()
+        :param proceed: Callable that is asked whenever data was received,
+                        the transfer is given up once it returns False
+        :type proceed:  callable
+
+        :raises InsufficientSpaceError: If the file does not fit on disk
+        :raises TransferAbortedError:   If proceed returned False
+        """
+        if result is None:
+            result = FileResult('', os.path.basename(url), url, path)
+        content_length = self._remote_content_length(url)
+        result.size = content_length
+        row_filter = self._row_filter(result)
+        offset = 0
+        if row_filter is None:
+            offset = self._offset(content_length, path)
+        if offset and offset == content_length:
+            LOG.info('Complete: %s' % (os.path.basename(path)))
+            return
+        if (self._delta and row_filter is None and not offset and
+                self._retrieve_delta(url, path, result, content_length,
+                                     proceed)):
+            return
+
+        digest = None
+        if self._checksum and row_filter is None:
+            digest = hashlib.md5()
+        reservation = self._reservations.reserve(
+            path, content_length - offset)
+        try:
+            with closing(open_url(url, offset)) as remote_file:
+                start = range_start(remote_file)
+                if start != offset:
+                    if start:
+                        raise wpd_exc.DownloadError(
+                            'Got range from %d instead of %d: %s' % (
+                                start, offset, os.path.basename(path)))
+                    LOG.info('Server ignored range, restart: %s' % (
+                        os.path.basename(path)))
+                    offset = 0
+                read = offset
+                result.resumed = bool(offset)
+
+                with open(path, 'r+b' if offset else 'wb') as local_file:
+                    if offset:
+                        LOG.info('Resume: %s' % (os.path.basename(path)))
+                        if digest is not None:
+                            _hash_prefix(local_file, offset, digest)
+                        local_file.seek(offset)
+                        local_file.truncate()
+
+                    sink = local_file
+                    if row_filter is not None:
+                        sink = wpd_filter.SQLFilter(
+                            local_file, row_filter,
+                            self.urlhandler.plan.filter_format,
+                            fsync=self._fsync != 'none')
+                    elif preallocate(local_file, content_length - offset):
+                        # The file system accounts for preallocated blocks
+                        reservation.release()
+
+                    try:
+                        if self._show_progress:
+                            pbar = init_progressbar(path, content_length)
+                            pbar.start()
+                            if offset:
+                                pbar.update(offset)
+
+                        with wpd_writer.WriteBehind(
+                                sink, self._write_buffers,
+                                fsync=self._fsync,
+                                fsync_interval=self._fsync_interval,
+                                digest=digest) as writer:
+                            length = writer.readinto(remote_file)
+                            while length:
+                                read += length
+                                result.received += length
+                                reservation.consume(length)
+                                if self._controller:
+                                    self._controller.record(length)
+
+                                if read > content_length:
+                                    raise wpd_exc.DownloadError(
+                                        'Received data exceeds advertised '
+                                        'size: %s' % (os.path.basename(path)))
+
+                                if self._show_progress:
+                                    pbar.update(read)
+                                if self._progress:
+                                    self._progress(result, read)
+                                self._check_proceed(proceed, path)
+                                length = writer.readinto(remote_file)
+
+                        if row_filter is not None:
+                            sink.close()
+                            LOG.info('Filtered %s: kept %d of %d rows' % (
+                                os.path.basename(path), sink.kept,
+                                sink.rows))
+                    finally:
+                        if self._show_progress:
+                            pbar.finish()
+        finally:
+            reservation.release()
+
+        if digest is not None:
+            result.checksum = digest.hexdigest()
 
     def download_language(self, language, path):
         """Download all files for given language
@@ -296,142 +1122,251 @@ class WPDownloader(object):
         self._create_download_dirs(language, path)
 
         self.retrieve_files(
-            self._urlhandler.urls_for_language(language),
+            self.urlhandler.urls_for_language(language),
             self._download_directory(language, path))
 
-    def download_all_languages(self, path):
-        """Download files for all enabled languages
+    def languages(self):
+        """Get all enabled languages and discovered wikis
 
-        :param path:        Base path where the language directories will be
-                            created.
-        :type path:         string
-        """
+        Wikis are discovered on the download site if this is enabled in the
+        ``[Discovery]`` section of the configuration.
 
-        for lang in self._config.enabled_languages():
-            LOG.info('Processing language: %s' % lang)
-
-            try:
-                self.download_language(lang, path)
-            except IOError:
-                LOG.error('Download failed: %s' % (lang))
-                LOG.error('Skipped: %s' % (lang))
-                continue
+        :returns:   Sorted language codes and wiki identifiers
+        :rtype:     list
+        """
+        return self.urlhandler.languages()
 
+    def _priority(self, language, filename):
+        """Get the priority of a file as configured in [Priorities]
 
-class URLHandler(object):
-    """
-    Handler for Wikipedia dump download URLs
-    """
+        Patterns without a slash are matched against the filename, all others
+        against ``<language>/<filename>``. The highest priority of all
+        matching patterns is used.
 
-    def __init__(self, config, options=None):
-        """
-        Constructor.
+        :param language:    ISO 631 language code or wiki identifier
+        :type language:     string
 
-        :param config:	Configuration
+        :param filename:    Name of the file in the configuration
+        :type filename:     string
         """
-        assert config
-        self._config = config
+        key = '%s/%s' % (language, filename)
+        matching = [priority for pattern, priority in self._priorities
+                    if fnmatch.fnmatchcase(
+                        key if '/' in pattern else filename, pattern)]
+        return max(matching) if matching else 0
 
-        self._urlopener = urllib.FancyURLopener()
-        self._date_matcher = re.compile(r'<a href="(\d{8})/">.*/</a>')
+    def transfers_for_language(self, language, path, date=None):
+        """Get transfers for all enabled files of given language
 
-        self._host = self._config.get('Configuration', 'base_url')
+        :param language:    ISO 631 language code or wiki identifier
+        :type language:     string
 
-        self._lang_dir_template = self._config.string_template(
-            'language_dir_format')
-        self._filename_template = self._config.string_template('file_format')
-        self._custom_dump = []
-        if options and options.custom_dump:
-            self._custom_dump.extend(options.custom_dump)
+        :param path:        Base path where the language directory will be
+                            created.
+        :type path:         string
 
-    def language_dir(self, language):
-        """Get the directory for given language
+        :param date:        Dump date, the latest dump is used if None
+        :type date:         datetime.datetime
 
-        :param language:    ISO 631 language code
-        :type language:     string
+        :returns:           The transfers
+        :rtype:             list of wp_download.schedule.Transfer
         """
-        return self._lang_dir_template.substitute(langcode=language)
+        latest = date or self.urlhandler.latest_dump_date(language)
+        LOG.info('Latest dump for (%s) is from %s' % (
+            language, latest.strftime('%A %d %B %Y')))
 
-    def language_url(self, language):
-        """Get the dump location for given language
+        plan = self.urlhandler.plan
+        local_dir = plan.local_dir(language, latest)
+        down_dir = os.path.join(path, local_dir)
+        if self._staging and not os.path.exists(down_dir):
+            down_dir = wpd_publish.staging_dir(down_dir)
 
-        :param language:    ISO 631 language code
-        :type language:     string
+        if not os.path.exists(down_dir):
+            LOG.info('Creating directory: %s' % (down_dir))
+            os.makedirs(down_dir)
+        wpd_publish.write_marker(down_dir, language, latest, local_dir)
+
+        sizes = {}
+        if self._size_order != 'none':
+            sizes = self.urlhandler.file_sizes(language, latest)
+
+        transfers = []
+        for spec, url, name in zip(plan.files, plan.urls(language, latest),
+                                   plan.local_names(language, latest)):
+            filename = os.path.basename(url)
+            size = sizes.get(filename)
+            if size is None and self._size_order != 'none':
+                size = self._remote_content_length(url)
+            transfers.append(wpd_sched.Transfer(
+                language, spec.name, url, os.path.join(down_dir, name),
+                size=size or 0, priority=self._priority(language, spec.name)))
+        return transfers
+
+    def download_transfers(self, transfers, hook=None, result_hook=None):
+        """Run given transfers
+
+        Transfers are ordered by the [Priorities] and [Dependencies] of the
+        configuration and run by a number of parallel jobs. The number of
+        jobs is adjusted to the measured throughput if adaptive is enabled in
+        [Schedule].
+
+        :param transfers:   The transfers
+        :type transfers:    iterable of wp_download.schedule.Transfer
+
+        :param hook:        Callable that is called with each transfer before
+                            it is started
+        :type hook:         callable
+
+        :param result_hook: Callable that is called with the FileResult of
+                            each finished transfer. Files of staged dumps are
+                            still in the staging directory at that time, the
+                            path of the result is updated when the dump is
+                            published.
+        :type result_hook:  callable
         """
-        return urllib.basejoin(self._host, self.language_dir(language))
-
-    def dump_dates(self, url):
-        """Iterator containing datetime objects that correspond to the creation
-        dates of the dumps found at given url.
-
-        :param url: URL pointing to a mediawiki language download page
-        :type url:  string
+        scheduler = wpd_sched.Scheduler(self._size_order)
+        for transfer in transfers:
+            scheduler.add(transfer)
+        scheduler.add_dependencies(self._dependencies)
+        results = []
+
+        def worker(transfer):
+            if hook:
+                hook(transfer)
+            result = self._run_transfer(scheduler, transfer)
+            if result is not None:
+                results.append(result)
+                if result_hook:
+                    result_hook(result)
 
-        :raises ValueError: A ValueError is raised if no date could be
-                            extracted from given URL.
+        try:
+            scheduler.run(worker, self._jobs, self._controller)
+        finally:
+            # Sizes of planned files that were not transferred
+            self._content_lengths.clear()
+            if self._controller:
+                self._controller.save()
+
+        for down_dir in set(os.path.dirname(transfer.path)
+                            for transfer in transfers):
+            published = self.publish(down_dir)
+            if published:
+                for moved in itertools.chain(transfers, results):
+                    if os.path.dirname(moved.path) == down_dir:
+                        moved.path = os.path.join(
+                            published, os.path.basename(moved.path))
+
+    def _verify_dump(self, down_dir, language, date, filenames):
+        """Verify the files of a dump against its published checksums
+
+        Files with a wrong checksum are removed, so that they are downloaded
+        again.
+
+        :returns:   True if all files have a matching checksum
+        :rtype:     boolean
         """
+        url = self.urlhandler.plan.file_url(language, date,
+                                            *wpd_verify.MD5SUMS)
         try:
-            with closing(self._urlopener.open(url)) as lang_site:
-                return (datetime.datetime.strptime(date, '%Y%m%d') for date in
-                         self._date_matcher.findall(lang_site.read()))
+            content = self.urlhandler.fetch(url)
         except IOError as io_err:
-            LOG.error(io_err)
-            LOG.error('Could not retrieve: %s' % (url))
-            raise io_err
-
-    def latest_dump_date(self, language):
-        """Get the lates dump date for given language.
-
-        :raises ValueError: A ValueError is raised if no date could be
-                            extracted from given URL.
-
-        :returns:   The latest dump date
-        :rtype:     datetime.datetime
+            LOG.error('No checksums for %s: %s' % (language, io_err))
+            return False
+
+        with open(os.path.join(down_dir, os.path.basename(url)),
+                  'w') as md5sums_file:
+            md5sums_file.write(content)
+
+        checksums = wpd_verify.parse_md5sums(content)
+        results = wpd_verify.verify_directory(down_dir, dict(
+            (name, checksums[name]) for name in filenames
+            if name in checksums))
+
+        intact = True
+        for name in filenames:
+            if name not in checksums:
+                LOG.error('No checksum for %s' % (name))
+                intact = False
+            elif not results.get(name):
+                LOG.error('Checksum mismatch: %s' % (name))
+                os.remove(os.path.join(down_dir, name))
+                intact = False
+        return intact
+
+    def publish(self, down_dir):
+        """Publish a staged dump once all enabled files are complete
+
+        The files are verified against the published checksums first, unless
+        verify is disabled in [Publish]. The staging directory is then renamed
+        to the final directory and the latest link of the language is
+        updated.
+
+        :param down_dir:    Download directory of the dump
+        :type down_dir:     string
+
+        :returns:           The final directory if the dump was published,
+                            None otherwise
+        :rtype:             string
         """
-        custom_dates = dict(
-            [pair.split(':', 1) for pair in self._custom_dump])
-        if language in custom_dates:
-            return datetime.datetime.strptime(custom_dates[language], '%Y%m%d')
-
-        dates = [ d for d in self.dump_dates(self.language_url(language)) ] + \
-            [ datetime.datetime.strptime('19000101', '%Y%m%d') ]
-        return max(dates)
-
-    def urls_for_language(self, language):
-        """Iterator for all file URLs to download.
-
-        The iterator will yield elements of the form (lang, url).
-
-        This function will parse the provided wp-download configuration files,
-        query the WikiMedia download website
+        if not wpd_publish.is_staging_dir(down_dir):
+            return None
+        dump = wpd_publish.read_marker(down_dir)
+        if dump is None:
+            return None
+
+        language = dump['language']
+        date = datetime.datetime.strptime(dump['date'], '%Y%m%d')
+        plan = self.urlhandler.plan
+        filenames = plan.local_names(language, date)
+
+        if not all(os.path.isfile(os.path.join(down_dir, name))
+                   for name in filenames):
+            LOG.info('Not published, dump is incomplete: %s' % (down_dir))
+            return None
+
+        # Filtered files do not match the published checksums
+        remote_names = set(os.path.basename(url)
+                           for url in plan.urls(language, date))
+        if self._verify_before_publish and not self._verify_dump(
+                down_dir, language, date,
+                [name for name in filenames if name in remote_names]):
+            LOG.error('Not published: %s' % (down_dir))
+            return None
+
+        final_dir = wpd_publish.final_dir(down_dir)
+        root = final_dir[:-len(dump['local_dir'])].rstrip(os.sep)
+        link = plan.latest_link(language)
+        return wpd_publish.publish(
+            down_dir, link and os.path.join(root, link)) or final_dir
+
+    def throughput(self):
+        """Get throughput statistics of the concurrency controller
+
+        :returns:   Statistics, see ConcurrencyController.stats(), None if
+                    adaptive concurrency is not enabled
+        :rtype:     dict
+        """
+        if self._controller:
+            return self._controller.stats()
+        return None
 
-        :param language:    ISO 631 language code
-        :type language:     string
+    def download_all_languages(self, path):
+        """Download files for all enabled languages
 
-        :raises ValueError: A ValueError is raised if URL construction failed.
+        :param path:        Base path where the language directories will be
+                            created.
+        :type path:         string
         """
-        try:
-            latest = self.latest_dump_date(language)
-        except IOError as io_err:
-            LOG.error('Could not get dump date for %s!' % (language))
-            LOG.error('Skip: %s'%(language))
-            LOG.error(io_err)
-            yield
+        transfers = []
 
-        LOG.info('Latest dump for (%s) is from %s' % (
-            language, latest.strftime('%A %d %B %Y')))
+        for lang in self.languages():
+            LOG.info('Processing language: %s' % lang)
+
+            try:
+                transfers.extend(self.transfers_for_language(lang, path))
+            except IOError:
+                LOG.error('Download failed: %s' % (lang))
+                LOG.error('Skipped: %s' % (lang))
+                continue
 
-        for filename in self._config.enabled_files():
-            server_path = '/'.join([
-                    self.language_dir(language),
-                    latest.strftime('%Y%m%d'),
-                    self._filename_template.substitute(
-                        langcode=language,
-                        date=latest.strftime('%Y%m%d'),
-                        filename=filename,
-                        filetype=self._config.get('Filetypes', filename))])
-
-            scheme, netloc, path, query, anchor = urlparse.urlsplit(
-                self._host)
-            yield urlparse.urlunsplit((scheme, netloc, server_path, query,
-                                       anchor))
+        self.download_transfers(transfers)
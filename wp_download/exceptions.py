@@ -37,6 +37,8 @@ ECPARSE = 5
 ECVALUE = 6
 # no such file or directory
 ENOENT = 7
+# checksum mismatch of downloaded files
+EVERIFY = 8
 
 # ----------
 # exceptions
@@ -68,9 +70,8 @@ class ConfigError(WrappedError):
     def __repr__(self):
         return '%s(file=%s)' % (self.__class__.__name__, self.config_file)
 
-    def __unicode__(self):
-        return u"Error in file '%s': %s" % (
-            self.config_file, self.message)
+    def __str__(self):
+        return "Error in file '%s': %s" % (self.config_file, self.orig_err)
 
 
 class ConfigParseError(ConfigError):
@@ -88,9 +89,9 @@ class ConfigSectionError(ConfigError):
         return '%s(file=%s, section=%s)' % (
             self.__class__.__name__, self.config_file, self.section)
 
-    def __unicode__(self):
-        return u"Error in section [%s] of '%s': %s" % (
-            self.section, self.config_file, self.message)
+    def __str__(self):
+        return "Error in section [%s] of '%s': %s" % (
+            self.section, self.config_file, self.orig_err)
 
 
 class TemplateError(ConfigSectionError):
@@ -109,6 +110,10 @@ class TemplateMissingError(TemplateError):
     pass
 
 
+class TemplateValueError(TemplateError):
+    pass
+
+
 class ConfigValueError(ConfigSectionError):
     pass
 
@@ -119,5 +124,18 @@ class DownloadError(WPError):
     """This error is raised if a download has failed"""
 
 
+class InsufficientSpaceError(DownloadError):
+    """This error is raised if a file does not fit on the target file system"""
+
+
+class FilterError(DownloadError, IOError):
+    """This error is raised if a SQL dump cannot be filtered"""
+
+
+class TransferAbortedError(DownloadError):
+    """This error is raised if a transfer is given up, like after its lease
+    was lost"""
+
+
 class SkipDownload(WPError):
     """This exception is raised if a download should be skipped"""
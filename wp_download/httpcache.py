@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+
+"""On-disk cache of small HTTP responses.
+
+Index pages of the download site, dump status files and checksum files are
+kept in the cache together with their ETag and Last-Modified headers. Cached
+responses are revalidated with conditional requests, so that unchanged
+resources are answered with a bodyless 304 response. The cache is bounded in
+size and evicts the least recently used responses first. Uses of cached
+responses are written to the index together with the next stored response,
+or at most once per SAVE_INTERVAL seconds.
+
+In offline mode no requests are made and only cached responses are served.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from contextlib import closing
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.DEBUG)
+
+# Default size limit of the cache in bytes
+DEFAULT_MAX_SIZE = 50 * 1024 * 1024
+
+INDEX_FILE = 'index.json'
+
+# Seconds between writes of the index for responses served from the cache
+SAVE_INTERVAL = 60
+
+
+class HTTPCache(object):
+    """
+    Size-bounded LRU cache of HTTP responses with conditional revalidation.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE, offline=False,
+                 timeout=None):
+        """
+        Constructor.
+
+        :param directory:   Directory the responses are kept in
+        :type directory:    string
+
+        :param max_size:    Maximal size of all cached responses in bytes
+        :type max_size:     int
+
+        :param offline:     Serve cached responses only
+        :type offline:      boolean
+
+        :param timeout:     Timeout of requests in seconds, the global
+                            socket timeout if None
+        :type timeout:      float
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.offline = offline
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._index_file = os.path.join(directory, INDEX_FILE)
+        self._entries = self._load()
+        self._saved = 0
+
+    def _load(self):
+        """Read the index of cached responses"""
+
+        try:
+            with open(self._index_file) as index_file:
+                return json.load(index_file)
+        except (IOError, ValueError):
+            return {}
+
+    def _save(self):
+        """Write the index of cached responses
+
+        Has to be called with the lock held.
+        """
+        tmp_path = '%s.%d.tmp' % (self._index_file, os.getpid())
+        with open(tmp_path, 'w') as index_file:
+            json.dump(self._entries, index_file, sort_keys=True)
+        os.rename(tmp_path, self._index_file)
+        self._saved = time.time()
+
+    def _body_path(self, url):
+        """Get the path of the cached body of url"""
+
+        return os.path.join(self.directory,
+                            hashlib.sha1(url.encode('utf-8')).hexdigest())
+
+    def _lookup(self, url):
+        """Get the cache entry of url, None if it is not cached"""
+
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry and os.path.exists(self._body_path(url)):
+                return dict(entry)
+        return None
+
+    def _read(self, url):
+        """Get the cached body of url and mark it as recently used
+
+        The index is written at most once per SAVE_INTERVAL seconds for this.
+        """
+
+        with open(self._body_path(url), 'rb') as body_file:
+            content = body_file.read()
+
+        with self._lock:
+            if url in self._entries:
+                self._entries[url]['used'] = time.time()
+                if time.time() - self._saved > SAVE_INTERVAL:
+                    self._save()
+        return content
+
+    def _store(self, url, content, etag, last_modified):
+        """Add a response to the cache and evict old ones"""
+
+        if len(content) > self.max_size:
+            return
+
+        with self._lock:
+            if not os.path.exists(self.directory):
+                os.makedirs(self.directory)
+
+            body_path = self._body_path(url)
+            tmp_path = '%s.%d.tmp' % (body_path, os.getpid())
+            with open(tmp_path, 'wb') as body_file:
+                body_file.write(content)
+            os.rename(tmp_path, body_path)
+
+            self._entries[url] = {'etag': etag,
+                                  'last_modified': last_modified,
+                                  'size': len(content),
+                                  'used': time.time()}
+            self._evict()
+            self._save()
+
+    def _evict(self):
+        """Remove least recently used responses until the cache fits
+
+        Has to be called with the lock held.
+        """
+        total = sum(entry['size'] for entry in self._entries.values())
+        for url in sorted(self._entries,
+                          key=lambda url: self._entries[url]['used']):
+            if total <= self.max_size:
+                break
+            total -= self._entries.pop(url)['size']
+            try:
+                os.remove(self._body_path(url))
+            except OSError:
+                pass
+            LOG.debug('Evicted from cache: %s' % (url))
+
+    def size(self):
+        """Get the size of all cached responses in bytes"""
+
+        with self._lock:
+            return sum(entry['size'] for entry in self._entries.values())
+
+    def get(self, url):
+        """Get the content at url
+
+        A cached response is revalidated with a conditional request and
+        served if the request fails for network reasons.
+
+        :param url: The URL
+        :type url:  string
+
+        :raises IOError:    If the content is neither retrievable nor cached
+
+        :returns:           The content
+        :rtype:             bytes
+        """
+        entry = self._lookup(url)
+
+        if self.offline:
+            if entry is None:
+                raise IOError('Not cached (offline): %s' % (url))
+            return self._read(url)
+
+        # Only imported when a request is made, it is slow to import
+        import urllib.error
+        import urllib.request
+
+        request = urllib.request.Request(url)
+        if entry and entry.get('etag'):
+            request.add_header('If-None-Match', entry['etag'])
+        if entry and entry.get('last_modified'):
+            request.add_header('If-Modified-Since', entry['last_modified'])
+
+        timeout = {} if self.timeout is None else {'timeout': self.timeout}
+        try:
+            with closing(urllib.request.urlopen(request,
+                                                **timeout)) as response:
+                content = response.read()
+                headers = response.info()
+        except urllib.error.HTTPError as http_err:
+            if http_err.code == 304 and entry:
+                LOG.debug('Not modified: %s' % (url))
+                return self._read(url)
+            raise IOError('Got HTTP response code: %d for %s' % (
+                http_err.code, url))
+        except IOError as io_err:
+            if entry is None:
+                raise
+            LOG.error(io_err)
+            LOG.error('Use cached response: %s' % (url))
+            return self._read(url)
+
+        self._store(url, content, headers.get('ETag'),
+                    headers.get('Last-Modified'))
+        return content
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+
+"""Peer sources that already hold some of the dumps.
+
+A peer is a local directory, like another download tree or an NFS mount, or
+the HTTP endpoint of another node that serves its download directory. Peers
+are expected to use the same ``<language>/<date>/<file>`` layout as the
+download directory.
+
+Files are taken from a peer if they have the size of the remote file. If the
+peer has a checksum for the file, it has to match as well, unless the peer
+verified the file itself. Files on the same file system are hard linked,
+files on other local file systems are copied within the kernel.
+"""
+
+import errno
+import logging
+import os
+import shutil
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from contextlib import closing
+
+import wp_download.verify as wpd_verify
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.DEBUG)
+
+BLOCK_SIZE = 1024 * 1024
+
+
+def _copy_file_range(src, dst, offset, count):
+    """Copy count bytes at offset with copy_file_range(), Linux only"""
+
+    return os.copy_file_range(src, dst, count, offset, offset)
+
+
+def _sendfile(src, dst, offset, count):
+    """Copy count bytes at offset with sendfile() to the end of dst"""
+
+    return os.sendfile(dst, src, offset, count)
+
+
+# Kernel copy functions that are tried in order, as pairs of
+# (name, function(src_fd, dst_fd, offset, count))
+_kernel_copy = []
+if hasattr(os, 'copy_file_range'):
+    _kernel_copy.append(('copy_file_range', _copy_file_range))
+if hasattr(os, 'sendfile'):
+    _kernel_copy.append(('sendfile', _sendfile))
+
+
+def copy_file(src_path, dst_path):
+    """Copy a file without passing its content through user space
+
+    copy_file_range() and sendfile() are used where available, a plain copy
+    otherwise.
+
+    :param src_path:    Path of the source file
+    :type src_path:     string
+
+    :param dst_path:    Path of the copy
+    :type dst_path:     string
+    """
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        size = os.fstat(src.fileno()).st_size
+        copied = 0
+
+        for name, function in _kernel_copy:
+            try:
+                while copied < size:
+                    count = function(src.fileno(), dst.fileno(), copied,
+                                     min(size - copied, 1 << 30))
+                    if not count:
+                        break
+                    copied += count
+            except OSError as os_err:
+                LOG.debug('Cannot use %s for %s: %s' % (
+                    name, src_path, os_err))
+            if copied == size:
+                return
+            if copied:
+                # Failed after copying some data, the rest is copied below
+                break
+
+        src.seek(copied)
+        dst.seek(copied)
+        dst.truncate()
+        shutil.copyfileobj(src, dst, BLOCK_SIZE)
+
+
+class LocalPeer(object):
+    """
+    Download tree in a local directory or on a network file system.
+    """
+
+    def __init__(self, root):
+        """
+        Constructor.
+
+        :param root:    Download directory of the peer
+        :type root:     string
+        """
+        self.root = os.path.abspath(os.path.expanduser(root))
+
+    def __str__(self):
+        return self.root
+
+    def read(self, relpath):
+        """Get the content of a small file, None if it does not exist"""
+
+        try:
+            with open(os.path.join(self.root, relpath)) as peer_file:
+                return peer_file.read()
+        except IOError:
+            return None
+
+    def verified(self, relpath):
+        """Has the peer verified its copy of the file?"""
+
+        down_dir, filename = os.path.split(os.path.join(self.root, relpath))
+        return wpd_verify.is_verified(down_dir, filename)
+
+    def fetch(self, relpath, target, size):
+        """Hard link or copy a file of given size to target
+
+        :returns:   False if the peer has no file of that size
+        :rtype:     boolean
+        """
+        source = os.path.join(self.root, relpath)
+        try:
+            if os.path.getsize(source) != size:
+                return False
+        except OSError:
+            return False
+
+        if os.path.exists(target):
+            os.remove(target)
+        try:
+            os.link(source, target)
+            return True
+        except OSError as os_err:
+            if os_err.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK,
+                                    errno.ENOTSUP):
+                raise
+
+        copy_file(source, target)
+        return os.path.getsize(target) == size
+
+
+class HTTPPeer(object):
+    """
+    Download tree served over HTTP by another node.
+    """
+
+    def __init__(self, base_url):
+        """
+        Constructor.
+
+        :param base_url:    URL of the download directory of the peer
+        :type base_url:     string
+        """
+        self.base_url = base_url.rstrip('/')
+
+    def __str__(self):
+        return self.base_url
+
+    def _url(self, relpath):
+        """Get the URL of a file of the peer"""
+
+        return '/'.join([self.base_url] + [
+            urllib.parse.quote(part) for part in relpath.split(os.sep)])
+
+    def read(self, relpath):
+        """Get the content of a small file, None if it does not exist"""
+
+        try:
+            with closing(urllib.request.urlopen(
+                    self._url(relpath))) as remote_file:
+                if remote_file.getcode() >= 300:
+                    return None
+                return remote_file.read().decode('utf-8')
+        except IOError:
+            return None
+
+    def verified(self, relpath):
+        """The verification state of HTTP peers is not known"""
+
+        return False
+
+    def fetch(self, relpath, target, size):
+        """Download a file of given size from the peer to target
+
+        :returns:   False if the peer has no file of that size
+        :rtype:     boolean
+        """
+        try:
+            remote_file = urllib.request.urlopen(self._url(relpath))
+        except urllib.error.HTTPError:
+            return False
+
+        with closing(remote_file):
+            length = remote_file.headers.get('Content-Length')
+            if (remote_file.getcode() >= 300 or length is None or
+                    int(length) != size):
+                return False
+
+            with open(target, 'wb') as local_file:
+                shutil.copyfileobj(remote_file, local_file, BLOCK_SIZE)
+        return os.path.getsize(target) == size
+
+
+def peer(source):
+    """Get the peer for a source, a directory or an HTTP URL
+
+    :param source:  Path or URL of the download directory of the peer
+    :type source:   string
+    """
+    if source.startswith(('http://', 'https://')):
+        return HTTPPeer(source)
+    return LocalPeer(source)
+
+
+class PeerSources(object):
+    """
+    Peers that are asked for files before they are downloaded.
+    """
+
+    def __init__(self, sources):
+        """
+        Constructor.
+
+        :param sources: Paths or URLs of the download directories of the peers
+        :type sources:  iterable
+        """
+        self.peers = [peer(source) for source in sources]
+        self._checksums = {}
+
+    def __len__(self):
+        return len(self.peers)
+
+    def _checksum(self, peer_source, relpath, md5sums):
+        """Get the checksum the peer has for a file, None if it has none"""
+
+        down_dir, filename = os.path.split(relpath)
+        key = (str(peer_source), down_dir)
+        if key not in self._checksums:
+            content = peer_source.read(os.path.join(down_dir, md5sums))
+            self._checksums[key] = wpd_verify.parse_md5sums(content or '')
+        return self._checksums[key].get(filename)
+
+    def _is_intact(self, peer_source, relpath, target, md5sums):
+        """Does the file taken from the peer match its checksum?"""
+
+        if not md5sums or peer_source.verified(relpath):
+            return True
+        expected = self._checksum(peer_source, relpath, md5sums)
+        return expected is None or wpd_verify.md5sum(target) == expected
+
+    def fetch(self, relpath, target, size, md5sums=None):
+        """Take a file from the first peer that has it
+
+        :param relpath:     Path of the file relative to the download
+                            directory, like en/20150603/enwiki-...
+        :type relpath:      string
+
+        :param target:      Local path the file is saved to
+        :type target:       string
+
+        :param size:        Size of the file on the download site
+        :type size:         int
+
+        :param md5sums:     Name of the checksum file in the dump directory
+        :type md5sums:      string
+
+        :returns:           True if a peer had the file, False otherwise
+        :rtype:             boolean
+        """
+        if size <= 0:
+            return False
+
+        for peer_source in self.peers:
+            try:
+                if not peer_source.fetch(relpath, target, size):
+                    continue
+                if self._is_intact(peer_source, relpath, target, md5sums):
+                    LOG.info('Copied from %s: %s' % (
+                        peer_source, os.path.basename(relpath)))
+                    return True
+                LOG.error('Checksum mismatch on %s: %s' % (
+                    peer_source, relpath))
+            except (IOError, OSError) as err:
+                LOG.error('Could not copy from %s: %s' % (peer_source, err))
+
+            if os.path.exists(target):
+                os.remove(target)
+        return False
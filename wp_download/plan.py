@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+"""Precompiled download plans.
+
+A plan is built once from the configuration and turns (language, date) pairs
+into download URLs without consulting the configuration again.
+"""
+
+import collections
+import datetime
+import fnmatch
+import logging
+import os
+import re
+import string
+import threading
+import urllib.parse
+
+import wp_download.discovery as wpd_disc
+import wp_download.exceptions as wpd_exc
+import wp_download.sqlfilter as wpd_filter
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.DEBUG)
+
+FileSpec = collections.namedtuple('FileSpec', ['name', 'filetype'])
+
+# Layout of the download directory
+DEFAULT_LOCAL_DIR_FORMAT = '${language}/${date}'
+DEFAULT_LATEST_LINK_FORMAT = '${language}/latest'
+
+# Number of dumps whose URLs are cached
+URL_CACHE_SIZE = 256
+
+
+def _local_template(config, section, option, default, sample):
+    """Get a template for local paths and check its placeholders
+
+    :param sample:  Values of all placeholders the template may use
+    :type sample:   dict
+    """
+    template = string.Template(config.get_default(section, option, default))
+    try:
+        template.substitute(sample)
+    except (KeyError, ValueError) as err:
+        raise wpd_exc.TemplateValueError(
+            orig_err=ValueError('Unknown placeholder in %s: %s' % (
+                option, err)),
+            config_file=config.config_file_path, template=option)
+    return template
+
+
+# Values the placeholders of local path templates can take
+_PLACEHOLDER_PATTERNS = {
+    'language': r'[^/]+?',
+    'langcode': r'[^/]+?',
+    'project': r'[^/]+?',
+    'date': r'\d{8}',
+    'year': r'\d{4}',
+    'month': r'\d{2}',
+    'day': r'\d{2}',
+}
+
+
+class LocalLayout(object):
+    """
+    Dump directories of a local_dir_format template.
+
+    Turns directories within the download directory back into the language
+    and date of their dump.
+    """
+
+    def __init__(self, template):
+        """
+        Constructor.
+
+        :param template:    The local_dir_format template
+        :type template:     string.Template
+        """
+        self._template = template
+        components = template.template.strip('/').split('/')
+        self.depth = len(components)
+        self._components = [re.compile(self._regex(component, set()))
+                            for component in components]
+        seen = set()
+        self._path = re.compile('/'.join(
+            self._regex(component, seen) for component in components))
+
+    def _regex(self, component, seen):
+        """Get a regular expression matching a component of the template
+
+        :param seen:    Names of the placeholders that have a group already,
+                        names of new groups are added
+        :type seen:     set
+        """
+        regex = []
+        pos = 0
+        for match in self._template.pattern.finditer(component):
+            regex.append(re.escape(component[pos:match.start()]))
+            pos = match.end()
+            name = match.group('named') or match.group('braced')
+            if name is None:
+                # $$ or a lone $
+                regex.append(re.escape(match.group()[:1]))
+            elif name in seen:
+                regex.append('(?P=%s)' % (name))
+            else:
+                seen.add(name)
+                regex.append('(?P<%s>%s)' % (
+                    name, _PLACEHOLDER_PATTERNS[name]))
+        regex.append(re.escape(component[pos:]))
+        return ''.join(regex)
+
+    def matches(self, level, name):
+        """Can a directory at given level be part of a dump directory?
+
+        :param level:   Depth of the directory within the download
+                        directory, 0 for its sub directories
+        :type level:    int
+
+        :param name:    Name of the directory
+        :type name:     string
+        """
+        return (level < self.depth and
+                self._components[level].fullmatch(name) is not None)
+
+    def parse(self, names):
+        """Get the dump of a directory
+
+        :param names:   Names of the directory and its parents within the
+                        download directory
+        :type names:    list
+
+        :returns:       Tuple of (language, date as YYYYMMDD), None if the
+                        directory is not a dump directory
+        :rtype:         tuple
+        """
+        match = self._path.fullmatch('/'.join(names))
+        if match is None:
+            return None
+        values = match.groupdict()
+
+        date = values.get('date')
+        if date is None and all(values.get(name)
+                                for name in ('year', 'month', 'day')):
+            date = values['year'] + values['month'] + values['day']
+        language = values.get('language')
+        if language is None and values.get('langcode'):
+            language = wpd_disc.wiki_key(
+                values['langcode'] + (values.get('project') or 'wiki'))
+        if not date or not language:
+            return None
+        return language, date
+
+
+class DownloadPlan(object):
+    """
+    Immutable snapshot of everything needed to build download URLs.
+    """
+
+    def __init__(self, config):
+        """
+        Constructor.
+
+        :param config:  Configuration
+        :type config:   wp_download.config.Configuration
+        """
+        self.files = tuple(FileSpec(name, config.get('Filetypes', name))
+                           for name in config.enabled_files())
+        self.languages = tuple(config.enabled_languages())
+
+        scheme, netloc, _, query, anchor = urllib.parse.urlsplit(
+            config.get('Configuration', 'base_url'))
+        self._url_parts = (scheme, netloc, query, anchor)
+
+        self._lang_dir_template = config.string_template(
+            'language_dir_format')
+
+        # Render the per-file placeholders now, so that only language and
+        # date are left to substitute for every URL.
+        filename_template = self._filename_template = \
+            config.string_template('file_format')
+        self._file_templates = tuple(
+            string.Template(filename_template.safe_substitute(
+                filename=spec.name, filetype=spec.filetype))
+            for spec in self.files)
+
+        self._local_dir_template = _local_template(
+            config, 'Templates', 'local_dir_format', DEFAULT_LOCAL_DIR_FORMAT,
+            self._placeholders('en', datetime.datetime.now()))
+        self.layout = LocalLayout(self._local_dir_template)
+        self._latest_link_template = _local_template(
+            config, 'Publish', 'latest_link', DEFAULT_LATEST_LINK_FORMAT,
+            self._placeholders('en'))
+
+        self.filter_format = config.get_default(
+            'Configuration', 'filter_format', 'sql')
+        if self.filter_format not in wpd_filter.FORMATS:
+            raise wpd_exc.ConfigValueError(
+                orig_err=ValueError('Unknown filter_format: %s' % (
+                    self.filter_format)),
+                config_file=config.config_file_path, section='Configuration')
+        self._filters = []
+        if config.has_section('Filters'):
+            for pattern in config.options('Filters'):
+                try:
+                    self._filters.append((pattern, wpd_filter.RowFilter.parse(
+                        config.get('Filters', pattern))))
+                except ValueError as val_err:
+                    raise wpd_exc.ConfigValueError(
+                        orig_err=val_err, config_file=config.config_file_path,
+                        section='Filters')
+        self._filetypes = dict(self.files)
+
+        self._urls = collections.OrderedDict()
+        self._urls_lock = threading.Lock()
+
+    def language_dir(self, language):
+        """Get the remote directory for given language
+
+        :param language:    ISO 631 language code or wiki identifier
+        :type language:     string
+        """
+        langcode, project = wpd_disc.split_key(language)
+        return self._lang_dir_template.substitute(
+            langcode=langcode, project=project)
+
+    @staticmethod
+    def _placeholders(language, date=None):
+        """Get the values of the placeholders of local path templates"""
+
+        langcode, project = wpd_disc.split_key(language)
+        values = {'language': language, 'langcode': langcode,
+                  'project': project}
+        if date:
+            values.update(date=date.strftime('%Y%m%d'),
+                          year=date.strftime('%Y'),
+                          month=date.strftime('%m'),
+                          day=date.strftime('%d'))
+        return values
+
+    def local_dir(self, language, date):
+        """Get the directory of a dump relative to the download directory
+
+        :param language:    ISO 631 language code or wiki identifier
+        :type language:     string
+
+        :param date:        Creation date of the dump
+        :type date:         datetime.datetime
+        """
+        return os.path.join(*self._local_dir_template.substitute(
+            self._placeholders(language, date)).strip('/').split('/'))
+
+    def latest_link(self, language):
+        """Get the path of the latest link of a language relative to the
+        download directory, None if links are disabled
+
+        :param language:    ISO 631 language code or wiki identifier
+        :type language:     string
+        """
+        link = self._latest_link_template.substitute(
+            self._placeholders(language)).strip('/')
+        if not link:
+            return None
+        return os.path.join(*link.split('/'))
+
+    def urls(self, language, date):
+        """Get the URLs of all enabled files of a dump.
+
+        URLs are rendered on first use and cached afterwards. The least
+        recently used dumps are forgotten beyond URL_CACHE_SIZE.
+
+        :param language:    ISO 631 language code or wiki identifier
+        :type language:     string
+
+        :param date:        Creation date of the dump
+        :type date:         datetime.datetime
+
+        :returns:           URLs in the order of the enabled files
+        :rtype:             tuple
+        """
+        key = (language, date)
+        with self._urls_lock:
+            if key in self._urls:
+                self._urls.move_to_end(key)
+                return self._urls[key]
+
+        date_str = date.strftime('%Y%m%d')
+        langcode, project = wpd_disc.split_key(language)
+        prefix = '/'.join([self.language_dir(language), date_str, ''])
+        scheme, netloc, query, anchor = self._url_parts
+
+        urls = tuple(
+            urllib.parse.urlunsplit((
+                scheme, netloc,
+                prefix + template.substitute(langcode=langcode,
+                                             project=project,
+                                             date=date_str),
+                query, anchor))
+            for template in self._file_templates)
+        with self._urls_lock:
+            self._urls[key] = urls
+            if len(self._urls) > URL_CACHE_SIZE:
+                self._urls.popitem(last=False)
+        return urls
+
+    def row_filter(self, language, filename):
+        """Get the row filter of a file as configured in [Filters]
+
+        Patterns without a slash are matched against the filename, all others
+        against ``<language>/<filename>``. The first matching pattern is
+        used. Only files of type sql.gz are filtered.
+
+        :param language:    ISO 631 language code or wiki identifier
+        :type language:     string
+
+        :param filename:    Name of the file in the configuration
+        :type filename:     string
+
+        :returns:           The filter, None if the file is not filtered
+        :rtype:             wp_download.sqlfilter.RowFilter
+        """
+        if self._filetypes.get(filename) != 'sql.gz':
+            return None
+
+        key = '%s/%s' % (language, filename)
+        for pattern, row_filter in self._filters:
+            if fnmatch.fnmatchcase(key if '/' in pattern else filename,
+                                   pattern):
+                return row_filter
+        return None
+
+    def local_names(self, language, date):
+        """Get the local names of all enabled files of a dump
+
+        Filtered files are saved under another name than the remote file,
+        see wp_download.sqlfilter.filtered_name().
+
+        :param language:    ISO 631 language code or wiki identifier
+        :type language:     string
+
+        :param date:        Creation date of the dump
+        :type date:         datetime.datetime
+
+        :returns:           Names in the order of the enabled files
+        :rtype:             tuple
+        """
+        names = []
+        for spec, url in zip(self.files, self.urls(language, date)):
+            name = url.rsplit('/', 1)[-1]
+            if self.row_filter(language, spec.name):
+                name = wpd_filter.filtered_name(name, self.filter_format)
+            names.append(name)
+        return tuple(names)
+
+    def file_url(self, language, date, filename, filetype):
+        """Get the URL of any file of a dump, like its md5sums
+
+        :param language:    ISO 631 language code or wiki identifier
+        :type language:     string
+
+        :param date:        Creation date of the dump
+        :type date:         datetime.datetime
+
+        :param filename:    Name of the file, like md5sums
+        :type filename:     string
+
+        :param filetype:    Type of the file, like txt
+        :type filetype:     string
+        """
+        date_str = date.strftime('%Y%m%d')
+        langcode, project = wpd_disc.split_key(language)
+        scheme, netloc, query, anchor = self._url_parts
+
+        return urllib.parse.urlunsplit((
+            scheme, netloc,
+            '/'.join([self.language_dir(language), date_str,
+                      self._filename_template.substitute(
+                          langcode=langcode, project=project, date=date_str,
+                          filename=filename, filetype=filetype)]),
+            query, anchor))
+
+    def matrix(self, dates):
+        """Get the URLs of all enabled files for several dumps at once.
+
+        :param dates:   Mapping of language codes to dump dates
+        :type dates:    dict
+
+        :returns:       Mapping of language codes to URLs
+        :rtype:         dict
+        """
+        return dict((language, self.urls(language, date))
+                    for language, date in dates.items())
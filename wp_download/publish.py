@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+
+"""Staging and atomic publication of dumps.
+
+With staging enabled the files of a dump are downloaded into a hidden
+staging directory next to its final directory. Once all enabled files are
+complete and verified, the staging directory is renamed to the final
+directory in a single step and the ``latest`` link of the language is
+pointed to it. Consumers therefore never see incomplete dumps.
+
+Every download directory holds a small marker file that records which dump
+it belongs to and where the dump is published within the download
+directory.
+"""
+
+import json
+import logging
+import os
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.DEBUG)
+
+# Description of the dump within each download directory
+MARKER = '.wpd-dump'
+
+STAGING_SUFFIX = '.staging'
+
+
+def staging_dir(final_dir):
+    """Get the staging directory of a final dump directory
+
+    :param final_dir:   The final dump directory, like .../en/20150603
+    :type final_dir:    string
+
+    :returns:           The staging directory, like .../en/.20150603.staging
+    :rtype:             string
+    """
+    parent, name = os.path.split(final_dir.rstrip(os.sep))
+    return os.path.join(parent, '.%s%s' % (name, STAGING_SUFFIX))
+
+
+def is_staging_dir(down_dir):
+    """Is down_dir a staging directory?"""
+
+    name = os.path.basename(down_dir.rstrip(os.sep))
+    return name.startswith('.') and name.endswith(STAGING_SUFFIX)
+
+
+def final_dir(down_dir):
+    """Get the final directory of a staging directory
+
+    :param down_dir:    The staging directory
+    :type down_dir:     string
+    """
+    parent, name = os.path.split(down_dir.rstrip(os.sep))
+    return os.path.join(parent, name[1:-len(STAGING_SUFFIX)])
+
+
+def write_marker(down_dir, language, date, local_dir):
+    """Record which dump a download directory belongs to
+
+    :param down_dir:    The download directory
+    :type down_dir:     string
+
+    :param language:    ISO 631 language code or wiki identifier
+    :type language:     string
+
+    :param date:        Creation date of the dump
+    :type date:         datetime.datetime
+
+    :param local_dir:   Final directory of the dump relative to the download
+                        directory
+    :type local_dir:    string
+    """
+    path = os.path.join(down_dir, MARKER)
+    if os.path.exists(path):
+        return
+    with open(path, 'w') as marker_file:
+        json.dump({'language': language,
+                   'date': date.strftime('%Y%m%d'),
+                   'local_dir': local_dir}, marker_file, sort_keys=True)
+
+
+def read_marker(down_dir):
+    """Get the dump a download directory belongs to
+
+    :returns:   Dict with the keys language, date (YYYYMMDD) and local_dir,
+                None if the directory has no marker
+    :rtype:     dict
+    """
+    try:
+        with open(os.path.join(down_dir, MARKER)) as marker_file:
+            return json.load(marker_file)
+    except (IOError, ValueError):
+        return None
+
+
+def update_link(link_path, target):
+    """Atomically point the symbolic link at link_path to target
+
+    The link is relative, so that the download directory can be moved.
+
+    :param link_path:   Path of the link
+    :type link_path:    string
+
+    :param target:      Path the link should point to
+    :type target:       string
+    """
+    link_dir = os.path.dirname(link_path)
+    if not os.path.exists(link_dir):
+        os.makedirs(link_dir)
+
+    tmp_path = '%s.%d.tmp' % (link_path, os.getpid())
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    os.symlink(os.path.relpath(target, link_dir), tmp_path)
+    os.rename(tmp_path, link_path)
+
+
+def is_latest(down_dir, link_path):
+    """Is the dump in down_dir at least as new as the dump link_path points
+    to?
+
+    Links to directories without marker are replaced.
+
+    :param down_dir:    Directory of a dump
+    :type down_dir:     string
+
+    :param link_path:   Path of the latest link
+    :type link_path:    string
+    """
+    dump = read_marker(down_dir)
+    current = read_marker(link_path) if os.path.isdir(link_path) else None
+    return dump is None or current is None or dump['date'] >= current['date']
+
+
+def publish(down_dir, link_path=None):
+    """Rename a staging directory to its final directory
+
+    The link is only updated if it does not point to a newer dump already.
+
+    :param down_dir:    The staging directory
+    :type down_dir:     string
+
+    :param link_path:   Link that should point to the published dump
+    :type link_path:    string
+
+    :returns:           The final directory, None if another process
+                        published the dump in the meantime
+    :rtype:             string
+    """
+    target = final_dir(down_dir)
+    try:
+        os.rename(down_dir, target)
+    except OSError:
+        if os.path.exists(down_dir) or not os.path.isdir(target):
+            raise
+        return None
+
+    if link_path and is_latest(target, link_path):
+        update_link(link_path, target)
+    elif link_path:
+        LOG.info('Kept %s, it points to a newer dump' % (link_path))
+    LOG.info('Published: %s' % (target))
+    return target
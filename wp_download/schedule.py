@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+"""Scheduling of file transfers.
+
+Transfers are identified by keys of the form ``<language>/<filename>``, like
+``en/pages-articles``. The order in which they are started is determined by
+
+1. dependencies: a transfer is only started once all transfers it depends on
+   have finished,
+2. priority: transfers with higher priority are started first,
+3. size: smallest or largest transfers first, if configured.
+
+Transfers that still tie are started in the order of their keys.
+"""
+
+import fnmatch
+import heapq
+import logging
+import threading
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.DEBUG)
+
+SIZE_ORDERS = ('none', 'smallest', 'largest')
+
+
+class Transfer(object):
+    """
+    A single file transfer.
+    """
+
+    def __init__(self, language, filename, url, path, size=0, priority=0):
+        """
+        Constructor.
+
+        :param language:    ISO 631 language code or wiki identifier
+        :type language:     string
+
+        :param filename:    Name of the file in the configuration
+        :type filename:     string
+
+        :param url:         Download URL of the file
+        :type url:          string
+
+        :param path:        Local path where the file should be saved
+        :type path:         string
+
+        :param size:        Size of the remote file, 0 if unknown
+        :type size:         int
+
+        :param priority:    Transfers with higher priority are started first
+        :type priority:     int
+        """
+        self.language = language
+        self.filename = filename
+        self.key = '%s/%s' % (language, filename)
+        self.url = url
+        self.path = path
+        self.size = size
+        self.priority = priority
+        self.after = set()
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.key)
+
+
+class Scheduler(object):
+    """
+    Run transfers with a number of worker threads in scheduled order.
+    """
+
+    def __init__(self, size_order='none'):
+        """
+        Constructor.
+
+        :param size_order:  One of 'none', 'smallest' or 'largest'
+        :type size_order:   string
+        """
+        assert size_order in SIZE_ORDERS
+        self._size_order = size_order
+        # All transfers that have not finished yet by key
+        self._unfinished = {}
+        # Heap of transfers that can be started right away
+        self._ready = []
+        # Transfers waiting for prerequisites by key
+        self._blocked = {}
+        # Blocked transfers by the key of their prerequisites
+        self._dependents = {}
+        # Transfers waiting for any running transfer to finish
+        self._deferred = []
+        self._running = 0
+        self._cond = threading.Condition()
+
+    @property
+    def running(self):
+        """Number of transfers in progress"""
+
+        return self._running
+
+    def __len__(self):
+        return len(self._unfinished)
+
+    def _sort_key(self, transfer):
+        """Key by which ready transfers are ordered"""
+
+        if self._size_order == 'smallest':
+            size = transfer.size
+        elif self._size_order == 'largest':
+            size = -transfer.size
+        else:
+            size = 0
+        return (-transfer.priority, size, transfer.key)
+
+    def _queue(self, transfer):
+        """Queue transfer as ready or blocked
+
+        Has to be called with the lock held.
+        """
+        prerequisites = [key for key in transfer.after
+                         if key in self._unfinished]
+        if prerequisites:
+            self._blocked[transfer.key] = transfer
+            for key in prerequisites:
+                self._dependents.setdefault(key, []).append(transfer)
+        else:
+            heapq.heappush(self._ready, (self._sort_key(transfer), transfer))
+
+    def _queued(self):
+        """Get all transfers that have not been started
+
+        Has to be called with the lock held.
+        """
+        return ([transfer for _, transfer in self._ready] +
+                list(self._blocked.values()) + self._deferred)
+
+    def add(self, transfer):
+        """Add a transfer to the schedule
+
+        :param transfer:    The transfer
+        :type transfer:     Transfer
+        """
+        with self._cond:
+            self._unfinished[transfer.key] = transfer
+            self._queue(transfer)
+            self._cond.notify_all()
+
+    def add_dependencies(self, rules):
+        """Add dependencies between the transfers in the schedule
+
+        :param rules:   Pairs of (pattern, prerequisites). Transfers whose key
+                        matches pattern depend on all other transfers whose
+                        key matches any of the prerequisite patterns.
+        :type rules:    iterable
+        """
+        with self._cond:
+            queued = self._queued()
+            keys = list(self._unfinished)
+            for pattern, prerequisites in rules:
+                for transfer in queued:
+                    if not fnmatch.fnmatchcase(transfer.key, pattern):
+                        continue
+                    for prerequisite in prerequisites:
+                        transfer.after.update(
+                            key for key in fnmatch.filter(keys, prerequisite)
+                            if key != transfer.key)
+
+            self._ready, self._blocked, self._dependents = [], {}, {}
+            self._deferred = []
+            for transfer in queued:
+                self._queue(transfer)
+
+    def _next(self):
+        """Remove and return the next transfer, None if all are done
+
+        Has to be called with the lock held.
+        """
+        while True:
+            if self._ready:
+                return heapq.heappop(self._ready)[1]
+
+            if self._running:
+                self._cond.wait()
+                continue
+
+            if self._deferred:
+                # Nothing runs anymore that deferred transfers could wait for
+                for transfer in self._deferred:
+                    self._queue(transfer)
+                self._deferred = []
+                continue
+
+            if self._blocked:
+                # Nothing will change anymore, break dependency cycles
+                transfer = min(self._blocked.values(), key=self._sort_key)
+                LOG.error('Unsatisfiable dependencies: %s' % (transfer.key))
+                del self._blocked[transfer.key]
+                return transfer
+
+            return None
+
+    def _finish(self, transfer):
+        """Mark transfer as finished and unblock its dependents
+
+        Has to be called with the lock held.
+        """
+        self._unfinished.pop(transfer.key, None)
+
+        for dependent in self._dependents.pop(transfer.key, []):
+            if dependent.key in self._blocked and not any(
+                    key in self._unfinished for key in dependent.after):
+                del self._blocked[dependent.key]
+                self._queue(dependent)
+
+        for deferred in self._deferred:
+            self._queue(deferred)
+        self._deferred = []
+
+    def defer(self, transfer):
+        """Put a transfer back until another running transfer has finished
+
+        This is meant to be called by a worker for the transfer it is
+        currently running.
+
+        :param transfer:    The transfer
+        :type transfer:     Transfer
+        """
+        with self._cond:
+            self._deferred.append(transfer)
+
+    def _work(self, worker, slots):
+        """Run transfers until the schedule is empty"""
+
+        while True:
+            if slots:
+                slots.acquire()
+
+            with self._cond:
+                transfer = self._next()
+                if transfer is None:
+                    self._cond.notify_all()
+                    if slots:
+                        slots.release()
+                    return
+                self._running += 1
+
+            try:
+                worker(transfer)
+            except Exception as err:
+                LOG.error('Transfer failed: %s' % (transfer.key))
+                LOG.error(err)
+            finally:
+                if slots:
+                    slots.release()
+                with self._cond:
+                    self._running -= 1
+                    if transfer not in self._deferred:
+                        self._finish(transfer)
+                    self._cond.notify_all()
+
+    def run(self, worker, jobs=1, slots=None):
+        """Run all transfers
+
+        :param worker:  Callable that performs a single transfer. It may put
+                        the transfer back with defer().
+        :type worker:   callable
+
+        :param jobs:    Maximal number of transfers that run at the same time
+        :type jobs:     int
+
+        :param slots:   Object with acquire() and release() methods that
+                        further limits the number of running transfers, like
+                        a ConcurrencyController
+        :type slots:    object
+        """
+        if jobs <= 1:
+            self._work(worker, slots)
+            return
+
+        threads = [threading.Thread(target=self._work, args=(worker, slots),
+                                    name='transfer-%d' % (i))
+                   for i in range(jobs)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        for thread in threads:
+            # Join with a timeout to stay responsive to KeyboardInterrupt
+            while thread.is_alive():
+                thread.join(1)
@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+"""Row filters for SQL dumps.
+
+SQL dumps like ``pagelinks`` are filtered while they are downloaded, so that
+only the wanted rows are stored. The gzip stream is decompressed on the fly,
+the column names are taken from the ``CREATE TABLE`` statement and the rows of
+the ``INSERT`` statements are matched one by one. Kept rows are written as
+gzip compressed SQL or as gzip compressed tab separated values in the format
+of ``LOAD DATA INFILE``.
+
+Conditions are whitespace separated and all of them have to hold::
+
+    pl_namespace=0,14 pl_from_namespace!=2
+
+Values are compared with the literal in the dump, quotes of strings are
+left out.
+"""
+
+import gzip
+import os
+import re
+import zlib
+
+import wp_download.exceptions as wpd_exc
+
+FORMATS = ('sql', 'tsv')
+
+# INSERT statements and other lines are expected to be shorter than this
+MAX_LINE = 16 * 1024 * 1024
+
+# Quoted string with backslash escapes
+_STRING = rb"'[^'\\]*(?:\\.[^'\\]*)*'"
+_FIELD = rb"(?:" + _STRING + rb"|[^,'()]*)"
+
+_CONDITION = re.compile(r'^(\w+)(!?=)(.*)$')
+_INSERT = re.compile(rb'INSERT INTO `([^`]+)` VALUES ')
+_CREATE = re.compile(rb'^CREATE TABLE `([^`]+)`')
+_COLUMN = re.compile(rb'^\s+`([^`]+)` ')
+
+
+def filtered_name(filename, output_format):
+    """Get the name of the filtered file of a dump file
+
+    :param filename:        Name of the dump file, like
+                            enwiki-20150602-pagelinks.sql.gz
+    :type filename:         string
+
+    :param output_format:   One of 'sql' or 'tsv'
+    :type output_format:    string
+    """
+    if filename.endswith('.sql.gz'):
+        filename = filename[:-len('.sql.gz')]
+    return '%s.filtered.%s.gz' % (filename, output_format)
+
+
+def _tsv_field(field):
+    """Convert an SQL literal to a field of LOAD DATA INFILE"""
+
+    if field.startswith(b"'"):
+        # Both understand the same escapes, except for quotes
+        return field[1:-1].replace(b"\\'", b"'").replace(b'\\"', b'"')
+    if field == b'NULL':
+        return b'\\N'
+    return field
+
+
+def _literals(value):
+    """Get the SQL literals a configured value matches"""
+
+    raw = value.encode('utf-8')
+    return (raw, b"'" + raw.replace(b'\\', b'\\\\').replace(
+        b"'", b"\\'") + b"'")
+
+
+class RowFilter(object):
+    """
+    Conditions rows have to meet.
+    """
+
+    def __init__(self, conditions):
+        """
+        Constructor.
+
+        :param conditions:  Tuples of (column, values, negate). Rows are kept
+                            if the value of each column is in values, or not
+                            in values if negate is True.
+        :type conditions:   list
+        """
+        self.conditions = list(conditions)
+
+    @classmethod
+    def parse(cls, spec):
+        """Get the filter described by spec
+
+        :param spec:    Conditions like 'pl_namespace=0,14 pl_title!=Foo'
+        :type spec:     string
+
+        :raises ValueError: If spec contains an invalid condition
+        """
+        conditions = []
+        for condition in spec.split():
+            match = _CONDITION.match(condition)
+            if match is None:
+                raise ValueError('Invalid condition: %s' % (condition))
+            column, operator, values = match.groups()
+            conditions.append((column, set(
+                literal for value in values.split(',')
+                for literal in _literals(value)), operator == '!='))
+        if not conditions:
+            raise ValueError('No conditions')
+        return cls(conditions)
+
+
+class SQLFilter(object):
+    """
+    Writable file that filters a gzip compressed SQL dump into another file.
+
+    Data is processed as it is written, so memory use is bounded by the
+    length of the longest INSERT statement.
+    """
+
+    def __init__(self, file_obj, row_filter, output_format='sql',
+                 fsync=False):
+        """
+        Constructor.
+
+        :param file_obj:        File the kept rows are written to
+        :type file_obj:         file
+
+        :param row_filter:      Conditions of the kept rows
+        :type row_filter:       RowFilter
+
+        :param output_format:   One of 'sql' or 'tsv'
+        :type output_format:    string
+
+        :param fsync:           Force the output to disk on close()
+        :type fsync:            boolean
+        """
+        assert output_format in FORMATS
+        self._file = file_obj
+        self._filter = row_filter
+        self._sql = output_format == 'sql'
+        self._fsync = fsync
+        self._out = gzip.GzipFile(filename='', mode='wb', compresslevel=6,
+                                  fileobj=file_obj)
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._buf = b''
+
+        self._columns = {}
+        self._create = None
+        # Row patterns and conditions by table
+        self._tables = {}
+
+        self.rows = 0
+        self.kept = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def flush(self):
+        self._file.flush()
+
+    def write(self, data):
+        """Decompress and filter data
+
+        :raises FilterError:    If the dump cannot be decompressed or parsed
+        """
+        try:
+            text = self._decompressor.decompress(data)
+            while self._decompressor.eof and self._decompressor.unused_data:
+                # Next member of a multi member gzip file
+                data = self._decompressor.unused_data
+                self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                text += self._decompressor.decompress(data)
+        except zlib.error as zlib_err:
+            raise wpd_exc.FilterError('Invalid gzip data: %s' % (zlib_err))
+
+        buf = self._buf + text
+        self._buf = buf[self._parse(buf):]
+        if len(self._buf) > MAX_LINE:
+            raise wpd_exc.FilterError('Line too long')
+
+    def close(self):
+        """Write the remaining output
+
+        The file itself is not closed.
+
+        :raises FilterError:    If the dump is incomplete
+        """
+        if self._buf or not self._decompressor.eof:
+            raise wpd_exc.FilterError('Incomplete dump')
+        self._out.close()
+        self._file.flush()
+        if self._fsync:
+            os.fsync(self._file.fileno())
+
+    def _table(self, table):
+        """Get the row patterns and conditions of a table
+
+        :returns:   Tuple of (rows, fields, conditions). rows matches a row
+                    and captures the row and the fields of the conditions,
+                    fields captures all fields of a row. Conditions are
+                    tuples of (group, values, negate).
+        """
+        if table in self._tables:
+            return self._tables[table]
+
+        columns = self._columns.get(table)
+        if not columns:
+            raise wpd_exc.FilterError('No columns for table: %s' % (
+                table.decode('utf-8')))
+
+        fields = [_FIELD] * len(columns)
+        conditions = []
+        for column, values, negate in self._filter.conditions:
+            if column not in columns:
+                raise wpd_exc.FilterError('No such column in %s: %s' % (
+                    table.decode('utf-8'), column))
+            index = columns.index(column)
+            if fields[index] == _FIELD:
+                fields[index] = b'(' + _FIELD + b')'
+            conditions.append((index, values, negate))
+
+        # Group numbers of the captured fields, the row is group 1
+        groups = dict((index, group) for group, index in enumerate(
+            sorted(set(index for index, _, _ in conditions)), 1))
+        self._tables[table] = (
+            re.compile(rb',?(\(' + b','.join(fields) + rb'\))'),
+            re.compile(rb'\(' + b','.join(
+                [b'(' + _FIELD + b')'] * len(columns)) + rb'\)'),
+            [(groups[index], values, negate)
+             for index, values, negate in conditions])
+        return self._tables[table]
+
+    def _parse_line(self, line):
+        """Handle a line other than an INSERT statement"""
+
+        if self._create is not None:
+            match = _COLUMN.match(line)
+            if match:
+                self._columns[self._create].append(
+                    match.group(1).decode('utf-8'))
+            elif line.startswith(b')'):
+                self._create = None
+        else:
+            match = _CREATE.match(line)
+            if match:
+                self._create = match.group(1)
+                self._columns[self._create] = []
+
+        if self._sql:
+            self._out.write(line)
+
+    def _parse_insert(self, table, buf, start, end):
+        """Filter the rows of an INSERT statement in buf[start:end]
+
+        The rows are matched by a regular expression as a whole and only the
+        fields of the conditions are compared, so that filtering keeps up
+        with the download.
+        """
+        rows, fields, conditions = self._table(table)
+        if not buf.startswith(b';', end - 1):
+            raise wpd_exc.FilterError('Incomplete INSERT into %s' % (
+                table.decode('utf-8')))
+
+        matched = rows.findall(buf, start, end - 1)
+        # The rows and the commas between them cover the whole statement
+        if sum(len(found[0]) for found in matched) + len(matched) - 1 != (
+                end - 1 - start):
+            raise wpd_exc.FilterError(
+                'Rows do not match the columns of table %s' % (
+                    table.decode('utf-8')))
+
+        kept = matched
+        for group, values, negate in conditions:
+            if negate:
+                kept = [found for found in kept if found[group] not in values]
+            else:
+                kept = [found for found in kept if found[group] in values]
+        self.rows += len(matched)
+        self.kept += len(kept)
+        if not kept:
+            return
+
+        if self._sql:
+            self._out.write(b'INSERT INTO `%s` VALUES %s;\n' % (
+                table, b','.join(found[0] for found in kept)))
+        else:
+            self._out.write(b''.join(
+                b'\t'.join(map(_tsv_field, fields.match(found[0]).groups())) +
+                b'\n' for found in kept))
+
+    def _parse(self, buf):
+        """Filter all complete lines in buf
+
+        mysqldump escapes line breaks in strings, so every INSERT statement
+        is a single line.
+
+        :returns:   Position after the last complete line
+        :rtype:     int
+        """
+        pos = 0
+        while True:
+            end = buf.find(b'\n', pos)
+            if end < 0:
+                return pos
+            match = _INSERT.match(buf, pos)
+            if match:
+                self._parse_insert(match.group(1), buf, match.end(), end)
+            else:
+                self._parse_line(buf[pos:end + 1])
+            pos = end + 1
@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+
+"""Status of the local dump tree.
+
+An index of each download directory is kept in the cache directory. It
+holds the listing of every directory that leads to a dump directory, as
+laid out by ``local_dir_format``, together with the modification time of the
+directory. Directories are only listed again if
+their modification time changed, which happens whenever a file is created,
+renamed or removed in them, or if it is within MTIME_TICK of the time they
+were listed, as changes within the same tick of the file system clock leave
+the modification time alone. Only partial downloads, which grow without
+touching their directory, are looked at on every refresh.
+
+The latest dump dates seen on the download site are remembered in the cache
+directory, so that the status can tell outdated dumps without any request.
+"""
+
+import collections
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import wp_download.verify as wpd_verify
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.DEBUG)
+
+# Indexes of download directories, within the cache directory
+INDEX_DIR = 'index'
+
+# Latest known dump dates on the download site, within the cache directory
+REMOTE_DATES = 'dump-dates.json'
+
+PARTIAL_SUFFIX = '.part'
+
+# Seconds within which changes may not change the modification time of a
+# directory, file systems like NFS or FAT have a coarse clock
+MTIME_TICK = 2.0
+
+_REMOTE_DATES_LOCK = threading.Lock()
+
+LanguageStatus = collections.namedtuple('LanguageStatus', [
+    'language',     # ISO 631 language code or wiki identifier
+    'date',         # Date of the latest local dump as YYYYMMDD or None
+    'remote_date',  # Latest known date on the download site or None
+    'state',        # missing, stale, partial, incomplete or complete
+    'files',        # Names of the expected files that are complete
+    'missing',      # Names of the expected files that are not complete
+    'partial',      # Mapping of partial file names to their size
+    'verified',     # Names of the complete files with a matching checksum
+    'size',         # Bytes used by the latest dump
+    'total_size',   # Bytes used by all dumps of the language
+])
+
+
+def _write_json(path, content):
+    """Atomically replace the JSON file at path"""
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'w') as json_file:
+        json.dump(content, json_file, sort_keys=True)
+    os.rename(tmp_path, path)
+
+
+def index_file(cache_dir, path):
+    """Get the path of the index of a download directory
+
+    :param cache_dir:   The cache directory
+    :type cache_dir:    string
+
+    :param path:        The download directory
+    :type path:         string
+    """
+    return os.path.join(cache_dir, INDEX_DIR, '%s.json' % (
+        hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()))
+
+
+def load_remote_dates(cache_dir):
+    """Get the latest known dump dates on the download site
+
+    :param cache_dir:   The cache directory
+    :type cache_dir:    string
+
+    :returns:           Mapping of languages to dates as YYYYMMDD
+    :rtype:             dict
+    """
+    try:
+        with open(os.path.join(cache_dir, REMOTE_DATES)) as dates_file:
+            return json.load(dates_file)
+    except (IOError, ValueError):
+        return {}
+
+
+def record_remote_date(cache_dir, language, date):
+    """Remember the latest dump date of a language on the download site
+
+    :param cache_dir:   The cache directory
+    :type cache_dir:    string
+
+    :param language:    ISO 631 language code or wiki identifier
+    :type language:     string
+
+    :param date:        Date of the latest dump
+    :type date:         datetime.datetime
+    """
+    date_str = date.strftime('%Y%m%d')
+    with _REMOTE_DATES_LOCK:
+        dates = load_remote_dates(cache_dir)
+        if dates.get(language) == date_str:
+            return
+        dates[language] = date_str
+        try:
+            _write_json(os.path.join(cache_dir, REMOTE_DATES), dates)
+        except (IOError, OSError) as err:
+            LOG.debug('Could not remember dump date: %s' % (err))
+
+
+class DumpIndex(object):
+    """
+    Incrementally refreshed index of a download directory.
+
+    The index mirrors the directories down to the dump directories, like for
+    the default layout ``${language}/${date}``::
+
+        {'mtime': ...,
+         'dirs': {'en': {'mtime': ...,
+                         'dirs': {'20150603': {'mtime': ...,
+                                               'files': {...},
+                                               'verified': [...]}}}}}
+
+    where files maps file names to their size.
+    """
+
+    def __init__(self, path, index_path, layout=None):
+        """
+        Constructor.
+
+        :param path:        The download directory
+        :type path:         string
+
+        :param index_path:  File the index is kept in, see index_file()
+        :type index_path:   string
+
+        :param layout:      Layout of the dump directories, the default
+                            layout if None
+        :type layout:       wp_download.plan.LocalLayout
+        """
+        if layout is None:
+            import string
+
+            import wp_download.plan as wpd_plan
+
+            layout = wpd_plan.LocalLayout(string.Template(
+                wpd_plan.DEFAULT_LOCAL_DIR_FORMAT))
+
+        self.path = path
+        self._layout = layout
+        self._index_file = index_path
+        self._index = self._load()
+        self._changed = False
+
+    def _load(self):
+        """Read the index file, an empty index if there is none"""
+
+        try:
+            with open(self._index_file) as index_file:
+                index = json.load(index_file)
+        except (IOError, ValueError):
+            return {'mtime': None, 'dirs': {}}
+        if not isinstance(index, dict) or 'dirs' not in index:
+            return {'mtime': None, 'dirs': {}}
+        return index
+
+    def save(self):
+        """Write the index file if anything changed"""
+
+        if not self._changed:
+            return
+        try:
+            _write_json(self._index_file, self._index)
+        except (IOError, OSError) as err:
+            LOG.debug('Could not save index: %s' % (err))
+        else:
+            self._changed = False
+
+    @staticmethod
+    def _unchanged(entry, mtime):
+        """Is the directory of an index entry unchanged since it was
+        listed?"""
+
+        return (mtime == entry.get('mtime') and
+                entry.get('listed', 0) - mtime > MTIME_TICK)
+
+    def _subdirs(self, entry, path, level):
+        """Update the sub directories of an index entry if path changed
+
+        :param entry:   Index entry with the keys mtime and dirs
+        :type entry:    dict
+
+        :param path:    Directory of the entry
+        :type path:     string
+
+        :param level:   Depth of the sub directories within the download
+                        directory
+        :type level:    int
+
+        :returns:       False if path does not exist anymore
+        :rtype:         boolean
+        """
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return False
+        if self._unchanged(entry, mtime):
+            return True
+
+        listed = time.time()
+        subdirs = entry.setdefault('dirs', {})
+        found = set(name for name in os.listdir(path)
+                    if not name.startswith('.') and
+                    self._layout.matches(level, name) and
+                    os.path.isdir(os.path.join(path, name)))
+        for name in set(subdirs) - found:
+            del subdirs[name]
+        for name in found - set(subdirs):
+            subdirs[name] = {'mtime': None}
+
+        entry.update(mtime=mtime, listed=listed)
+        self._changed = True
+        return True
+
+    def _scan_dump(self, dump, down_dir):
+        """Update the files of a dump directory if it changed
+
+        :returns:   False if down_dir does not exist anymore
+        :rtype:     boolean
+        """
+        try:
+            mtime = os.stat(down_dir).st_mtime
+        except OSError:
+            return False
+
+        if not self._unchanged(dump, mtime):
+            listed = time.time()
+            files = {}
+            for name in os.listdir(down_dir):
+                if name.startswith('.'):
+                    continue
+                try:
+                    files[name] = os.path.getsize(os.path.join(down_dir, name))
+                except OSError:
+                    continue
+            state = wpd_verify.load_state(down_dir)
+            dump.update(mtime=mtime, listed=listed, files=files,
+                        verified=sorted(
+                            name for name in files
+                            if wpd_verify.is_verified(down_dir, name, state)))
+            self._changed = True
+        else:
+            # Partial files grow without changing their directory
+            for name in dump['files']:
+                if name.endswith(PARTIAL_SUFFIX):
+                    try:
+                        size = os.path.getsize(os.path.join(down_dir, name))
+                    except OSError:
+                        continue
+                    if size != dump['files'][name]:
+                        dump['files'][name] = size
+                        self._changed = True
+        return True
+
+    def _refresh(self, entry, path, names, dumps):
+        """Refresh the sub directories of an index entry
+
+        :param names:   Names of path and its parents within the download
+                        directory
+        :type names:    list
+
+        :param dumps:   Mapping the dumps found are added to, see refresh()
+        :type dumps:    dict
+        """
+        for name, subdir in list(entry['dirs'].items()):
+            subdir_path = os.path.join(path, name)
+            subdir_names = names + [name]
+            if len(subdir_names) < self._layout.depth:
+                exists = self._subdirs(subdir, subdir_path, len(subdir_names))
+                if exists:
+                    self._refresh(subdir, subdir_path, subdir_names, dumps)
+            else:
+                exists = self._scan_dump(subdir, subdir_path)
+                dump = self._layout.parse(subdir_names)
+                if exists and dump:
+                    language, date = dump
+                    dumps.setdefault(language, {})[date] = subdir
+
+            if not exists:
+                del entry['dirs'][name]
+                self._changed = True
+
+    def refresh(self):
+        """Bring the index up to date with the download directory
+
+        :returns:   Mapping of languages to mappings of dump dates to dicts
+                    with the keys files and verified
+        :rtype:     dict
+        """
+        if not self._subdirs(self._index, self.path, 0):
+            self._index = {'mtime': None, 'dirs': {}}
+            return {}
+
+        dumps = {}
+        self._refresh(self._index, self.path, [], dumps)
+        self.save()
+        return dumps
+
+
+def language_status(language, dumps, expected, remote_date=None):
+    """Get the status of the latest local dump of a language
+
+    :param language:    ISO 631 language code or wiki identifier
+    :type language:     string
+
+    :param dumps:       Index entries of the local dumps by date
+    :type dumps:        dict
+
+    :param expected:    Callable that returns the names of the files
+                        expected in the dump of a date (YYYYMMDD)
+    :type expected:     callable
+
+    :param remote_date: Latest known date on the download site as YYYYMMDD
+    :type remote_date:  string
+
+    :rtype:             LanguageStatus
+    """
+    total_size = sum(sum(dump.get('files', {}).values())
+                     for dump in dumps.values())
+    if not dumps:
+        return LanguageStatus(language, None, remote_date, 'missing', [], [],
+                              {}, [], 0, 0)
+
+    date = max(dumps)
+    files = dumps[date].get('files', {})
+    names = expected(date)
+    complete = [name for name in names if name in files]
+    missing = [name for name in names if name not in files]
+    partial = dict((name, size) for name, size in files.items()
+                   if name.endswith(PARTIAL_SUFFIX))
+    verified = [name for name in dumps[date].get('verified', [])
+                if name in complete]
+
+    if remote_date and remote_date > date:
+        state = 'stale'
+    elif partial:
+        state = 'partial'
+    elif missing:
+        state = 'incomplete'
+    else:
+        state = 'complete'
+
+    return LanguageStatus(language, date, remote_date, state, complete,
+                          missing, partial, verified, sum(files.values()),
+                          total_size)
+
+
+def status(config, path, languages=None):
+    """Get the status of the local dumps
+
+    :param config:      Configuration
+    :type config:       wp_download.config.Configuration
+
+    :param path:        The download directory
+    :type path:         string
+
+    :param languages:   Languages to report, all enabled and all local
+                        languages if empty
+    :type languages:    list
+
+    :returns:           Status of each language sorted by language
+    :rtype:             list of LanguageStatus
+    """
+    import datetime
+
+    import wp_download.plan as wpd_plan
+
+    plan = wpd_plan.DownloadPlan(config)
+    dumps = DumpIndex(path, index_file(config.cache_dir, path),
+                      plan.layout).refresh()
+    remote_dates = load_remote_dates(config.cache_dir)
+
+    if not languages:
+        languages = set(dumps) | set(plan.languages)
+
+    def expected(language):
+        return lambda date: list(plan.local_names(
+            language, datetime.datetime.strptime(date, '%Y%m%d')))
+
+    return [language_status(language, dumps.get(language, {}),
+                            expected(language), remote_dates.get(language))
+            for language in sorted(languages)]
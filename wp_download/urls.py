@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+"""Dump dates and file URLs on the download site.
+
+The URL handler only needs the configuration and the HTTP cache, so commands
+that do not transfer files, like ``plan`` and ``verify``, use it without the
+download machinery.
+"""
+
+import datetime
+import json
+import logging
+import os
+import re
+import time
+import urllib.parse
+
+import wp_download.discovery as wpd_disc
+import wp_download.httpcache as wpd_cache
+import wp_download.plan as wpd_plan
+import wp_download.status as wpd_status
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.DEBUG)
+
+
+class URLHandler(object):
+    """
+    Handler for Wikipedia dump download URLs
+    """
+
+    def __init__(self, config, options=None):
+        """
+        Constructor.
+
+        :param config:	Configuration
+
+        :param options: Options of the command line, see wp-download --help.
+                        ``offline``, ``timeout`` and ``custom_dump`` are
+                        used.
+        """
+        assert config
+        self._config = config
+        self._offline = bool(options and options.offline)
+
+        self._http_cache = wpd_cache.HTTPCache(
+            os.path.join(self._config.cache_dir, 'http'),
+            max_size=self._config.get_default(
+                'Configuration', 'http_cache_size', 50,
+                self._config.getint) * 1024 * 1024,
+            offline=self._offline,
+            timeout=options.timeout if options else None)
+        self._date_matcher = re.compile(r'<a href="(\d{8})/">.*/</a>')
+
+        self._host = self._config.get('Configuration', 'base_url')
+        self._plan = wpd_plan.DownloadPlan(self._config)
+        self._latest_dates = {}
+        self._dates_ttl = self._config.get_default(
+            'Configuration', 'dump_dates_ttl', 600, self._config.getint)
+
+        self._custom_dump = []
+        if options and options.custom_dump:
+            self._custom_dump.extend(options.custom_dump)
+
+    @property
+    def plan(self):
+        """Get the precompiled download plan"""
+
+        return self._plan
+
+    def languages(self):
+        """Get all enabled languages and discovered wikis
+
+        Wikis are discovered on the download site if this is enabled in the
+        ``[Discovery]`` section of the configuration.
+
+        :returns:   Sorted language codes and wiki identifiers
+        :rtype:     list
+        """
+        languages = set(self._config.enabled_languages())
+
+        if self._config.get_default('Discovery', 'enabled', False,
+                                    self._config.getboolean):
+            languages.update(wpd_disc.WikiList(
+                self._config, self._offline).keys())
+
+        return sorted(languages)
+
+    def language_dir(self, language):
+        """Get the directory for given language
+
+        :param language:    ISO 631 language code
+        :type language:     string
+        """
+        return self._plan.language_dir(language)
+
+    def language_url(self, language):
+        """Get the dump location for given language
+
+        :param language:    ISO 631 language code
+        :type language:     string
+        """
+        return urllib.parse.urljoin(self._host, self.language_dir(language))
+
+    def fetch(self, url):
+        """Get the content of a small file, like an index page
+
+        Responses are kept in the HTTP cache and revalidated on later calls.
+
+        :param url:     URL of the file
+        :type url:      string
+
+        :raises IOError:    If the file is neither retrievable nor cached
+
+        :returns:           The decoded content
+        :rtype:             string
+        """
+        return self._http_cache.get(url).decode('utf-8')
+
+    def dump_dates(self, url):
+        """Iterator containing datetime objects that correspond to the creation
+        dates of the dumps found at given url.
+
+        :param url: URL pointing to a mediawiki language download page
+        :type url:  string
+
+        :raises ValueError: A ValueError is raised if no date could be
+                            extracted from given URL.
+        """
+        try:
+            return (datetime.datetime.strptime(date, '%Y%m%d') for date in
+                    self._date_matcher.findall(self.fetch(url)))
+        except IOError as io_err:
+            LOG.error(io_err)
+            LOG.error('Could not retrieve: %s' % (url))
+            raise io_err
+
+    def latest_dump_date(self, language):
+        """Get the lates dump date for given language.
+
+        Dump dates are cached for dump_dates_ttl seconds.
+
+        :raises ValueError: A ValueError is raised if no date could be
+                            extracted from given URL.
+
+        :returns:   The latest dump date
+        :rtype:     datetime.datetime
+        """
+        custom_dates = dict(
+            [pair.split(':', 1) for pair in self._custom_dump])
+        if language in custom_dates:
+            return datetime.datetime.strptime(custom_dates[language], '%Y%m%d')
+
+        cached = self._latest_dates.get(language)
+        if cached and time.time() - cached[0] < self._dates_ttl:
+            return cached[1]
+
+        dates = [ d for d in self.dump_dates(self.language_url(language)) ]
+        if dates:
+            wpd_status.record_remote_date(
+                self._config.cache_dir, language, max(dates))
+        dates.append(datetime.datetime.strptime('19000101', '%Y%m%d'))
+        self._latest_dates[language] = (time.time(), max(dates))
+        return max(dates)
+
+    def file_sizes(self, language, date):
+        """Get the sizes of all files of a dump from its dump status.
+
+        :param language:    ISO 631 language code or wiki identifier
+        :type language:     string
+
+        :param date:        Creation date of the dump
+        :type date:         datetime.datetime
+
+        :returns:           Mapping of file names to sizes, empty if the dump
+                            status is not available.
+        :rtype:             dict
+        """
+        url = '/'.join([self.language_url(language), date.strftime('%Y%m%d'),
+                        'dumpstatus.json'])
+        try:
+            status = json.loads(self.fetch(url))
+        except (IOError, ValueError) as err:
+            LOG.debug('No dump status for %s: %s' % (language, err))
+            return {}
+
+        return dict((filename, info.get('size', 0))
+                    for job in status.get('jobs', {}).values()
+                    for filename, info in job.get('files', {}).items())
+
+    def urls_for_language(self, language):
+        """Iterator for all file URLs to download.
+
+        This function will parse the provided wp-download configuration files,
+        query the WikiMedia download website
+
+        :param language:    ISO 631 language code
+        :type language:     string
+
+        :raises ValueError: A ValueError is raised if URL construction failed.
+        """
+        try:
+            latest = self.latest_dump_date(language)
+        except IOError as io_err:
+            LOG.error('Could not get dump date for %s!' % (language))
+            LOG.error('Skip: %s'%(language))
+            LOG.error(io_err)
+            return
+
+        LOG.info('Latest dump for (%s) is from %s' % (
+            language, latest.strftime('%A %d %B %Y')))
+
+        for url in self._plan.urls(language, latest):
+            yield url
+
+    def urls_for_languages(self, languages):
+        """Get the URLs of all files to download for several languages.
+
+        Languages whose dump date cannot be determined are left out.
+
+        :param languages:   ISO 631 language codes
+        :type languages:    iterable
+
+        :returns:           Mapping of language codes to URLs
+        :rtype:             dict
+        """
+        dates = {}
+        for language in languages:
+            try:
+                dates[language] = self.latest_dump_date(language)
+            except IOError as io_err:
+                LOG.error('Could not get dump date for %s!' % (language))
+                LOG.error(io_err)
+        return self._plan.matrix(dates)
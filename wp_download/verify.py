@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+"""Verification of downloaded dumps against their published checksums.
+
+The results are kept in a state file within each dump directory together with
+size and modification time of the verified files, so that unchanged files are
+not hashed again.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.DEBUG)
+
+# Name and type of the checksum file of each dump
+MD5SUMS = ('md5sums', 'txt')
+
+# Verification results within each dump directory
+STATE_FILE = '.wpd-verified'
+
+
+def md5sum(path, block_size=1024 * 1024):
+    """Get the MD5 hex digest of the file at path
+
+    :param path:        Path of the file
+    :type path:         string
+
+    :param block_size:  Number of bytes read at once
+    :type block_size:   int
+    """
+    digest = hashlib.md5()
+    with open(path, 'rb') as local_file:
+        for block in iter(lambda: local_file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_md5sums(content):
+    """Get checksums from the content of an md5sums file
+
+    :param content: Lines of the form '<md5>  <filename>'
+    :type content:  string
+
+    :returns:       Mapping of file names to MD5 hex digests
+    :rtype:         dict
+    """
+    checksums = {}
+    for line in content.splitlines():
+        parts = line.split()
+        if len(parts) == 2:
+            checksums[parts[1].lstrip('*')] = parts[0].lower()
+    return checksums
+
+
+def load_state(down_dir):
+    """Get the verification results of a dump directory
+
+    :param down_dir:    The dump directory
+    :type down_dir:     string
+
+    :returns:           Mapping of file names to dicts with the keys size,
+                        mtime, md5 and ok
+    :rtype:             dict
+    """
+    try:
+        with open(os.path.join(down_dir, STATE_FILE)) as state_file:
+            return json.load(state_file)
+    except (IOError, ValueError):
+        return {}
+
+
+def save_state(down_dir, state):
+    """Save the verification results of a dump directory"""
+
+    path = os.path.join(down_dir, STATE_FILE)
+    with open(path + '.tmp', 'w') as state_file:
+        json.dump(state, state_file, sort_keys=True)
+    os.rename(path + '.tmp', path)
+
+
+def is_verified(down_dir, filename, state=None):
+    """Has the file been verified successfully in its current version?
+
+    :param down_dir:    The dump directory
+    :type down_dir:     string
+
+    :param filename:    Name of the file
+    :type filename:     string
+
+    :param state:       Verification results, loaded if None
+    :type state:        dict
+    """
+    if state is None:
+        state = load_state(down_dir)
+    entry = state.get(filename)
+    if not entry or not entry.get('ok'):
+        return False
+    try:
+        stat = os.stat(os.path.join(down_dir, filename))
+    except OSError:
+        return False
+    return (entry['size'], entry['mtime']) == (stat.st_size, stat.st_mtime)
+
+
+def verify_directory(down_dir, checksums):
+    """Verify all files of a dump directory that have a checksum
+
+    Files that are missing or still partial are left out.
+
+    :param down_dir:    The dump directory
+    :type down_dir:     string
+
+    :param checksums:   Mapping of file names to MD5 hex digests
+    :type checksums:    dict
+
+    :returns:           Mapping of file names to True if the checksum matched
+                        and False otherwise
+    :rtype:             dict
+    """
+    state = load_state(down_dir)
+    results = {}
+
+    for filename, expected in sorted(checksums.items()):
+        path = os.path.join(down_dir, filename)
+        if not os.path.isfile(path):
+            continue
+
+        stat = os.stat(path)
+        entry = state.get(filename)
+        if not entry or (entry['size'], entry['mtime'], entry['md5']) != (
+                stat.st_size, stat.st_mtime, expected):
+            LOG.info('Verify: %s' % (filename))
+            entry = state[filename] = {
+                'size': stat.st_size, 'mtime': stat.st_mtime,
+                'md5': expected, 'ok': md5sum(path) == expected}
+        results[filename] = entry['ok']
+
+    save_state(down_dir, state)
+    return results
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+# © Copyright 2009-2015 Wolodja Wentland. All Rights Reserved.
+
+# This file is part of wp-download.
+#
+# wp-download is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wp-download is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with wp-download. If not, see <http://www.gnu.org/licenses/>.
+
+"""Write-behind of downloaded data.
+
+The network side fills buffers from a bounded ring and hands them to a writer
+thread, which writes them to the local file and puts them back into the ring.
+Reading from the network therefore goes on at full speed while the disk is
+briefly slow, until all buffers are in flight.
+
+The fsync policy decides when data is forced to disk:
+
+``none``
+    Leave it to the operating system.
+``periodic``
+    Every ``fsync_interval`` bytes.
+``complete``
+    Once, when the file is complete and before it is renamed.
+"""
+
+import logging
+import os
+import queue
+import threading
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.DEBUG)
+
+FSYNC_POLICIES = ('none', 'periodic', 'complete')
+
+DEFAULT_BUFFERS = 8
+DEFAULT_BUFFER_SIZE = 256 * 1024
+DEFAULT_FSYNC_INTERVAL = 64 * 1024 * 1024
+
+
+def fsync_directory(path):
+    """Force the directory entries of the directory at path to disk
+
+    :param path:    Path of the directory
+    :type path:     string
+    """
+    try:
+        dir_fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        # Not supported by all file systems
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+class WriteBehind(object):
+    """
+    Writes buffers to a file in a background thread.
+    """
+
+    def __init__(self, file_obj, buffers=DEFAULT_BUFFERS,
+                 buffer_size=DEFAULT_BUFFER_SIZE, fsync='none',
+                 fsync_interval=DEFAULT_FSYNC_INTERVAL, digest=None):
+        """
+        Constructor.
+
+        :param file_obj:        File the data is written to
+        :type file_obj:         file
+
+        :param buffers:         Number of buffers in the ring
+        :type buffers:          int
+
+        :param buffer_size:     Size of each buffer in bytes
+        :type buffer_size:      int
+
+        :param fsync:           One of 'none', 'periodic' or 'complete'
+        :type fsync:            string
+
+        :param fsync_interval:  Bytes between two fsyncs of the periodic
+                                policy
+        :type fsync_interval:   int
+
+        :param digest:          Hash object, like hashlib.md5(), that is
+                                updated with the written data
+        :type digest:           object
+        """
+        assert fsync in FSYNC_POLICIES
+        self._file = file_obj
+        self._fsync = fsync
+        self._fsync_interval = fsync_interval
+        self._digest = digest
+        self._unsynced = 0
+        self._error = None
+        self.written = 0
+
+        self._free = queue.Queue()
+        for _ in range(max(1, buffers)):
+            self._free.put(bytearray(buffer_size))
+        self._filled = queue.Queue()
+
+        self._thread = threading.Thread(target=self._run, name='writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Do not hide the original exception
+            self._stop()
+
+    def _sync(self):
+        """Force written data to disk"""
+
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def _run(self):
+        """Write filled buffers until the sentinel arrives"""
+
+        while True:
+            item = self._filled.get()
+            if item is None:
+                return
+
+            buf, length = item
+            try:
+                if self._error is None:
+                    self._file.write(memoryview(buf)[:length])
+                    if self._digest is not None:
+                        self._digest.update(memoryview(buf)[:length])
+                    self.written += length
+                    self._unsynced += length
+                    if (self._fsync == 'periodic' and
+                            self._unsynced >= self._fsync_interval):
+                        self._sync()
+            except Exception as err:
+                # Buffers are still returned below, so that the reader
+                # does not starve and raises the error instead
+                self._error = err
+            finally:
+                self._free.put(buf)
+
+    def _check(self):
+        """Raise the error of the writer thread, if any"""
+
+        if self._error is not None:
+            raise self._error
+
+    def readinto(self, stream):
+        """Fill the next free buffer from stream and queue it for writing
+
+        Blocks while all buffers are in flight.
+
+        :param stream:  File-like object to read from
+        :type stream:   file
+
+        :raises IOError:    If writing failed. Other errors of the file are
+                            raised as well.
+
+        :returns:           Number of bytes read, 0 at the end of stream
+        :rtype:             int
+        """
+        self._check()
+        buf = self._free.get()
+        try:
+            if hasattr(stream, 'readinto'):
+                length = stream.readinto(buf)
+            else:
+                data = stream.read(len(buf))
+                length = len(data)
+                buf[:length] = data
+        except:
+            self._free.put(buf)
+            raise
+
+        if not length:
+            self._free.put(buf)
+            return 0
+        self._filled.put((buf, length))
+        return length
+
+    def _stop(self):
+        """Let the writer thread finish the queued buffers and stop"""
+
+        if self._thread.is_alive():
+            self._filled.put(None)
+            self._thread.join()
+
+    def close(self):
+        """Write all queued buffers and apply the fsync policy
+
+        The file itself is not closed.
+
+        :raises IOError:    If writing failed. Other errors of the file are
+                            raised as well.
+        """
+        self._stop()
+        self._check()
+        if self._fsync == 'complete' or (
+                self._fsync == 'periodic' and self._unsynced):
+            self._sync()
+        else:
+            self._file.flush()